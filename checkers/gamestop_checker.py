@@ -1,45 +1,358 @@
+import asyncio
+import contextlib
+import json
 import logging
-import re
-import aiohttp
-import requests
+import os
+import time
+from urllib.parse import urljoin, urlsplit
+
 from bs4 import BeautifulSoup
-from lxml.html import fromstring
+from checkers.parse_jobs import get_keyword_matcher, is_home_page, judge_page, parse_stock_markers
+from checkers.parsed_page import ParsedPage
+from checkers.stock_parsers import DOMAIN_STOCK_SELECTORS, LXML_BACKEND, PARSER_BACKENDS, StockMarkers, \
+    StreamingStockScanner, find_stock_markers, get_country, get_stock_selectors, is_backend_available
+from utils.domain_guard import DomainUnavailableError
+from utils.http_client import DEFAULT_HEADERS, HttpClient, HttpResponse, add_downloads_to_caller, count_downloads
+from utils.metrics import Metrics
+from utils.page_cache import CachedPage, PageCache, hash_page
+from utils.parse_executor import ParseExecutor
+from utils.profiler import Profiler
+from utils.result_history import SCRAPE_CHECK, SEARCH_CHECK, STOCK_CHECK, ResultHistory
+from utils.scrape_state import MATCHED, NO_MATCH, NOT_FOUND, REDIRECTED_HOME
 from utils.soup_utils import save_soup_to_file
 
 ALLOWED_SITES_URLS = ['https://www.gamestop.de', 'https://www.gamestop.it', 'https://www.gamestop.ie',
                       'https://www.gamestop.ch', 'https://www.gamestop.at']
 
 COULD_NOT_GET_GAMESTOP = 'Could not get Gamestop!'
+STOCK_VERDICT = 'stock'
+SEARCH_VERDICT = 'search'
 GS_HOME_TITLES = []
+HOME_TITLES_REFRESH_TASK = None
+HTTP_CLIENT = None
+# The HttpClient of the requests made while HTTP_CLIENT is not set, created by the first one for its event loop
+FALLBACK_HTTP_CLIENT = None
+FALLBACK_HTTP_CLIENT_LOOP = None
+PARSER_BACKEND = LXML_BACKEND
+STREAMING_STOCK_CHECK = False
+HEAD_PROBE = False
+# The paths that gamestop redirects the missing products to, lowercase and without the leading and trailing slashes
+HOME_PATHS = ('', 'home', 'home/index')
+PAGE_CACHE = None
+METRICS = None
+PROFILER = None
+PARSE_EXECUTOR = None
+RESULT_HISTORY = None
+NO_SPAN = contextlib.nullcontext()
+PAGE_FINGERPRINTS = {}
+CHANGED_PAGES = set()
 logger = logging.getLogger('gamestop_checker')
 
 
 def fill_home_titles():
-    for url in ALLOWED_SITES_URLS:
-        GS_HOME_TITLES.append(__get_home_page_title(url))
+    """
+    Blocking version of refresh_home_titles, to be used outside the event loop
+    :return: None
+    """
+    asyncio.run(refresh_home_titles())
+
+
+async def fill_home_titles_async(cache_path: str = None, ttl: float = 86400, timeout: float = 10) -> None:
+    """
+    Fills GS_HOME_TITLES from the given on-disk cache if it exists, so that a restart does not wait for the network,
+    otherwise it gets the titles of the home pages concurrently. Then, it keeps refreshing them in the background every
+    ttl seconds, starting right away if the cache is older than that
+    :param cache_path: the path to the json file that caches the titles. None to disable the cache
+    :param ttl: how many seconds the titles are considered fresh
+    :param timeout: the timeout in seconds for every home page
+    :return: None
+    """
+    global HOME_TITLES_REFRESH_TASK
+    cached_titles, age = __read_home_titles_cache(cache_path)
+    if cached_titles is None:
+        await refresh_home_titles(cache_path, timeout)
+        delay = ttl
+    else:
+        GS_HOME_TITLES[:] = cached_titles
+        delay = max(0.0, ttl - age)
+    stop_home_titles_refresh()
+    HOME_TITLES_REFRESH_TASK = asyncio.ensure_future(
+        __refresh_home_titles_periodically(cache_path, ttl, timeout, delay))
+
+
+def stop_home_titles_refresh() -> None:
+    """
+    Stops the background refresh of the home titles started by fill_home_titles_async
+    :return: None
+    """
+    global HOME_TITLES_REFRESH_TASK
+    if HOME_TITLES_REFRESH_TASK is not None:
+        HOME_TITLES_REFRESH_TASK.cancel()
+        HOME_TITLES_REFRESH_TASK = None
+
+
+async def refresh_home_titles(cache_path: str = None, timeout: float = 10) -> None:
+    """
+    Gets the titles of the home pages of all the ALLOWED_SITES_URLS concurrently, so that a slow domain does not delay
+    the others, and saves them in GS_HOME_TITLES and in the given cache. If a home page cannot be obtained, its
+    previous title is kept
+    :param cache_path: the path to the json file that caches the titles. None to disable the cache
+    :param timeout: the timeout in seconds for every home page
+    :return: None
+    """
+    titles = await asyncio.gather(*[__get_home_page_title(url, timeout) for url in ALLOWED_SITES_URLS])
+    previous_titles = list(GS_HOME_TITLES)
+    for index, title in enumerate(titles):
+        if title is None and index < len(previous_titles):
+            titles[index] = previous_titles[index]
+    GS_HOME_TITLES[:] = titles
+    if cache_path and any(title is not None for title in titles):
+        __write_home_titles_cache(cache_path, titles)
+
+
+def set_http_client(http_client: HttpClient) -> None:
+    """
+    Sets the HttpClient shared by all the checks, so that they reuse its pooled connections. If it is not set, the
+    checks share a fallback HttpClient with the default headers, which must be closed with close_fallback_http_client
+    :param http_client: the HttpClient to share. None to go back to the fallback one
+    :return: None
+    """
+    global HTTP_CLIENT
+    HTTP_CLIENT = http_client
+
+
+async def close_fallback_http_client() -> None:
+    """
+    Closes the fallback HttpClient used while no HttpClient is set, if it was created
+    :return: None
+    """
+    global FALLBACK_HTTP_CLIENT, FALLBACK_HTTP_CLIENT_LOOP
+    http_client = FALLBACK_HTTP_CLIENT
+    FALLBACK_HTTP_CLIENT = None
+    FALLBACK_HTTP_CLIENT_LOOP = None
+    if http_client is not None:
+        await http_client.close()
+
+
+def set_parser_backend(backend: str) -> None:
+    """
+    Sets the parser backend used by check_stock. lxml is the default, selectolax is faster but optional and
+    html.parser is the pure-Python BeautifulSoup parser. If the given backend cannot be used, lxml is used instead
+    :param backend: one of PARSER_BACKENDS
+    :return: None
+    """
+    global PARSER_BACKEND
+    if backend not in PARSER_BACKENDS:
+        raise ValueError('Unknown parser backend ' + str(backend) + '! The available ones are ' + str(PARSER_BACKENDS))
+    if not is_backend_available(backend):
+        logger.warning('Parser backend {} is not installed, using {} instead'.format(backend, LXML_BACKEND))
+        backend = LXML_BACKEND
+    PARSER_BACKEND = backend
+
+
+def set_streaming_stock_check(streaming_stock_check: bool) -> None:
+    """
+    Sets whether check_stock should scan the product page while downloading it, stopping as soon as the availability
+    is known, instead of downloading and parsing the whole page
+    :param streaming_stock_check: True to enable the streaming check
+    :return: None
+    """
+    global STREAMING_STOCK_CHECK
+    STREAMING_STOCK_CHECK = streaming_stock_check
+
+
+def set_metrics(metrics: Metrics) -> None:
+    """
+    Sets the Metrics that record the parse time and the errors of the checks
+    :param metrics: the Metrics. None to disable them
+    :return: None
+    """
+    global METRICS
+    METRICS = metrics
+
+
+def set_profiler(profiler: Profiler) -> None:
+    """
+    Sets the Profiler that measures every stage of the checks: fetch, parse, match and, for the searches, the
+    availability of the results
+    :param profiler: the Profiler. None to disable it
+    :return: None
+    """
+    global PROFILER
+    PROFILER = profiler
+
+
+def set_parse_executor(parse_executor: ParseExecutor) -> None:
+    """
+    Sets the ParseExecutor the fetched pages are parsed in, instead of on the event loop
+    :param parse_executor: the ParseExecutor. If None, the pages are parsed on the event loop
+    :return: None
+    """
+    global PARSE_EXECUTOR
+    PARSE_EXECUTOR = parse_executor
+
+
+def set_result_history(result_history: ResultHistory) -> None:
+    """
+    Sets the ResultHistory that records the result, the latency and the downloaded bytes of every stock, search and
+    scrape check
+    :param result_history: the ResultHistory. None to disable it
+    :return: None
+    """
+    global RESULT_HISTORY
+    RESULT_HISTORY = result_history
+
+
+def set_head_probe(head_probe: bool) -> None:
+    """
+    Sets whether scrape_product should first send a HEAD request, which does not download the page, to find out if
+    the product redirects to the home page
+    :param head_probe: True to enable the probe
+    :return: None
+    """
+    global HEAD_PROBE
+    HEAD_PROBE = head_probe
+
+
+def set_page_cache(page_cache: PageCache) -> None:
+    """
+    Sets the PageCache used by check_stock and check_search to skip the parsing of the pages that did not change since
+    the last check, reusing the previous verdict. The streaming stock check, when enabled, does not use it
+    :param page_cache: the PageCache. None to disable it
+    :return: None
+    """
+    global PAGE_CACHE
+    PAGE_CACHE = page_cache
 
 
-async def check_if_page_contains_keywords(url: str, keywords: list = None, check_all_keywords: bool = False) -> bool:
+def page_changed(url: str) -> bool:
+    """
+    Tells whether the last check of the given url found that the page changed since the check before: a different
+    content or availability for a product page, a different number of results or different results for a search page
+    :param url: the url
+    :return: True if the page changed, False if it did not or if it was checked less than twice
+    """
+    return url in CHANGED_PAGES
+
+
+async def check_if_page_contains_keywords(url: str, keywords: list = None,
+                                          check_all_keywords: bool = False) -> ParsedPage:
     """
     Checks if the page obtained after requesting the given url contains the given keywords
     :param url: the url
     :param keywords: the list of keywords
     :param check_all_keywords: if True, the return will be True only if all the keywords are present in the html page, otherwise one keyword will be enough
-    :return: True if one or more keywords are found, depending on the check_all_keywords flag
+    :return: the ParsedPage of the page if one or more keywords are found, depending on the check_all_keywords flag,
+    None otherwise
+    :raises Exception: the error that prevented the page from being obtained
+    """
+    _, page = await scrape_product(url, keywords, check_all_keywords, raise_fetch_errors=True)
+    return page
+
+
+async def scrape_product(url: str, keywords: list = None, check_all_keywords: bool = False,
+                         raise_fetch_errors: bool = False) -> tuple:
+    """
+    Scrapes the product page of the given url, telling what was found, like check_if_page_contains_keywords
+    :param url: the url
+    :param keywords: the list of keywords
+    :param check_all_keywords: if True, the product matches only if all the keywords are present in the html page,
+    otherwise one keyword will be enough
+    :param raise_fetch_errors: if True, the error that prevented the page from being obtained is raised instead of
+    returning NOT_FOUND
+    :return: a tuple with the status, one of NOT_FOUND, REDIRECTED_HOME, NO_MATCH and MATCHED of
+    utils.scrape_state, and the ParsedPage of the page if it matched, None otherwise
+    :raises DomainUnavailableError: if the domain of the url is paused, so that the caller can wait instead of
+    moving on
     """
     if keywords is None:
         keywords = []
 
     allowed_domains = ['at', 'ch', 'de', 'it', 'ie']
     __check_if_domain_is_allowed(allowed_domains, url)
+    measure = __start_result()
+
+    if HEAD_PROBE:
+        with __span('scrape.probe'):
+            status = await probe_product(url)
+        if status is not None:
+            logger.info('It redirected to the home page when probing url {}'.format(url))
+            __record_result(SCRAPE_CHECK, url, measure, status=status)
+            return status, None
 
     try:
-        text = await __get(url)
-    except Exception:
+        with __span('scrape.fetch'):
+            response = await __get_response(url, skip_redirect_body=is_home_page_url)
+    except DomainUnavailableError:
+        raise
+    except Exception as exception:
+        __record_error(exception)
         logger.error(COULD_NOT_GET_GAMESTOP)
-        return False
+        __record_result(SCRAPE_CHECK, url, measure, status=NOT_FOUND)
+        if raise_fetch_errors:
+            raise
+        return NOT_FOUND, None
+    # The redirect to the home page is found from the final url, without downloading and parsing the home page
+    if response.url != url and is_home_page_url(response.url):
+        logger.info('It redirected to the home page when checking url {}'.format(url))
+        __record_result(SCRAPE_CHECK, url, measure, status=REDIRECTED_HOME)
+        return REDIRECTED_HOME, None
+
+    start = time.perf_counter()
+    if PARSE_EXECUTOR is not None:
+        with __span('scrape.offload'):
+            verdict = await PARSE_EXECUTOR.run(judge_page, response.text, url, tuple(keywords), check_all_keywords,
+                                               tuple(GS_HOME_TITLES))
+        home_page = verdict.home_page
+        found = not home_page and __keywords_matched(verdict.found_keywords, url, keywords, check_all_keywords)
+        # The page is parsed again, lazily, only if the caller needs it, which is rare
+        page = ParsedPage(response.text, url)
+    else:
+        with __span('scrape.parse'):
+            page = ParsedPage(response.text, url)
+            # The tree is built lazily, so it's built here to be measured apart from the matching
+            page.tree
+        with __span('scrape.match'):
+            # Without a redirect, e.g. when the home page is served at the product url, the title tells it
+            home_page = not __is_not_home_page(page, url)
+            found = not home_page and __match_keywords(page, url, keywords, check_all_keywords)
+    if home_page:
+        logger.info('It redirected to the home page when checking url {}'.format(url))
+        status = REDIRECTED_HOME
+    elif found:
+        status = MATCHED
+    else:
+        status = NO_MATCH
+    __record_parse_time('scrape', start)
+    __record_result(SCRAPE_CHECK, url, measure, status=status)
+    return status, page if status == MATCHED else None
+
+
+async def probe_product(url: str) -> str:
+    """
+    Sends a HEAD request to the given product url, without following the redirects, to find out whether the product
+    redirects to the home page without downloading any page
+    :param url: the url
+    :return: REDIRECTED_HOME if it redirects to the home page, None if the page has to be downloaded to know
+    """
+    try:
+        response = await __head(url)
+    except Exception as exception:
+        __record_error(exception)
+        logger.debug('Could not probe {}'.format(url))
+        return None
+    location = response.headers.get('Location')
+    if 300 <= response.status < 400 and location and is_home_page_url(urljoin(url, location)):
+        return REDIRECTED_HOME
+    return None
+
 
-    __check_keywords_from_text(html_text=text, url=url, keywords=keywords, check_all_keywords=check_all_keywords)
+def is_home_page_url(url: str) -> bool:
+    """
+    :param url: a gamestop url
+    :return: True if it's the url of a home page
+    """
+    return urlsplit(url).path.strip('/').lower() in HOME_PATHS
 
 
 async def check_stock(url: str) -> bool:
@@ -49,20 +362,106 @@ async def check_stock(url: str) -> bool:
     :param url: the url
     :return: True if available, false if not or unknown
     :rtype: boolean
+    :raises DomainUnavailableError: if the domain of the url is paused
     """
     allowed_domains = ['at', 'ch', 'de', 'it', 'ie']
     __check_if_domain_is_allowed(allowed_domains, url)
+    measure = __start_result()
+    # The streaming scan looks for the default markers only
+    if STREAMING_STOCK_CHECK and get_country(url) not in DOMAIN_STOCK_SELECTORS:
+        try:
+            with __span('stock.stream'):
+                stock_markers = await __get_stock_markers_streaming(url)
+        except DomainUnavailableError:
+            raise
+        except Exception as exception:
+            __record_error(exception)
+            logger.error(COULD_NOT_GET_GAMESTOP)
+            __record_result(STOCK_CHECK, url, measure)
+            return False
+        __record_fingerprint(url, (stock_markers.check_box_two, stock_markers.data_available, stock_markers.radio_add))
+        available = check_stock_from_markers(stock_markers, url)
+        __record_result(STOCK_CHECK, url, measure, available=available)
+        return available
+
+    cached_page = None
     try:
-        text = await __get(url)
-    except Exception:
+        with __span('stock.fetch'):
+            if PAGE_CACHE is not None:
+                text, cached_page = await __get_if_changed(url, STOCK_VERDICT)
+            else:
+                text = await __get(url)
+        if cached_page is not None and text is None:
+            logger.info('Product {} did not change since the last check'.format(url))
+            __record_fingerprint(url, cached_page.content_hash)
+            __record_result(STOCK_CHECK, url, measure, available=cached_page.verdicts[STOCK_VERDICT])
+            return cached_page.verdicts[STOCK_VERDICT]
+    except DomainUnavailableError:
+        raise
+    except Exception as exception:
+        __record_error(exception)
         logger.error(COULD_NOT_GET_GAMESTOP)
+        __record_result(STOCK_CHECK, url, measure)
         return False
 
-    return check_stock_from_soup(BeautifulSoup(text, 'html.parser'), url)
+    __record_fingerprint(url, cached_page.content_hash if cached_page is not None else hash_page(text))
+    start = time.perf_counter()
+    if PARSE_EXECUTOR is not None:
+        with __span('stock.offload'):
+            available = await __check_stock_offloaded(text, url)
+    else:
+        with __span('stock.parse'):
+            available = __check_stock_from_text(text, url)
+    __record_parse_time('stock', start)
+    if cached_page is not None and available is not None:
+        cached_page.verdicts[STOCK_VERDICT] = available
+    __record_result(STOCK_CHECK, url, measure, available=available)
+    return available
+
+
+def product_urls(product_path: str, countries: list = None) -> dict:
+    """
+    Maps a product to its url on every gamestop domain, since the same product has the same path everywhere
+    :param product_path: the path of the product after the domain, e.g. 'PS5/Games/134750'
+    :param countries: the country codes of the domains, e.g. ['it', 'de']. All the ALLOWED_SITES_URLS if not provided
+    :return: the dict from the country code to the url of the product, in the order of ALLOWED_SITES_URLS
+    """
+    urls = {}
+    for site_url in ALLOWED_SITES_URLS:
+        country = get_country(site_url)
+        if countries is None or country in countries:
+            urls[country] = site_url + '/' + product_path.strip('/')
+    return urls
+
+
+async def check_stock_everywhere(product_path: str, countries: list = None) -> dict:
+    """
+    Checks whether a product is in stock on every gamestop domain at the same time, so that it takes as long as the
+    slowest domain instead of the sum of all of them
+    :param product_path: the path of the product after the domain, e.g. 'PS5/Games/134750'
+    :param countries: the country codes of the domains to check. All the ALLOWED_SITES_URLS if not provided
+    :return: the dict from the country code to True if available there, False if not or unknown, None if the domain
+    is paused
+    """
+    urls = product_urls(product_path, countries)
+    results = await asyncio.gather(*[check_stock(url) for url in urls.values()], return_exceptions=True)
+    availability = {}
+    for (country, url), result in zip(urls.items(), results):
+        if isinstance(result, DomainUnavailableError):
+            logger.info('Could not check {}: {}'.format(url, result))
+            availability[country] = None
+        elif isinstance(result, Exception):
+            logger.error('Error while checking {}: {}'.format(url, result))
+            availability[country] = False
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            availability[country] = result
+    return availability
 
 
 async def check_search(url: str, results: int = 0, check_availability: bool = False, keywords: list = None,
-                       check_all_keywords: bool = False) -> bool:
+                       check_all_keywords: bool = False, max_concurrent_checks: int = 4) -> bool:
     """
     Given a gamestop search URL, it checks whether it finds a product with the input keyword or if the number of
     results changed
@@ -72,35 +471,110 @@ async def check_search(url: str, results: int = 0, check_availability: bool = Fa
     :param results: how many results are normal. Any variation of the results will be notified
     :param keywords: the keywords to look for in the search
     :param check_all_keywords: if True, the check will be successful only if all the keywords are present
+    :param max_concurrent_checks: how many results are checked for availability at the same time
     :return: True if the search was successful
+    :raises DomainUnavailableError: if the domain of the url is paused
     """
     if keywords is None:
         keywords = []
     allowed_domains = ['at', 'ch', 'de', 'it', 'ie']
     __check_if_domain_is_allowed(allowed_domains, url)
+    measure = __start_result()
+    # The availability of the results can change even if the search page does not, so that verdict is never reused
+    verdict_key = None if check_availability else (SEARCH_VERDICT, results, tuple(keywords), check_all_keywords)
+    cached_page = None
     try:
-        text = await __get(url)
-    except Exception:
+        with __span('search.fetch'):
+            if PAGE_CACHE is not None and verdict_key is not None:
+                text, cached_page = await __get_if_changed(url, verdict_key)
+            else:
+                text = await __get(url)
+        if cached_page is not None and text is None:
+            logger.info('Search {} did not change since the last check'.format(url))
+            # The fingerprint of a search page starts with its number of results
+            fingerprint = PAGE_FINGERPRINTS.get(url)
+            CHANGED_PAGES.discard(url)
+            __record_result(SEARCH_CHECK, url, measure, available=cached_page.verdicts[verdict_key],
+                            result_count=__parse_result_count(fingerprint[0]) if fingerprint else None)
+            return cached_page.verdicts[verdict_key]
+    except DomainUnavailableError:
+        raise
+    except Exception as exception:
+        __record_error(exception)
         logger.error('Could not get gamestop!')
+        __record_result(SEARCH_CHECK, url, measure)
         return False
     return_value = None
+    page = None
     try:
-        soup = BeautifulSoup(text, 'html.parser')
-        return_value = __check_keywords_from_text(html_text=text, url=url, keywords=keywords,
-                                                  check_all_keywords=check_all_keywords)
+        start = time.perf_counter()
+        if PARSE_EXECUTOR is not None:
+            with __span('search.offload'):
+                page = await PARSE_EXECUTOR.run(judge_page, text, url, tuple(keywords), check_all_keywords,
+                                                tuple(GS_HOME_TITLES), True)
+            __record_fingerprint(url, (page.search_sum_count, page.search_result_links))
+            if page.home_page:
+                logger.info('It redirected to the home page when checking url {}'.format(url))
+            return_value = not page.home_page and __keywords_matched(page.found_keywords, url, keywords,
+                                                                     check_all_keywords)
+        else:
+            with __span('search.parse'):
+                page = ParsedPage(text, url)
+                __record_fingerprint(url, (page.search_sum_count, tuple(page.search_result_links)))
+            with __span('search.match'):
+                return_value = __check_keywords_from_text(page=page, url=url, keywords=keywords,
+                                                          check_all_keywords=check_all_keywords) is not None
         search_sum_count = None
         if not return_value:
-            search_sum_count = soup.find('strong', {'class': 'searchSumCount'})
+            search_sum_count = page.search_sum_count
             return_value = __handle_sum_count(search_sum_count, results, url)
+        __record_parse_time('search', start)
         if return_value and check_availability and search_sum_count is not None:
-            return_value = __handle_check_multiple_stock(soup, int(search_sum_count.text), url)
+            with __span('search.availability'):
+                return_value = await __handle_check_multiple_stock(page, int(search_sum_count), url,
+                                                                   max_concurrent_checks)
         if return_value is False:
             logger.info("No good results from search {}".format(url))
+        if cached_page is not None:
+            cached_page.verdicts[verdict_key] = return_value
     except Exception as exception:
+        __record_error(exception)
         logger.exception("Exception while checking for search!", exception)
+    __record_result(SEARCH_CHECK, url, measure, available=return_value,
+                    result_count=__parse_result_count(page.search_sum_count) if page is not None else None)
     return return_value
 
 
+def check_stock_from_page(page: ParsedPage, url: str) -> bool:
+    """
+    Checks whether the product of the given ParsedPage is in stock
+    :param page: the ParsedPage of the product page
+    :param url: the url, used simply for logging
+    :return: True if in stock, false if not or unknown
+    """
+    try:
+        return check_stock_from_markers(page.stock_markers, url)
+    except Exception:
+        msg = 'Unknown error occurred'
+        save_soup_to_file(page.html_text)
+        logger.error(msg)
+
+
+def check_stock_from_markers(stock_markers: StockMarkers, url: str) -> bool:
+    """
+    Checks whether the product with the given StockMarkers is in stock
+    :param stock_markers: the StockMarkers found in the product page
+    :param url: the url, used simply for logging
+    :return: True if in stock, false if not or unknown
+    """
+    if stock_markers.is_available():
+        logger.info('Product {} available!'.format(url))
+        return True
+    else:
+        logger.info('Product {} not available'.format(url))
+        return False
+
+
 def check_stock_from_soup(soup: BeautifulSoup, url: str) -> bool:
     """
     Checks whether the product of the given BeautifulSoup is in stock
@@ -128,21 +602,209 @@ def check_stock_from_soup(soup: BeautifulSoup, url: str) -> bool:
         logger.error(msg)
 
 
+def __check_stock_from_text(text: str, url: str) -> bool:
+    """
+    Checks whether the product of the given page is in stock with the configured parser backend
+    :param text: the html page
+    :param url: the url
+    :return: True if in stock, false if not or unknown
+    """
+    if PARSER_BACKEND == LXML_BACKEND or get_country(url) in DOMAIN_STOCK_SELECTORS:
+        return check_stock_from_page(ParsedPage(text, url), url)
+    try:
+        return check_stock_from_markers(find_stock_markers(text, PARSER_BACKEND), url)
+    except Exception:
+        save_soup_to_file(text)
+        logger.error('Unknown error occurred')
+        return False
+
+
+async def __check_stock_offloaded(text: str, url: str) -> bool:
+    """
+    Checks whether the product of the given page is in stock, parsing the page in the ParseExecutor
+    :param text: the html page
+    :param url: the url
+    :return: True if in stock, false if not or unknown
+    """
+    try:
+        backend = PARSER_BACKEND if get_country(url) not in DOMAIN_STOCK_SELECTORS else LXML_BACKEND
+        stock_markers = await PARSE_EXECUTOR.run(parse_stock_markers, text, backend, get_stock_selectors(url))
+        return check_stock_from_markers(stock_markers, url)
+    except Exception as exception:
+        __record_error(exception)
+        save_soup_to_file(text)
+        logger.error('Unknown error occurred')
+        return False
+
+
 async def __get(url: str) -> str:
     """
     Asynchronously gets the html page given a URL
     :param url: the URL to get
     :return: the html page
     """
-    async with aiohttp.ClientSession(headers=__get_headers()) as session:
-        async with session.get(url) as r:
-            return await r.text()
+    return await __get_http_client().get_text(url)
+
+
+async def __get_response(url: str, headers: dict = None, skip_redirect_body=None) -> HttpResponse:
+    """
+    Asynchronously gets the response given a URL
+    :param url: the URL to get
+    :param headers: the additional headers to send
+    :param skip_redirect_body: see HttpClient.get_response
+    :return: the HttpResponse
+    """
+    return await __get_http_client().get_response(url, headers, skip_redirect_body)
+
+
+async def __head(url: str) -> HttpResponse:
+    """
+    Asynchronously sends a HEAD request to the given URL, without following the redirects
+    :param url: the URL
+    :return: the HttpResponse
+    """
+    return await __get_http_client().head(url)
+
+
+def __get_http_client() -> HttpClient:
+    """
+    :return: the shared HTTP_CLIENT or, if it is not set, the fallback HttpClient of the running event loop, created
+    the first time it's needed. The sessions of a fallback HttpClient of a previous event loop cannot be used anymore
+    """
+    global FALLBACK_HTTP_CLIENT, FALLBACK_HTTP_CLIENT_LOOP
+    if HTTP_CLIENT is not None:
+        return HTTP_CLIENT
+    loop = asyncio.get_running_loop()
+    if FALLBACK_HTTP_CLIENT is None or FALLBACK_HTTP_CLIENT_LOOP is not loop:
+        FALLBACK_HTTP_CLIENT = HttpClient(headers=__get_headers())
+        FALLBACK_HTTP_CLIENT_LOOP = loop
+    return FALLBACK_HTTP_CLIENT
+
+
+async def __get_if_changed(url: str, verdict_key) -> tuple:
+    """
+    Asynchronously gets the html page given a URL, unless it did not change since the last time the verdict with the
+    given key was given on it. The page is considered unchanged if the server answers 304 Not Modified to the
+    conditional request or if the hash of its relevant section is the same as before
+    :param url: the URL to get
+    :param verdict_key: the key of the verdict in CachedPage.verdicts that would be reused
+    :return: a tuple with the html page, or None if it did not change, and its CachedPage
+    """
+    cached_page = PAGE_CACHE.get(url)
+    if cached_page is not None and verdict_key not in cached_page.verdicts:
+        cached_page = None
+    headers = cached_page.get_conditional_headers() if cached_page is not None else None
+    response = await __get_response(url, headers)
+    if response.status == 304 and cached_page is not None:
+        PAGE_CACHE.record_hit()
+        return None, cached_page
+
+    content_hash = hash_page(response.text)
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if cached_page is not None and cached_page.content_hash == content_hash:
+        PAGE_CACHE.record_hit()
+        cached_page.etag = etag
+        cached_page.last_modified = last_modified
+        return None, cached_page
+
+    PAGE_CACHE.record_miss()
+    cached_page = CachedPage(etag=etag, last_modified=last_modified, content_hash=content_hash)
+    PAGE_CACHE.put(url, cached_page)
+    return response.text, cached_page
+
+
+async def __get_stock_markers_streaming(url: str) -> StockMarkers:
+    """
+    Asynchronously gets the product page of the given URL, reading it only until its stock markers are found
+    :param url: the URL to get
+    :return: the StockMarkers of the page
+    """
+    scanner = StreamingStockScanner()
+    stock_markers = await __get_http_client().read_until(url, scanner.feed)
+    return stock_markers if stock_markers is not None else scanner.close()
+
+
+def __record_fingerprint(url: str, fingerprint) -> None:
+    """
+    Records what identifies the current state of the page of the given url, remembering whether it changed since the
+    previous check. See page_changed
+    :param url: the url
+    :param fingerprint: anything that is equal for two checks of the page if and only if the page did not change
+    :return: None
+    """
+    changed = url in PAGE_FINGERPRINTS and PAGE_FINGERPRINTS[url] != fingerprint
+    PAGE_FINGERPRINTS[url] = fingerprint
+    if changed:
+        CHANGED_PAGES.add(url)
+    else:
+        CHANGED_PAGES.discard(url)
+
+
+def __span(stage: str):
+    """
+    :param stage: the name of the stage, e.g. 'stock.fetch'
+    :return: the context manager that measures the given stage, doing nothing if the profiler is disabled
+    """
+    return PROFILER.span(stage) if PROFILER is not None else NO_SPAN
+
+
+def __record_error(exception: Exception) -> None:
+    if METRICS is not None:
+        METRICS.record_error(exception)
+
+
+def __record_parse_time(check: str, start: float) -> None:
+    """
+    Records in the metrics, if enabled, the time spent parsing a page for the given kind of check
+    :param check: the kind of check, e.g. 'stock'
+    :param start: the value of time.perf_counter when the parsing started
+    :return: None
+    """
+    if METRICS is not None:
+        METRICS.parse_seconds.observe(time.perf_counter() - start, check)
+
+
+def __start_result():
+    """
+    :return: what __record_result needs to measure the check that starts now, or None if the result history is
+    disabled
+    """
+    if RESULT_HISTORY is None:
+        return None
+    return time.perf_counter(), count_downloads()
+
+
+def __record_result(kind: str, url: str, measure, available: bool = None, result_count: int = None,
+                    status: str = None) -> None:
+    """
+    Records the result of a check in the result history, if enabled, with its latency and downloaded bytes. Both
+    include the product pages checked by a search
+    :param kind: one of utils.result_history.CHECK_KINDS
+    :param url: the url of the check
+    :param measure: what __start_result returned when the check started
+    :param available: whether the product or the search was found, None if unknown
+    :param result_count: the number of results of a search, None if unknown
+    :param status: the status of a scrape
+    :return: None
+    """
+    if RESULT_HISTORY is None or measure is None:
+        return
+    start, downloads = measure
+    RESULT_HISTORY.record(kind, url, available=available, result_count=result_count, status=status,
+                          latency=time.perf_counter() - start, downloaded_bytes=downloads.bytes)
+
+
+def __parse_result_count(search_sum_count: str) -> int:
+    """
+    :param search_sum_count: the text that contains the number of results of a search page
+    :return: the number of results, or None if unknown
+    """
+    return int(search_sum_count) if search_sum_count and search_sum_count.strip().isdigit() else None
 
 
 def __get_headers() -> dict:
-    return {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0',
-    }
+    return dict(DEFAULT_HEADERS)
 
 
 def __check_if_domain_is_allowed(allowed_domains: list, url: str) -> None:
@@ -168,58 +830,69 @@ def __get_domain(url: str) -> str:
     return url.split('gamestop.')[1][:2]
 
 
-def __check_keywords_from_text(html_text: str, url: str, keywords: list, check_all_keywords: bool = False):
+def __check_keywords_from_text(page: ParsedPage, url: str, keywords: list, check_all_keywords: bool = False):
     """
-    Checks whether a set of keywords is present in the given text of a html page
-    :param html_text: the html text page
+    Checks whether a set of keywords is present in the text of the given html page
+    :param page: the ParsedPage of the html page
     :param url: the url
     :param keywords: the keywords to check for
     :param check_all_keywords: if True, the search will be successful only if all keywords are found. Otherwise, it will be successful even if only one of the keywords is found
-    :return: True if found, false if not or unknown
+    :return: the given ParsedPage if found, None if not or unknown
     """
-    soup = None
     found = False
-    if __is_not_home_page(html_text, url):
-        soup = BeautifulSoup(html_text, 'html.parser')
-        for keyword in keywords:
-            found_keyword = soup.body.findAll(text=re.compile(keyword, re.IGNORECASE))
-            if found_keyword:
-                logger.info('Keyword {} found in url {}'.format(keyword, url))
-                found = True
-                if check_all_keywords is False:
-                    break
-            else:
-                logger.info('Keyword {} not found in url {}'.format(keyword, url))
-                found = False
+    if __is_not_home_page(page, url):
+        found = __match_keywords(page, url, keywords, check_all_keywords)
     else:
         logger.info('It redirected to the home page when checking url {}'.format(url))
 
     if found:
-        return soup
+        return page
     else:
         return None
 
 
-def __is_not_home_page(html_text: str, url: str) -> bool:
+def __match_keywords(page: ParsedPage, url: str, keywords: list, check_all_keywords: bool = False) -> bool:
+    """
+    Checks whether a set of keywords is present in the body text of the given page
+    :param page: the ParsedPage of the html page
+    :param url: the url, used simply for logging
+    :param keywords: the keywords to check for
+    :param check_all_keywords: if True, all the keywords must be found. Otherwise, one is enough
+    :return: True if found
+    """
+    found_keywords = get_keyword_matcher(tuple(keywords)).find(page.body_text, find_all=check_all_keywords)
+    return __keywords_matched(found_keywords, url, keywords, check_all_keywords)
+
+
+def __keywords_matched(found_keywords, url: str, keywords: list, check_all_keywords: bool = False) -> bool:
+    """
+    Tells whether the given keywords found in a page are enough for the page to match
+    :param found_keywords: the keywords found in the body text of the page
+    :param url: the url, used simply for logging
+    :param keywords: the keywords that were looked for
+    :param check_all_keywords: if True, all the keywords must be found. Otherwise, one is enough
+    :return: True if found
+    """
+    for keyword in keywords:
+        if keyword in found_keywords:
+            logger.info('Keyword {} found in url {}'.format(keyword, url))
+        elif check_all_keywords or not found_keywords:
+            logger.info('Keyword {} not found in url {}'.format(keyword, url))
+    if check_all_keywords:
+        return len(keywords) > 0 and len(found_keywords) == len(get_keyword_matcher(tuple(keywords)).keywords)
+    return len(found_keywords) > 0
+
+
+def __is_not_home_page(page: ParsedPage, url: str) -> bool:
     """
     Checks whether the given html page from the given url is not a home page of Gamestop.it. It does not directly
     compare the given html page with a home page url, but it understands whether it's a home page or not from
     the title and the content of the html page
-    :param html_text: the html page
+    :param page: the ParsedPage of the html page
     :param url: the url
     :return: True if not the home page, False if the check failed
     """
-    is_not_home_page = False
-    if 'SearchResult' in url:
-        quick_search_str = url.split('SearchResult/')[1].replace('+', '%20')
-        if quick_search_str in html_text:
-            is_not_home_page = True
-    else:
-        tree = fromstring(html_text)
-        title = tree.findtext('.//title')
-        is_not_home_page = title not in GS_HOME_TITLES
-
-    return is_not_home_page
+    return not is_home_page(page, url, GS_HOME_TITLES)
 
 
 def __is_available(check_box_two_id) -> bool:
@@ -229,7 +902,7 @@ def __is_available(check_box_two_id) -> bool:
     :return: True if the product is available, False if not available or unknown
     """
     try:
-        available = check_box_two_id['data-available']
+        available = check_box_two_id.get('data-available')
         if available.lower() == 'true':
             return True
         else:
@@ -238,43 +911,103 @@ def __is_available(check_box_two_id) -> bool:
         return False
 
 
-def __get_home_page_title(url: str):
+async def __get_home_page_title(url: str, timeout: float = 10) -> str:
+    """
+    Asynchronously gets the title of the given home page
+    :param url: the url of the home page
+    :param timeout: the timeout in seconds
+    :return: the title, or None if the home page could not be obtained in time
+    """
     try:
-        text = requests.get(url).text
+        text = await asyncio.wait_for(__get(url), timeout)
     except Exception:
-        logger.exception('Could not get gamestop!')
+        logger.exception('Could not get gamestop home page {}!'.format(url))
         return None
-    tree = fromstring(text)
-    title = tree.findtext('.//title')
-    return title
+    return ParsedPage(text, url).title
+
+
+async def __refresh_home_titles_periodically(cache_path: str, ttl: float, timeout: float, delay: float) -> None:
+    while True:
+        await asyncio.sleep(delay)
+        try:
+            await refresh_home_titles(cache_path, timeout)
+        except Exception:
+            logger.exception('Could not refresh the home titles')
+        delay = ttl
 
 
-async def __handle_check_multiple_stock(soup: BeautifulSoup, results: int, url: str) -> bool:
+def __read_home_titles_cache(cache_path: str) -> tuple:
     """
-    Utility function to check if at least one of the products from the given soup of a search page is in stock
-    :param soup: the BeautifulSoup of the given page
+    Reads the home titles cached in the given json file
+    :param cache_path: the path to the json file. Can be None
+    :return: a tuple with the list of titles, in the order of ALLOWED_SITES_URLS, and their age in seconds. The list
+    is None if there is no valid cache
+    """
+    if not cache_path or not os.path.exists(cache_path):
+        return None, None
+    try:
+        with open(cache_path, encoding='utf-8') as f:
+            cache = json.load(f)
+        titles = [cache['titles'].get(url) for url in ALLOWED_SITES_URLS]
+        return titles, time.time() - float(cache['timestamp'])
+    except Exception:
+        logger.exception('Could not read the home titles cache {}'.format(cache_path))
+        return None, None
+
+
+def __write_home_titles_cache(cache_path: str, titles: list) -> None:
+    try:
+        with open(cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': time.time(), 'titles': dict(zip(ALLOWED_SITES_URLS, titles))}, f)
+    except Exception:
+        logger.exception('Could not write the home titles cache {}'.format(cache_path))
+
+
+async def __handle_check_multiple_stock(page, results: int, url: str,
+                                        max_concurrent_checks: int = 4) -> bool:
+    """
+    Utility function to check if at least one of the products from the given search page is in stock. The products
+    are checked concurrently and, as soon as one of them is in stock, the checks still running are cancelled
+    :param page: the ParsedPage, or the PageVerdict, of the given page
     :param results: the number of results
     :param url: the url
+    :param max_concurrent_checks: how many products are checked at the same time
     :return: true if at least one is in stock, false otherwise
     """
+    base_url = 'https://www.gamestop.' + __get_domain(url)
+    links = [base_url + href for href in page.search_result_links[:results]]
+    semaphore = asyncio.Semaphore(max(1, max_concurrent_checks))
+
+    async def check_stock_with_semaphore(link: str) -> bool:
+        async with semaphore:
+            # The bytes of the product pages are part of the downloads of the search
+            return await add_downloads_to_caller(check_stock(link))
+
+    tasks = [asyncio.ensure_future(check_stock_with_semaphore(link)) for link in links]
     return_value = False
-    for i in range(1, results + 1):
-        search_product_div = soup.find("div", {"id": "product_" + str(i)})
-        links = search_product_div.findAll("a")
-        href = links[0]['href']
-        link = 'https://www.gamestop.' + __get_domain(url) + str(href)
-        return_value = await check_stock(link)
-        if i == results and return_value is False:
-            logger.info("Stocks from search are all unavailable!")
-        if return_value:
-            break
+    try:
+        for task in asyncio.as_completed(tasks):
+            try:
+                return_value = await task
+            except Exception:
+                logger.exception('Error occurred while checking the stock of a search result')
+                return_value = False
+            if return_value:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Waits for the cancelled checks to stop, so that none of them outlives the search
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if return_value is False:
+        logger.info("Stocks from search are all unavailable!")
     return return_value
 
 
-def __handle_sum_count(search_sum_count, expected_results: int, url: str) -> bool:
+def __handle_sum_count(search_sum_count: str, expected_results: int, url: str) -> bool:
     """
-    Checks whether the given PageElement that contains the number of results is different from the number of expected results and handles
-    :param search_sum_count: the PageElement that contains the number of results
+    Checks whether the given number of results is different from the number of expected results and handles
+    :param search_sum_count: the text that contains the number of results
     :param expected_results: the expected number of results
     :param url: the url
     :return: True if the actual and expected results are different, False otherwise
@@ -282,9 +1015,9 @@ def __handle_sum_count(search_sum_count, expected_results: int, url: str) -> boo
     return_value = False
     if search_sum_count and expected_results is not None:
         try:
-            if search_sum_count.text != str(expected_results):
+            if search_sum_count != str(expected_results):
                 logger.info('Expected results are ' + str(
-                    expected_results) + ', but ' + search_sum_count.text + ' results were found in url {}!'.format(
+                    expected_results) + ', but ' + search_sum_count + ' results were found in url {}!'.format(
                     url))
                 return_value = True
             else:
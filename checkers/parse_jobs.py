@@ -0,0 +1,96 @@
+import functools
+
+from checkers.parsed_page import ParsedPage
+from checkers.stock_parsers import LXML_BACKEND, StockMarkers, StockSelectors, find_stock_markers
+from utils.keyword_matcher import KeywordMatcher
+
+# The parsing jobs that can run in the worker processes of a utils.parse_executor.ParseExecutor. They take the html
+# page and everything else they need as arguments, since the globals of the checker are not set in the workers, and
+# return small results, instead of the parsed page, so that little has to be pickled back
+
+
+class PageVerdict:
+    """
+    What was found in a product or search page, without the page itself
+    """
+
+    def __init__(self, home_page: bool, found_keywords: tuple, search_sum_count: str = None,
+                 search_result_links: tuple = ()):
+        """
+        :param home_page: True if the page is the home page of Gamestop
+        :param found_keywords: the keywords found in the body text of the page
+        :param search_sum_count: the number of results of a search page, as text
+        :param search_result_links: the links of the results of a search page
+        """
+        self.home_page = home_page
+        self.found_keywords = found_keywords
+        self.search_sum_count = search_sum_count
+        self.search_result_links = search_result_links
+
+
+def parse_stock_markers(html_text: str, backend: str = LXML_BACKEND,
+                        stock_selectors: StockSelectors = None) -> StockMarkers:
+    """
+    :param html_text: the html of a product page
+    :param backend: the parser backend, one of checkers.stock_parsers.PARSER_BACKENDS
+    :param stock_selectors: the StockSelectors of the domain of the page, since the ones set in the checker are not
+    set in the workers. The default ones if not provided
+    :return: the StockMarkers of the page
+    """
+    return find_stock_markers(html_text, backend, stock_selectors)
+
+
+def judge_page(html_text: str, url: str, keywords: tuple, check_all_keywords: bool, home_titles: tuple,
+               search_results: bool = False) -> PageVerdict:
+    """
+    Parses the given page, telling whether it's the home page and which of the given keywords it contains
+    :param html_text: the html page
+    :param url: the url of the page
+    :param keywords: the tuple of the keywords to look for
+    :param check_all_keywords: if True, all the keywords are looked for. Otherwise, the search stops at the first one
+    :param home_titles: the titles of the home pages of Gamestop
+    :param search_results: if True, the number and the links of the results of a search page are returned as well
+    :return: the PageVerdict
+    """
+    page = ParsedPage(html_text, url)
+    home_page = is_home_page(page, url, home_titles)
+    found_keywords = () if home_page else tuple(find_keywords(page.body_text, keywords, check_all_keywords))
+    if not search_results:
+        return PageVerdict(home_page, found_keywords)
+    return PageVerdict(home_page, found_keywords, page.search_sum_count, tuple(page.search_result_links))
+
+
+def is_home_page(page: ParsedPage, url: str, home_titles) -> bool:
+    """
+    Checks whether the given html page from the given url is a home page of Gamestop. It does not directly compare
+    the given html page with a home page url, but it understands whether it's a home page or not from the title and
+    the content of the html page
+    :param page: the ParsedPage of the html page
+    :param url: the url
+    :param home_titles: the titles of the home pages of Gamestop
+    :return: True if it's the home page
+    """
+    if 'SearchResult' in url:
+        quick_search_str = url.split('SearchResult/')[1].replace('+', '%20')
+        return quick_search_str not in page.html_text
+    return page.title in home_titles
+
+
+def find_keywords(text: str, keywords: tuple, check_all_keywords: bool = False) -> list:
+    """
+    :param text: the text to look into
+    :param keywords: the tuple of the keywords
+    :param check_all_keywords: if True, all the keywords are looked for. Otherwise, the search stops at the first one
+    :return: the list of the keywords found
+    """
+    return get_keyword_matcher(tuple(keywords)).find(text, find_all=check_all_keywords)
+
+
+@functools.lru_cache(maxsize=32)
+def get_keyword_matcher(keywords: tuple) -> KeywordMatcher:
+    """
+    Gets the KeywordMatcher of the given keywords, which is compiled only the first time the keywords are used
+    :param keywords: the tuple of the keywords
+    :return: the KeywordMatcher
+    """
+    return KeywordMatcher(list(keywords))
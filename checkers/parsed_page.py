@@ -0,0 +1,84 @@
+from functools import cached_property
+
+from lxml import etree
+from lxml.html import HtmlElement, fromstring
+
+from checkers.stock_parsers import StockMarkers, find_stock_markers_in_tree, get_stock_selectors
+
+# The first link of every div with id product_<number>, which are the results of a search page
+SEARCH_RESULT_LINKS_XPATH = etree.XPath('//div[starts-with(@id, "product_") and substring-after(@id, "product_") != "" '
+                                        'and translate(substring-after(@id, "product_"), "0123456789", "") = ""]'
+                                        '/descendant::a[1]/@href')
+
+
+class ParsedPage:
+    """
+    A fetched html page that is parsed only once, with lxml, and only when one of its parts is first needed. All the
+    checks made on the same fetched page share the same ParsedPage, so the page is never parsed more than once
+    """
+
+    def __init__(self, html_text: str, url: str = None):
+        """
+        :param html_text: the html page
+        :param url: the url the page was obtained from, used simply for logging
+        """
+        self.html_text = html_text
+        self.url = url
+
+    @cached_property
+    def tree(self) -> HtmlElement:
+        """
+        The lxml tree of the page. An empty tree is used when the page cannot be parsed
+        """
+        try:
+            return fromstring(self.html_text)
+        except (etree.ParserError, ValueError):
+            return fromstring('<html><head></head><body></body></html>')
+
+    @cached_property
+    def title(self) -> str:
+        """
+        The text of the first title of the page, or None if it has no title
+        """
+        return self.tree.findtext('.//title')
+
+    @cached_property
+    def body_texts(self) -> list:
+        """
+        All the text nodes of the body of the page, in document order
+        """
+        body = self.tree.find('.//body')
+        if body is None:
+            return []
+        return list(body.itertext())
+
+    @cached_property
+    def body_text(self) -> str:
+        """
+        All the text nodes of the body of the page joined by new lines, so that a keyword can be looked for in all of
+        them with a single scan, but not across two of them
+        """
+        return '\n'.join(self.body_texts)
+
+    @cached_property
+    def stock_markers(self) -> StockMarkers:
+        """
+        The StockMarkers of a product page, found with the StockSelectors of the domain of its url
+        """
+        return find_stock_markers_in_tree(self.tree, get_stock_selectors(self.url))
+
+    @cached_property
+    def search_sum_count(self) -> str:
+        """
+        The number of results of a search page as text, or None if missing
+        """
+        sum_counts = self.tree.xpath(
+            '//strong[contains(concat(" ", normalize-space(@class), " "), " searchSumCount ")]')
+        return sum_counts[0].text_content() if sum_counts else None
+
+    @cached_property
+    def search_result_links(self) -> list:
+        """
+        The links of the results of a search page, in document order, all found with a single XPath evaluation
+        """
+        return [str(href) for href in SEARCH_RESULT_LINKS_XPATH(self.tree)]
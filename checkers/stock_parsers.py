@@ -0,0 +1,231 @@
+import re
+from urllib.parse import urlsplit
+
+from bs4 import BeautifulSoup
+from lxml import etree
+from lxml.html import HtmlElement, fromstring
+
+LXML_BACKEND = 'lxml'
+SELECTOLAX_BACKEND = 'selectolax'
+HTML_PARSER_BACKEND = 'html.parser'
+PARSER_BACKENDS = (LXML_BACKEND, SELECTOLAX_BACKEND, HTML_PARSER_BACKEND)
+
+CHECK_BOX_TWO_PATH = '//input[@id="checkboxTwo"]'
+RADIO_ADD_PATH = '//input[contains(concat(" ", normalize-space(@class), " "), " radioAdd ")]'
+CHECK_BOX_TWO_CSS = 'input#checkboxTwo'
+RADIO_ADD_CSS = 'input.radioAdd'
+
+INPUT_TAG_REGEX = re.compile(r'<input\b[^>]*>', re.IGNORECASE)
+CHECK_BOX_TWO_ID_REGEX = re.compile(r'\bid\s*=\s*["\']?checkboxTwo(?=["\'\s/>])')
+DATA_AVAILABLE_REGEX = re.compile(r'\bdata-available\s*=\s*["\']?([^"\'\s/>]*)')
+CLASS_REGEX = re.compile(r'\bclass\s*=\s*(?:"([^"]*)"|\'([^\']*)\'|([^\s/>]+))')
+
+
+class StockMarkers:
+    """
+    The elements of a product page that tell whether the product is in stock, independently of the parser backend
+    that found them
+    """
+
+    def __init__(self, check_box_two: bool = False, data_available: str = None, radio_add: bool = False):
+        """
+        :param check_box_two: True if the page has the input with id checkboxTwo
+        :param data_available: the data-available attribute of the checkboxTwo input
+        :param radio_add: True if the page has an input with the radioAdd class
+        """
+        self.check_box_two = check_box_two
+        self.data_available = data_available
+        self.radio_add = radio_add
+
+    def is_available(self) -> bool:
+        """
+        The checkboxTwo input tells the availability with its data-available attribute. Only if it's missing, the
+        presence of a radioAdd input means that the product is available
+        :return: True if available, False if not available or unknown
+        """
+        if self.check_box_two:
+            return self.data_available is not None and self.data_available.lower() == 'true'
+        return self.radio_add
+
+
+class StockSelectors:
+    """
+    The XPaths that find the stock markers in the product pages of a gamestop domain, for the domains whose markup
+    differs from the default one. They are used with the lxml backend only
+    """
+
+    def __init__(self, check_box_two_path: str = CHECK_BOX_TWO_PATH, radio_add_path: str = RADIO_ADD_PATH):
+        """
+        :param check_box_two_path: the XPath of the input that tells the availability with its data-available attribute
+        :param radio_add_path: the XPath of the input whose presence means that the product is available, used when
+        the first one is missing
+        """
+        self.check_box_two_path = check_box_two_path
+        self.radio_add_path = radio_add_path
+        self.check_box_two = etree.XPath(check_box_two_path)
+        self.radio_add = etree.XPath(radio_add_path)
+
+    def __reduce__(self):
+        # The compiled XPaths cannot be pickled, e.g. to be sent to a worker process, so they are compiled again
+        return StockSelectors, (self.check_box_two_path, self.radio_add_path)
+
+
+DEFAULT_STOCK_SELECTORS = StockSelectors()
+# The StockSelectors of the domains whose markup differs, by country code, e.g. 'de'
+DOMAIN_STOCK_SELECTORS = {}
+
+
+def set_stock_selectors(country: str, stock_selectors: StockSelectors) -> None:
+    """
+    Sets the StockSelectors used for the product pages of the given gamestop domain
+    :param country: the country code of the domain, e.g. 'de'
+    :param stock_selectors: the StockSelectors. If None, the default ones are used again
+    :return: None
+    """
+    if stock_selectors is None:
+        DOMAIN_STOCK_SELECTORS.pop(country, None)
+    else:
+        DOMAIN_STOCK_SELECTORS[country] = stock_selectors
+
+
+def get_stock_selectors(url: str = None) -> StockSelectors:
+    """
+    :param url: the url of a product page. Can be None
+    :return: the StockSelectors of the domain of the given url, the default ones if its markup does not differ
+    """
+    return DOMAIN_STOCK_SELECTORS.get(get_country(url), DEFAULT_STOCK_SELECTORS) if url else DEFAULT_STOCK_SELECTORS
+
+
+def get_country(url: str) -> str:
+    """
+    :param url: a gamestop url
+    :return: the country code of its domain, e.g. 'it'
+    """
+    return urlsplit(url).netloc.rsplit('.', 1)[-1]
+
+
+class StreamingStockScanner:
+    """
+    Scans a product page chunk by chunk, while it is being downloaded, looking for its stock markers without parsing
+    it. As the checkboxTwo input decides the availability by itself, the scan can stop as soon as it's found
+    """
+
+    def __init__(self):
+        self.radio_add = False
+        self.__leftover = ''
+
+    def feed(self, text: str):
+        """
+        Scans the next chunk of the page
+        :param text: the chunk of the page
+        :return: the StockMarkers if the availability is already known, None if the rest of the page is needed
+        """
+        text = self.__leftover + text
+        end = 0
+        for match in INPUT_TAG_REGEX.finditer(text):
+            end = match.end()
+            tag = match.group(0)
+            if CHECK_BOX_TWO_ID_REGEX.search(tag):
+                data_available = DATA_AVAILABLE_REGEX.search(tag)
+                return StockMarkers(check_box_two=True,
+                                    data_available=data_available.group(1) if data_available else None)
+            if not self.radio_add:
+                class_attribute = CLASS_REGEX.search(tag)
+                if class_attribute and 'radioAdd' in ''.join(group or '' for group in class_attribute.groups()).split():
+                    self.radio_add = True
+        # Only what follows the last '<' can be the beginning of an input tag split between two chunks
+        last_tag_start = text.rfind('<', end)
+        self.__leftover = text[last_tag_start:] if last_tag_start != -1 else ''
+        return None
+
+    def close(self) -> StockMarkers:
+        """
+        Ends the scan once the whole page has been read without finding the checkboxTwo input
+        :return: the StockMarkers of the page
+        """
+        self.__leftover = ''
+        return StockMarkers(radio_add=self.radio_add)
+
+
+def is_backend_available(backend: str) -> bool:
+    """
+    Checks whether the given parser backend can be used, as selectolax is an optional dependency
+    :param backend: the parser backend
+    :return: True if it can be used
+    """
+    if backend == SELECTOLAX_BACKEND:
+        return __get_selectolax_parser() is not None
+    return backend in PARSER_BACKENDS
+
+
+def find_stock_markers(html_text: str, backend: str = LXML_BACKEND,
+                       stock_selectors: StockSelectors = None) -> StockMarkers:
+    """
+    Parses the given product page with the given backend and finds its stock markers
+    :param html_text: the html page
+    :param backend: one of PARSER_BACKENDS
+    :param stock_selectors: the StockSelectors of the domain of the page, used with the lxml backend. The default ones
+    if not provided
+    :return: the StockMarkers of the page
+    """
+    if backend == LXML_BACKEND:
+        try:
+            tree = fromstring(html_text)
+        except (etree.ParserError, ValueError):
+            return StockMarkers()
+        return find_stock_markers_in_tree(tree, stock_selectors)
+    elif backend == SELECTOLAX_BACKEND:
+        return __find_stock_markers_selectolax(html_text)
+    elif backend == HTML_PARSER_BACKEND:
+        return __find_stock_markers_html_parser(html_text)
+    raise ValueError('Unknown parser backend ' + str(backend) + '! The available ones are ' + str(PARSER_BACKENDS))
+
+
+def find_stock_markers_in_tree(tree: HtmlElement, stock_selectors: StockSelectors = None) -> StockMarkers:
+    """
+    Finds the stock markers of an already parsed lxml tree with the precompiled XPaths
+    :param tree: the lxml tree of the product page
+    :param stock_selectors: the StockSelectors of the domain of the page. The default ones if not provided
+    :return: the StockMarkers of the page
+    """
+    stock_selectors = stock_selectors if stock_selectors is not None else DEFAULT_STOCK_SELECTORS
+    check_box_two = stock_selectors.check_box_two(tree)
+    if check_box_two:
+        return StockMarkers(check_box_two=True, data_available=check_box_two[0].get('data-available'))
+    return StockMarkers(radio_add=bool(stock_selectors.radio_add(tree)))
+
+
+def __find_stock_markers_selectolax(html_text: str) -> StockMarkers:
+    parser = __get_selectolax_parser()
+    if parser is None:
+        raise ImportError('selectolax is not installed! Install it or use the lxml parser backend')
+    tree = parser(html_text)
+    check_box_two = tree.css_first(CHECK_BOX_TWO_CSS)
+    if check_box_two is not None:
+        return StockMarkers(check_box_two=True, data_available=check_box_two.attributes.get('data-available'))
+    return StockMarkers(radio_add=tree.css_first(RADIO_ADD_CSS) is not None)
+
+
+def __find_stock_markers_html_parser(html_text: str) -> StockMarkers:
+    soup = BeautifulSoup(html_text, 'html.parser')
+    check_box_two = soup.find("input", {"id": "checkboxTwo"})
+    if check_box_two:
+        return StockMarkers(check_box_two=True, data_available=check_box_two.get('data-available'))
+    return StockMarkers(radio_add=soup.find("input", {"class": "radioAdd"}) is not None)
+
+
+def __get_selectolax_parser():
+    """
+    Gets the selectolax parser class, preferring the lexbor engine of the most recent versions
+    :return: the parser class, or None if selectolax is not installed
+    """
+    try:
+        from selectolax.lexbor import LexborHTMLParser
+        return LexborHTMLParser
+    except ImportError:
+        pass
+    try:
+        from selectolax.parser import HTMLParser
+        return HTMLParser
+    except ImportError:
+        return None
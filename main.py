@@ -1,12 +1,40 @@
 import asyncio
+import functools
+import multiprocessing
+import os
+import socket
+import time
 import webbrowser
 import logging
 from checkers import gamestop_checker
+from checkers.parsed_page import ParsedPage
+from checkers.stock_parsers import CHECK_BOX_TWO_PATH, RADIO_ADD_PATH, StockSelectors, get_country, \
+    set_stock_selectors
+from notification_senders.notification_bus import Notification, NotificationBus, NotificationConsumer, \
+    SCRAPE_EVENT, SEARCH_EVENT, STOCK_EVENT
 from notification_senders.telegram_sender import TelegramSender
+from utils.adaptive_interval import AdaptiveInterval, parse_hot_hours
+from utils.dedup_cache import DedupCache
+from utils.domain_guard import DomainUnavailableError
+from utils.http_client import HttpClient
+from utils.metrics import Metrics, MetricsServer
+from utils.page_cache import PageCache
+from utils.parse_executor import PROCESS_EXECUTOR, ParseExecutor
+from utils.profiler import Profiler, SamplingProfiler
+from utils.rate_limiter import RateLimiter
+from utils.result_history import ResultHistory
+from utils.scheduler import Job, Scheduler
+from utils.scrape_leases import COORDINATOR, STANDALONE, WORKER, ScrapeLeases
+from utils.scrape_state import IN_STOCK, MATCHED, ScrapeState
 from utils.utils import get_bool, get_config_section_dic, is_valid_url
 from playsound import playsound
 
 SOUND_LOCATION = get_config_section_dic('CommonConfig').get('sound_path')
+NOTIFICATION_BUS = None
+# The (url, event type) pairs notified recently, which are not notified again in any way until their cooldown is over
+NOTIFICATION_DEDUP = None
+NOTIFICATION_COOLDOWNS = {}
+PROFILER = None
 
 
 async def handle_sound(play_sound: bool) -> None:
@@ -30,21 +58,69 @@ def handle_open_browser(open_browser: bool, url: str) -> None:
         webbrowser.open(url)
 
 
-async def handle_send_message(telegram_sender: TelegramSender, message: str) -> None:
+async def handle_send_message(telegram_sender: TelegramSender, message: str) -> bool:
     """
-    Sends the given message via Telegram
+    Sends the given message via Telegram, logging the error if it could not be sent
     :param telegram_sender: the TelegramSender object to use to send the message
     :param message: the message to send
-    :return: None
+    :return: False if the message could not be sent
     """
     if telegram_sender:
-        await telegram_sender.send_message(message)
+        try:
+            await telegram_sender.send_message(message)
+        except Exception:
+            logging.exception('Could not send the message via Telegram')
+            return False
+    return True
+
+
+async def notify(telegram_sender: TelegramSender, message: str, url: str, event_type: str, play_sound: bool = False,
+                 open_browser: bool = False) -> None:
+    """
+    Notifies something a check found, unless the same url was notified for the same event type during the cooldown of
+    the event type. With a NOTIFICATION_BUS, the notification is only queued and delivered by its consumers, so that
+    the check goes on without waiting for it. Otherwise, it is delivered right away. A notification that could not be
+    delivered does not start the cooldown, so that the next check notifies it again
+    :param telegram_sender: the TelegramSender. Can be None
+    :param message: the message to send via Telegram
+    :param url: the url to open in the browser
+    :param event_type: the kind of check that found it, e.g. STOCK_EVENT
+    :param play_sound: True if a sound should be played
+    :param open_browser: True if the browser should be opened
+    :return: None
+    """
+    if NOTIFICATION_DEDUP is not None and NOTIFICATION_DEDUP.seen((url, event_type),
+                                                                  NOTIFICATION_COOLDOWNS.get(event_type)):
+        logging.info('{} was already notified for {} recently'.format(url, event_type))
+        return
+    with PROFILER.span('notify') if PROFILER is not None else gamestop_checker.NO_SPAN:
+        if NOTIFICATION_BUS is not None:
+            NOTIFICATION_BUS.publish(Notification(message, url, event_type, telegram_sender=telegram_sender,
+                                                  play_sound=play_sound, open_browser=open_browser,
+                                                  on_failure=functools.partial(forget_notification, url, event_type)))
+            return
+        if not await handle_send_message(telegram_sender, message):
+            forget_notification(url, event_type)
+        handle_open_browser(open_browser, url)
+        await handle_sound(play_sound)
+
+
+def forget_notification(url: str, event_type: str) -> None:
+    """
+    Forgets that the given url was notified for the given event type, because the notification could not be delivered
+    :param url: the url
+    :param event_type: the kind of check that found it
+    :return: None
+    """
+    if NOTIFICATION_DEDUP is not None:
+        NOTIFICATION_DEDUP.forget((url, event_type))
 
 
 async def check_for_stock_gamestop(telegram_gamestop_sender: TelegramSender = None,
                                    url: str = None, open_browser: bool = False, play_sound: bool = False,
                                    sleep: int = 60,
-                                   sleep_after_found: int = 3600) -> None:
+                                   sleep_after_found: int = 3600,
+                                   adaptive_interval: AdaptiveInterval = None) -> None:
     """
     Checks if a Gamestop product with the given url is in stock and notifies in several ways
     :param telegram_gamestop_sender: The TelegramSender. Can be None
@@ -53,25 +129,180 @@ async def check_for_stock_gamestop(telegram_gamestop_sender: TelegramSender = No
     :param play_sound: true if a sound should be played if the product is in stock
     :param sleep: how much it should sleep between checks
     :param sleep_after_found: how much it should sleep after realizing that the product is in stock
+    :param adaptive_interval: if provided, it replaces sleep with an interval that adapts to the changes of the page
     :return: None
     """
     while True:
         try:
+            delay = sleep
             if url:
-                available = await gamestop_checker.check_stock(url)
-                if available:
-                    await handle_send_message(telegram_gamestop_sender, 'Disponibile! ' + url)
-                    handle_open_browser(open_browser, url)
-                    await handle_sound(play_sound)
-                    await asyncio.sleep(sleep_after_found)
+                delay = await check_stock_once(telegram_gamestop_sender, url, open_browser=open_browser,
+                                               play_sound=play_sound, sleep=sleep, sleep_after_found=sleep_after_found,
+                                               adaptive_interval=adaptive_interval)
+            if delay != 0:
+                await asyncio.sleep(delay)
+        except DomainUnavailableError as exception:
+            logging.info('{}, checking {} later'.format(exception, url))
+            await asyncio.sleep(max(sleep, exception.retry_after))
+        except Exception as exception:
+            logging.exception('An error occurred', exception)
             if sleep != 0:
                 await asyncio.sleep(sleep)
+
+
+async def check_stock_once(telegram_gamestop_sender: TelegramSender, url: str, open_browser: bool = False,
+                           play_sound: bool = False, sleep: int = 60, sleep_after_found: int = 3600,
+                           adaptive_interval: AdaptiveInterval = None) -> float:
+    """
+    Checks once if a Gamestop product with the given url is in stock and notifies in several ways
+    :param telegram_gamestop_sender: The TelegramSender. Can be None
+    :param url: The url
+    :param open_browser: true if a browser should be opened if the product is in stock
+    :param play_sound: true if a sound should be played if the product is in stock
+    :param sleep: how much it should wait before the next check
+    :param sleep_after_found: how much it should additionally wait after realizing that the product is in stock
+    :param adaptive_interval: if provided, it replaces sleep with an interval that adapts to the changes of the page
+    :return: how many seconds should pass before the next check
+    """
+    available = await gamestop_checker.check_stock(url)
+    if adaptive_interval is not None:
+        sleep = adaptive_interval.next_interval(gamestop_checker.page_changed(url))
+    if available:
+        await notify(telegram_gamestop_sender, 'Disponibile! ' + url, url, STOCK_EVENT, play_sound=play_sound,
+                     open_browser=open_browser)
+        return sleep_after_found + sleep
+    return sleep
+
+
+async def check_for_product_gamestop(telegram_gamestop_sender: TelegramSender = None,
+                                     product_path: str = None, countries: list = None, open_browser: bool = False,
+                                     play_sound: bool = False, sleep: int = 60, sleep_after_found: int = 3600) -> None:
+    """
+    Checks in loop if a Gamestop product is in stock on any of the given gamestop domains and notifies in several ways
+    :param telegram_gamestop_sender: The TelegramSender. Can be None
+    :param product_path: the path of the product after the domain, e.g. 'PS5/Games/134750'
+    :param countries: the country codes of the domains to check. All of them if not provided
+    :param open_browser: true if a browser should be opened if the product is in stock
+    :param play_sound: true if a sound should be played if the product is in stock
+    :param sleep: how much it should sleep between checks
+    :param sleep_after_found: how much it should sleep after realizing that the product is in stock
+    :return: None
+    """
+    while True:
+        try:
+            delay = await check_product_once(telegram_gamestop_sender, product_path, countries,
+                                             open_browser=open_browser, play_sound=play_sound, sleep=sleep,
+                                             sleep_after_found=sleep_after_found)
+            if delay != 0:
+                await asyncio.sleep(delay)
         except Exception as exception:
             logging.exception('An error occurred', exception)
             if sleep != 0:
                 await asyncio.sleep(sleep)
 
 
+async def check_product_once(telegram_gamestop_sender: TelegramSender, product_path: str, countries: list = None,
+                             open_browser: bool = False, play_sound: bool = False, sleep: int = 60,
+                             sleep_after_found: int = 3600) -> float:
+    """
+    Checks once if a Gamestop product is in stock on any of the given gamestop domains, all of them at the same time,
+    and notifies every domain where it's in stock
+    :param telegram_gamestop_sender: The TelegramSender. Can be None
+    :param product_path: the path of the product after the domain, e.g. 'PS5/Games/134750'
+    :param countries: the country codes of the domains to check. All of them if not provided
+    :param open_browser: true if a browser should be opened for every domain where the product is in stock
+    :param play_sound: true if a sound should be played if the product is in stock
+    :param sleep: how much it should wait before the next check
+    :param sleep_after_found: how much it should additionally wait after realizing that the product is in stock
+    :return: how many seconds should pass before the next check
+    """
+    availability = await gamestop_checker.check_stock_everywhere(product_path, countries)
+    logging.info('Availability of {}: {}'.format(product_path, ', '.join(
+        '{} {}'.format(country, 'paused' if available is None else available)
+        for country, available in availability.items())))
+    urls = gamestop_checker.product_urls(product_path, countries)
+    found = False
+    for country, available in availability.items():
+        if available:
+            found = True
+            await notify(telegram_gamestop_sender, 'Disponibile ({})! {}'.format(country.upper(), urls[country]),
+                         urls[country], STOCK_EVENT, play_sound=play_sound, open_browser=open_browser)
+    return sleep_after_found + sleep if found else sleep
+
+
+async def handle_scraped_product(telegram_gamestop_sender: TelegramSender, page: ParsedPage, url: str,
+                                 check_stock: bool = True, play_sound: bool = True, open_browser: bool = True) -> bool:
+    """
+    Notifies that a scraped product page contains the keywords, checking its stock first if required
+    :param telegram_gamestop_sender: the TelegramSender for sending messages. Can be None
+    :param page: the parsed page of the product, as returned by gamestop_checker.check_if_page_contains_keywords
+    :param url: the url of the product
+    :param check_stock: if True, it will also check if the product is in stock
+    :param play_sound: if True, it will play a sound
+    :param open_browser: if True, it will open the browser
+    :return: True if the product is in stock
+    """
+    stock_found = False
+    if check_stock:
+        stock_found = gamestop_checker.check_stock_from_page(page, url)
+    message = 'Found keyword and stock:' + url if stock_found else 'Found keyword: ' + url
+    await notify(telegram_gamestop_sender, message, url, SCRAPE_EVENT, play_sound=play_sound,
+                 open_browser=open_browser)
+    return stock_found
+
+
+async def scrape_product_id(telegram_gamestop_sender: TelegramSender, base_url: str, product_id: int,
+                            check_stock: bool = True, play_sound: bool = True, open_browser: bool = True,
+                            keywords: list = None, check_all_keywords: bool = False,
+                            scrape_state: ScrapeState = None) -> bool:
+    """
+    Scrapes a single product id, notifies if its page contains the keywords and records the result in the ScrapeState
+    :param telegram_gamestop_sender: the TelegramSender for sending messages. Can be None
+    :param base_url: the base_url
+    :param product_id: the product id
+    :param check_stock: if True, it will also check if the product is in stock when found
+    :param play_sound: if True, it will play a sound when found
+    :param open_browser: if True, it will open the browser when found
+    :param keywords: the keywords to check for
+    :param check_all_keywords: if True, the product is found only if all keywords are in its page
+    :param scrape_state: the ScrapeState that remembers the result. Can be None
+    :return: True if the page of the product contains the keywords
+    """
+    url = base_url + str(product_id)
+    status, page = await scrape_product_when_available(url, keywords if keywords is not None else [],
+                                                       check_all_keywords)
+    if page is not None and await handle_scraped_product(telegram_gamestop_sender, page, url, check_stock=check_stock,
+                                                         play_sound=play_sound, open_browser=open_browser):
+        status = IN_STOCK
+    if scrape_state is not None:
+        scrape_state.record(base_url, product_id, status)
+    return page is not None
+
+
+async def scrape_product_when_available(url: str, keywords: list, check_all_keywords: bool = False) -> tuple:
+    """
+    Scrapes the product page like gamestop_checker.scrape_product, but while its domain is paused it waits for the
+    domain to be probed again instead of failing, so that no product id is skipped
+    :return: the tuple returned by gamestop_checker.scrape_product
+    """
+    while True:
+        try:
+            return await gamestop_checker.scrape_product(url, keywords, check_all_keywords)
+        except DomainUnavailableError as exception:
+            logging.info('{}, waiting to scrape {}'.format(exception, url))
+            await asyncio.sleep(exception.retry_after)
+
+
+def get_product_ids_to_scrape(base_url: str, starting_product_id: int, ending_product_id: int,
+                              scrape_state: ScrapeState = None):
+    """
+    :return: the product ids of the given range that should be scraped, i.e. all of them without a ScrapeState
+    """
+    if scrape_state is not None:
+        return scrape_state.due_product_ids(base_url, starting_product_id, ending_product_id)
+    return iter(range(starting_product_id, ending_product_id + 1))
+
+
 async def scrape_gamestop_products(telegram_gamestop_sender: TelegramSender,
                                    starting_product_id: int,
                                    ending_product_id: int,
@@ -83,7 +314,10 @@ async def scrape_gamestop_products(telegram_gamestop_sender: TelegramSender,
                                    check_all_keywords: bool = False,
                                    sleep: int = 60,
                                    continue_after_found: bool = False,
-                                   sleep_after_found: int = 3600):
+                                   sleep_after_found: int = 3600,
+                                   workers: int = 1,
+                                   requests_per_second: float = 0,
+                                   scrape_state: ScrapeState = None):
     """
     Scrapes for gamestop products whose pages contain any of the given keywords, from the given product_id to the given product_id that  and notifies and stops when required
     :param telegram_gamestop_sender: the TelegramSender for sending messages. Can be None
@@ -95,32 +329,35 @@ async def scrape_gamestop_products(telegram_gamestop_sender: TelegramSender,
     :param open_browser: if True, it will open the browser if a product that has the corresponding keywords is found
     :param keywords: the keywords to check for
     :param check_all_keywords: if True, the result will be considered as successful only if all keywords are found in the product page
-    :param sleep: the amount of sleep between two searches
+    :param sleep: the amount of sleep between two searches. Ignored when scraping concurrently
     :param continue_after_found: if True, it will continue scraping even a successful result has been provided
     :param sleep_after_found: the amount of sleep after a successful result
+    :param workers: how many products are scraped concurrently. If more than 1, or if requests_per_second is set, the
+    products are scraped by scrape_gamestop_products_concurrently
+    :param requests_per_second: the maximum number of requests per second made by all the workers together
+    :param scrape_state: the ScrapeState that remembers the results, so that the product ids scraped recently are
+    skipped. Can be None
     :return: None
     """
+    if workers > 1 or requests_per_second > 0:
+        await scrape_gamestop_products_concurrently(telegram_gamestop_sender, starting_product_id, ending_product_id,
+                                                    base_url, check_stock=check_stock, play_sound=play_sound,
+                                                    open_browser=open_browser, keywords=keywords,
+                                                    check_all_keywords=check_all_keywords,
+                                                    continue_after_found=continue_after_found,
+                                                    sleep_after_found=sleep_after_found, workers=workers,
+                                                    requests_per_second=requests_per_second,
+                                                    scrape_state=scrape_state)
+        return
+
     if keywords is None:
         keywords = []
 
-    current_product_id = starting_product_id
-    while current_product_id <= ending_product_id:
-        url = base_url + str(current_product_id)
+    for product_id in get_product_ids_to_scrape(base_url, starting_product_id, ending_product_id, scrape_state):
         try:
-            return_value = await gamestop_checker.check_if_page_contains_keywords(base_url + str(current_product_id),
-                                                                                  check_all_keywords=check_all_keywords,
-                                                                                  keywords=keywords)
-            if return_value:
-                stock_found = False
-                if check_stock:
-                    stock_found = gamestop_checker.check_stock_from_soup(return_value, url)
-                if telegram_gamestop_sender:
-                    if stock_found:
-                        await telegram_gamestop_sender.send_message('Found keyword and stock:' + url)
-                    else:
-                        await telegram_gamestop_sender.send_message('Found keyword: ' + url)
-                handle_open_browser(open_browser, url)
-                await handle_sound(play_sound)
+            if await scrape_product_id(telegram_gamestop_sender, base_url, product_id, check_stock=check_stock,
+                                       play_sound=play_sound, open_browser=open_browser, keywords=keywords,
+                                       check_all_keywords=check_all_keywords, scrape_state=scrape_state):
                 if continue_after_found:
                     await asyncio.sleep(sleep_after_found)
                 else:
@@ -131,8 +368,286 @@ async def scrape_gamestop_products(telegram_gamestop_sender: TelegramSender,
             logging.error('An error occurred, going on...')
             if sleep != 0:
                 await asyncio.sleep(sleep)
+
+
+async def scrape_gamestop_products_concurrently(telegram_gamestop_sender: TelegramSender,
+                                                starting_product_id: int,
+                                                ending_product_id: int,
+                                                base_url: str,
+                                                check_stock: bool = True,
+                                                play_sound: bool = True,
+                                                open_browser: bool = True,
+                                                keywords: list = None,
+                                                check_all_keywords: bool = False,
+                                                continue_after_found: bool = False,
+                                                sleep_after_found: int = 3600,
+                                                workers: int = 4,
+                                                requests_per_second: float = 1,
+                                                scrape_state: ScrapeState = None) -> None:
+    """
+    Scrapes for gamestop products like scrape_gamestop_products, but with a pool of workers that take the product_ids
+    from a shared queue. The results are notified as soon as each product is checked, not in product_id order
+    :param telegram_gamestop_sender: the TelegramSender for sending messages. Can be None
+    :param starting_product_id: the product_id it should start from
+    :param ending_product_id: the product_id it should end at
+    :param base_url: the base_url
+    :param check_stock: if True, it will also check if the products that were found are in stock
+    :param play_sound: if True, it will play a sound if a product that has the corresponding keywords is found
+    :param open_browser: if True, it will open the browser if a product that has the corresponding keywords is found
+    :param keywords: the keywords to check for
+    :param check_all_keywords: if True, the result will be considered as successful only if all keywords are found in
+    the product page
+    :param continue_after_found: if True, it will continue scraping even a successful result has been provided.
+    Otherwise, all the workers stop after the first one
+    :param sleep_after_found: the amount of sleep of the worker that found a successful result
+    :param workers: the number of workers
+    :param requests_per_second: the maximum number of requests per second made by all the workers together. 0 or
+    less means unlimited
+    :param scrape_state: the ScrapeState that remembers the results, so that the product ids scraped recently are
+    skipped. Can be None
+    :return: None
+    """
+    if keywords is None:
+        keywords = []
+
+    product_ids = asyncio.Queue()
+    for product_id in get_product_ids_to_scrape(base_url, starting_product_id, ending_product_id, scrape_state):
+        product_ids.put_nowait(product_id)
+    rate_limiter = RateLimiter(requests_per_second)
+    found = asyncio.Event()
+
+    async def worker() -> None:
+        while not (found.is_set() and not continue_after_found):
+            try:
+                product_id = product_ids.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            url = base_url + str(product_id)
+            try:
+                await rate_limiter.acquire()
+                if await scrape_product_id(telegram_gamestop_sender, base_url, product_id, check_stock=check_stock,
+                                           play_sound=play_sound, open_browser=open_browser, keywords=keywords,
+                                           check_all_keywords=check_all_keywords, scrape_state=scrape_state):
+                    found.set()
+                    if continue_after_found:
+                        await asyncio.sleep(sleep_after_found)
+            except Exception:
+                logging.error('An error occurred while scraping {}, going on...'.format(url))
+
+    await asyncio.gather(*[worker() for _ in range(max(1, workers))])
+
+
+async def scrape_leased_chunks(scrape_leases: ScrapeLeases,
+                               base_url: str,
+                               worker: str,
+                               check_stock: bool = True,
+                               keywords: list = None,
+                               check_all_keywords: bool = False,
+                               requests_per_second: float = 0,
+                               poll_interval: float = 5) -> None:
+    """
+    Runs a worker of a sharded scrape: it leases the chunks of product_ids from the ScrapeLeases shared with the
+    coordinator, scrapes them and reports their results until all the chunks are done. It does not notify anything,
+    the coordinator notifies the reported results
+    :param scrape_leases: the ScrapeLeases
+    :param base_url: the base_url
+    :param worker: the name of the worker, unique among all the workers
+    :param check_stock: if True, it will also check if the products that were found are in stock
+    :param keywords: the keywords to check for
+    :param check_all_keywords: if True, the result will be considered as successful only if all keywords are found in
+    the product page
+    :param requests_per_second: the maximum number of requests per second made by this worker. 0 or less means
+    unlimited
+    :param poll_interval: the seconds to wait before trying again when all the chunks are leased to other workers
+    :return: None
+    """
+    if keywords is None:
+        keywords = []
+
+    rate_limiter = RateLimiter(requests_per_second)
+    while True:
+        chunk = await scrape_leases.run(scrape_leases.lease, base_url, worker)
+        if chunk is None:
+            done, total = await scrape_leases.run(scrape_leases.progress, base_url)
+            # Without chunks, the coordinator did not create them yet
+            if total > 0 and done == total:
+                logging.info('All the chunks of {} are done'.format(base_url))
+                return
+            await asyncio.sleep(poll_interval)
+            continue
+        first_id, last_id, product_ids = chunk
+        # A product can wait for its paused domain for longer than the lease
+        lease_keeper = asyncio.ensure_future(keep_lease(scrape_leases, base_url, first_id, worker))
+        unreported_ids = []
+        try:
+            for product_id in product_ids:
+                url = base_url + str(product_id)
+                try:
+                    await rate_limiter.acquire()
+                    status, page = await scrape_product_when_available(url, keywords, check_all_keywords)
+                    if page is not None and check_stock and gamestop_checker.check_stock_from_page(page, url):
+                        status = IN_STOCK
+                    await scrape_leases.run(scrape_leases.report, base_url, product_id, status, worker)
+                except Exception:
+                    logging.exception('An error occurred while scraping {}, it will be scraped again'.format(url))
+                    unreported_ids.append(product_id)
+                if not await scrape_leases.run(scrape_leases.renew, base_url, first_id, worker):
+                    logging.warning('{} lost the lease on the chunk {}-{}'.format(worker, first_id, last_id))
+                    break
+            else:
+                if unreported_ids:
+                    # The chunk is leased again, with only these ids, once the lease expires
+                    await scrape_leases.run(scrape_leases.requeue, base_url, first_id, worker, unreported_ids)
+                else:
+                    await scrape_leases.run(scrape_leases.complete, base_url, first_id, worker)
         finally:
-            current_product_id = current_product_id + 1
+            lease_keeper.cancel()
+
+
+async def keep_lease(scrape_leases: ScrapeLeases, base_url: str, first_id: int, worker: str) -> None:
+    """
+    Renews the lease of the given worker on the given chunk three times every lease_seconds, until cancelled or until
+    the lease is lost, so that the chunk is not leased to another worker while a product is being scraped
+    :param scrape_leases: the ScrapeLeases
+    :param base_url: the base url of the scrape
+    :param first_id: the first id of the chunk
+    :param worker: the name of the worker
+    :return: None
+    """
+    while True:
+        await asyncio.sleep(scrape_leases.lease_seconds / 3)
+        try:
+            if not await scrape_leases.run(scrape_leases.renew, base_url, first_id, worker):
+                return
+        except Exception:
+            logging.exception('{} could not renew the lease on the chunk starting at {}'.format(worker, first_id))
+
+
+async def coordinate_scrape(telegram_gamestop_sender: TelegramSender,
+                            scrape_leases: ScrapeLeases,
+                            starting_product_id: int,
+                            ending_product_id: int,
+                            base_url: str,
+                            play_sound: bool = True,
+                            open_browser: bool = True,
+                            continue_after_found: bool = False,
+                            chunk_size: int = 100,
+                            local_workers: int = 0,
+                            scrape_state: ScrapeState = None,
+                            poll_interval: float = 5) -> None:
+    """
+    Runs the coordinator of a sharded scrape: it splits the product_ids to scrape into the chunks of the ScrapeLeases,
+    then merges the results reported by the workers into the ScrapeState and notifies the products that were found,
+    until all the chunks are done. The chunks of a previous run that are not done yet are resumed
+    :param telegram_gamestop_sender: the TelegramSender for sending messages. Can be None
+    :param scrape_leases: the ScrapeLeases
+    :param starting_product_id: the product_id it should start from
+    :param ending_product_id: the product_id it should end at
+    :param base_url: the base_url
+    :param play_sound: if True, it will play a sound if a product that has the corresponding keywords is found
+    :param open_browser: if True, it will open the browser if a product that has the corresponding keywords is found
+    :param continue_after_found: if True, the workers continue scraping even a successful result has been provided.
+    Otherwise, all the chunks are cancelled after the first one
+    :param chunk_size: the number of product_ids of a chunk
+    :param local_workers: how many worker processes are started on this machine, besides the ones started elsewhere
+    :param scrape_state: the ScrapeState that remembers the results, so that the product ids scraped recently are
+    skipped. Can be None
+    :param poll_interval: the seconds between two merges of the results
+    :return: None
+    """
+    done, total = await scrape_leases.run(scrape_leases.progress, base_url)
+    if total > 0 and done == total:
+        await scrape_leases.run(scrape_leases.reset, base_url)
+        total = 0
+    if total == 0:
+        product_ids = sorted(get_product_ids_to_scrape(base_url, starting_product_id, ending_product_id,
+                                                       scrape_state))
+        await scrape_leases.run(scrape_leases.create_chunks, base_url, product_ids, chunk_size)
+    else:
+        logging.info('Resuming the scrape of {}, {} of {} chunks are done'.format(base_url, done, total))
+
+    processes = start_local_scrape_workers(local_workers)
+    try:
+        while True:
+            # Checked before merging, so that the results reported before the last chunk was done are merged
+            finished = await scrape_leases.run(scrape_leases.is_finished, base_url)
+            for product_id, status, worker, _ in await scrape_leases.run(scrape_leases.take_results, base_url):
+                if scrape_state is not None:
+                    scrape_state.record(base_url, product_id, status)
+                if status in (MATCHED, IN_STOCK):
+                    url = base_url + str(product_id)
+                    message = 'Found keyword and stock:' + url if status == IN_STOCK else 'Found keyword: ' + url
+                    logging.info('{} found {}'.format(worker, url))
+                    await notify(telegram_gamestop_sender, message, url, SCRAPE_EVENT, play_sound=play_sound,
+                                 open_browser=open_browser)
+                    if not continue_after_found:
+                        await scrape_leases.run(scrape_leases.cancel, base_url)
+            if finished:
+                logging.info('The sharded scrape of {} is over'.format(base_url))
+                return
+            await asyncio.sleep(poll_interval)
+    finally:
+        stop_local_scrape_workers(processes)
+
+
+def start_local_scrape_workers(workers: int) -> list:
+    """
+    Starts the given number of worker processes of a sharded scrape on this machine
+    :param workers: the number of the processes
+    :return: the list of the processes
+    """
+    context = multiprocessing.get_context('spawn')
+    processes = []
+    for index in range(workers):
+        process = context.Process(target=run_scrape_worker, args=('{}-local-{}'.format(socket.gethostname(), index),),
+                                  name='scrape_worker_' + str(index))
+        process.start()
+        processes.append(process)
+    return processes
+
+
+def stop_local_scrape_workers(processes: list) -> None:
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+        process.join()
+
+
+def run_scrape_worker(worker: str = None) -> None:
+    """
+    The entry point of a worker process of a sharded scrape
+    :param worker: the name of the worker. The host name and the process id if not provided
+    :return: None
+    """
+    asyncio.run(scrape_worker_main(worker))
+
+
+async def scrape_worker_main(worker: str = None) -> None:
+    """
+    Sets up the checker and runs a worker of a sharded scrape with the ScrapeConfig section, without the stock and
+    search checks and without the notifications
+    :param worker: the name of the worker. The host name and the process id if not provided
+    :return: None
+    """
+    scrape_config = get_config_section_dic('ScrapeConfig')
+    set_up_logging()
+    http_client = set_up_http_client(get_config_section_dic('HttpConfig', optional=True))
+    scrape_leases = set_up_scrape_leases(scrape_config)
+    try:
+        await set_up_gamestop(get_config_section_dic('CheckerConfig', optional=True))
+        await scrape_leased_chunks(scrape_leases, scrape_config.get('base_url'),
+                                   worker or '{}-{}'.format(socket.gethostname(), os.getpid()),
+                                   check_stock=get_bool(scrape_config.get('check_stock')),
+                                   keywords=scrape_config.get('keywords').split(', '),
+                                   check_all_keywords=get_bool(scrape_config.get('check_all_keywords')),
+                                   requests_per_second=float(scrape_config.get('requests_per_second', 0)),
+                                   poll_interval=float(scrape_config.get('poll_interval', 5)))
+    finally:
+        scrape_leases.close()
+        tear_down_gamestop()
+        gamestop_checker.set_http_client(None)
+        await gamestop_checker.close_fallback_http_client()
+        await http_client.close()
 
 
 async def check_for_search_gamestop(telegram_gamestop_sender: TelegramSender,
@@ -143,79 +658,412 @@ async def check_for_search_gamestop(telegram_gamestop_sender: TelegramSender,
                                     keywords: list = None,
                                     check_all_keywords: bool = False,
                                     check_availability: bool = False,
-                                    sleep: int = 30):
+                                    sleep: int = 30,
+                                    max_concurrent_checks: int = 4,
+                                    adaptive_interval: AdaptiveInterval = None):
     if keywords is None:
         keywords = []
 
     should_break = False
     while should_break is False:
         try:
-            return_value = await gamestop_checker.check_search(url=search_url, results=results,
-                                                               keywords=keywords,
-                                                               check_all_keywords=check_all_keywords,
-                                                               check_availability=check_availability)
-            if return_value:
-                message = 'Search was successful: ' + search_url
-                if telegram_gamestop_sender:
-                    await telegram_gamestop_sender.send_message(message)
-                handle_open_browser(open_browser, search_url)
-                await handle_sound(play_sound)
-                should_break = True
+            delay = await check_search_once(telegram_gamestop_sender, play_sound=play_sound,
+                                            open_browser=open_browser, search_url=search_url, results=results,
+                                            keywords=keywords, check_all_keywords=check_all_keywords,
+                                            check_availability=check_availability, sleep=sleep,
+                                            max_concurrent_checks=max_concurrent_checks,
+                                            adaptive_interval=adaptive_interval)
+            should_break = delay is None
             if should_break is False:
-                await asyncio.sleep(sleep)
+                await asyncio.sleep(delay)
+        except DomainUnavailableError as exception:
+            logging.info('{}, checking {} later'.format(exception, search_url))
+            await asyncio.sleep(max(sleep, exception.retry_after))
         except Exception:
             logging.debug('An error occurred, going on...')
             if sleep != 0:
                 await asyncio.sleep(sleep)
 
 
+async def check_search_once(telegram_gamestop_sender: TelegramSender,
+                            play_sound: bool = False,
+                            open_browser: bool = False,
+                            search_url: str = None,
+                            results: int = None,
+                            keywords: list = None,
+                            check_all_keywords: bool = False,
+                            check_availability: bool = False,
+                            sleep: int = 30,
+                            max_concurrent_checks: int = 4,
+                            adaptive_interval: AdaptiveInterval = None):
+    """
+    Checks once the given search url and notifies in several ways if the search was successful
+    :param telegram_gamestop_sender: the TelegramSender for sending messages. Can be None
+    :param play_sound: if True, it will play a sound if the search was successful
+    :param open_browser: if True, it will open the browser if the search was successful
+    :param search_url: the search url
+    :param results: how many results are normal
+    :param keywords: the keywords to look for in the search
+    :param check_all_keywords: if True, the search is successful only if all the keywords are present
+    :param check_availability: if True, it will also check if any of the found results are available
+    :param sleep: how much it should wait before the next check
+    :param max_concurrent_checks: how many results are checked for availability at the same time
+    :param adaptive_interval: if provided, it replaces sleep with an interval that adapts to the changes of the page
+    :return: how many seconds should pass before the next check, None if the search was successful and it should
+    not be checked anymore
+    """
+    return_value = await gamestop_checker.check_search(url=search_url, results=results,
+                                                       keywords=keywords,
+                                                       check_all_keywords=check_all_keywords,
+                                                       check_availability=check_availability,
+                                                       max_concurrent_checks=max_concurrent_checks)
+    if return_value:
+        message = 'Search was successful: ' + search_url
+        await notify(telegram_gamestop_sender, message, search_url, SEARCH_EVENT, play_sound=play_sound,
+                     open_browser=open_browser)
+        return None
+    if adaptive_interval is not None:
+        return adaptive_interval.next_interval(gamestop_checker.page_changed(search_url))
+    return sleep
+
+
+async def scrape_next_product(telegram_gamestop_sender: TelegramSender,
+                              product_ids,
+                              found: asyncio.Event,
+                              base_url: str,
+                              check_stock: bool = True,
+                              play_sound: bool = True,
+                              open_browser: bool = True,
+                              keywords: list = None,
+                              check_all_keywords: bool = False,
+                              sleep: float = 60,
+                              continue_after_found: bool = False,
+                              sleep_after_found: int = 3600,
+                              scrape_state: ScrapeState = None):
+    """
+    Scrapes the next product_id of the given iterator, which can be shared by several jobs scraping concurrently
+    :param telegram_gamestop_sender: the TelegramSender for sending messages. Can be None
+    :param product_ids: the iterator of the product_ids still to scrape
+    :param found: the Event set when a product that has the corresponding keywords is found
+    :param base_url: the base_url
+    :param check_stock: if True, it will also check if the products that were found are in stock
+    :param play_sound: if True, it will play a sound if a product that has the corresponding keywords is found
+    :param open_browser: if True, it will open the browser if a product that has the corresponding keywords is found
+    :param keywords: the keywords to check for
+    :param check_all_keywords: if True, the result will be considered as successful only if all keywords are found in
+    the product page
+    :param sleep: the amount of sleep before the next product
+    :param continue_after_found: if True, it will continue scraping even a successful result has been provided
+    :param sleep_after_found: the amount of additional sleep after a successful result
+    :param scrape_state: the ScrapeState that remembers the results. Can be None
+    :return: how many seconds should pass before the next product, None if the scraping is over
+    """
+    if found.is_set() and not continue_after_found:
+        return None
+    product_id = next(product_ids, None)
+    if product_id is None:
+        return None
+    if await scrape_product_id(telegram_gamestop_sender, base_url, product_id, check_stock=check_stock,
+                               play_sound=play_sound, open_browser=open_browser, keywords=keywords,
+                               check_all_keywords=check_all_keywords, scrape_state=scrape_state):
+        found.set()
+        if not continue_after_found:
+            return None
+        return sleep_after_found + sleep
+    return sleep
+
+
 async def set_up_telegram_sender():
     telegram_sender = TelegramSender()
     await telegram_sender.start_client()
     return telegram_sender
 
 
-def set_up_gamestop():
-    gamestop_checker.fill_home_titles()
+async def set_up_gamestop(checker_config: dict):
+    gamestop_checker.set_parser_backend(checker_config.get('parser_backend', 'lxml'))
+    gamestop_checker.set_streaming_stock_check(get_bool(checker_config.get('streaming_stock_check')))
+    gamestop_checker.set_head_probe(get_bool(checker_config.get('head_probe')))
+    set_up_stock_selectors(checker_config)
+    if get_bool(checker_config.get('page_cache')):
+        gamestop_checker.set_page_cache(PageCache(int(checker_config.get('page_cache_max_entries', 256))))
+    parse_workers = int(checker_config.get('parse_workers', 0))
+    if parse_workers > 0:
+        max_pending = checker_config.get('parse_max_pending')
+        gamestop_checker.set_parse_executor(ParseExecutor(parse_workers, int(max_pending) if max_pending else None,
+                                                          checker_config.get('parse_executor', PROCESS_EXECUTOR)))
+    await gamestop_checker.fill_home_titles_async(checker_config.get('home_titles_cache'),
+                                                  float(checker_config.get('home_titles_ttl', 86400)),
+                                                  float(checker_config.get('home_titles_timeout', 10)))
 
 
-def set_up_logging():
-    logging.basicConfig(level=logging.INFO)
+def set_up_stock_selectors(checker_config: dict) -> None:
+    """
+    Sets the XPaths of the stock markers of the gamestop domains whose markup differs from the default one, configured
+    as check_box_two_xpath_<country> and radio_add_xpath_<country>
+    :param checker_config: the CheckerConfig section
+    :return: None
+    """
+    for site_url in gamestop_checker.ALLOWED_SITES_URLS:
+        country = get_country(site_url)
+        check_box_two_path = checker_config.get('check_box_two_xpath_' + country)
+        radio_add_path = checker_config.get('radio_add_xpath_' + country)
+        if check_box_two_path or radio_add_path:
+            set_stock_selectors(country, StockSelectors(check_box_two_path or CHECK_BOX_TWO_PATH,
+                                                        radio_add_path or RADIO_ADD_PATH))
 
 
-async def main():
-    stock_config = get_config_section_dic('StockConfig')
-    scrape_config = get_config_section_dic('ScrapeConfig')
-    search_config = get_config_section_dic('SearchConfig')
-    set_up_logging()
-    set_up_gamestop()
-    telegram_sender_check_stock = None
-    telegram_sender_scrape = None
-    telegram_sender_search = None
-    if get_bool(stock_config.get('telegram')) or get_bool(scrape_config.get('telegram')) or get_bool(
-            search_config.get('telegram')):
-        telegram_sender = await set_up_telegram_sender()
-        if get_bool(stock_config.get('telegram')):
-            telegram_sender_check_stock = telegram_sender
-        if get_bool(scrape_config.get('telegram')):
-            telegram_sender_scrape = telegram_sender
-        if get_bool(search_config.get('telegram')):
-            telegram_sender_search = telegram_sender
+def parse_countries(product_config: dict) -> list:
+    """
+    :param product_config: the ProductConfig section
+    :return: the list of the country codes of the domains to check, None for all of them
+    """
+    countries = product_config.get('countries')
+    return countries.split(', ') if countries else None
+
+
+def tear_down_gamestop() -> None:
+    gamestop_checker.stop_home_titles_refresh()
+    if gamestop_checker.PARSE_EXECUTOR is not None:
+        gamestop_checker.PARSE_EXECUTOR.close()
+        gamestop_checker.set_parse_executor(None)
+
+
+def set_up_notification_bus(notification_config: dict, metrics: Metrics = None) -> NotificationBus:
+    """
+    Creates and starts the NotificationBus with a consumer for Telegram, one for the browser and one for the sound
+    :param notification_config: the NotificationConfig section
+    :param metrics: the Metrics. Can be None
+    :return: the NotificationBus, or None if it is disabled and the notifications are delivered by the checks
+    """
+    global NOTIFICATION_BUS
+    if not get_bool(notification_config.get('enabled')):
+        return None
+    queue_size = int(notification_config.get('queue_size', 100))
+    retries = int(notification_config.get('retries', 3))
+    retry_backoff = float(notification_config.get('retry_backoff', 2))
+
+    async def send_message(notification: Notification) -> None:
+        await notification.telegram_sender.queue_message(notification.message, notification.on_failure)
+
+    async def open_browser(notification: Notification) -> None:
+        await asyncio.get_running_loop().run_in_executor(None, webbrowser.open, notification.url)
+
+    async def play_sound(notification: Notification) -> None:
+        await asyncio.get_running_loop().run_in_executor(
+            None, functools.partial(playsound, sound=SOUND_LOCATION, block=False))
+
+    notification_bus = NotificationBus(metrics)
+    notification_bus.add_consumer(NotificationConsumer(
+        'telegram', send_message, lambda notification: notification.telegram_sender is not None, queue_size, retries,
+        retry_backoff))
+    notification_bus.add_consumer(NotificationConsumer(
+        'browser', open_browser, lambda notification: notification.open_browser, queue_size, retries, retry_backoff))
+    notification_bus.add_consumer(NotificationConsumer(
+        'sound', play_sound, lambda notification: notification.play_sound, queue_size, retries, retry_backoff))
+    notification_bus.start()
+    if metrics is not None:
+        metrics.add_gauge('gamestop_notification_queue_depth', 'Notifications waiting to be delivered',
+                          notification_bus.queue_depth)
+    NOTIFICATION_BUS = notification_bus
+    return notification_bus
+
+
+def set_up_notification_dedup(notification_config: dict, stock_config: dict, scrape_config: dict,
+                              search_config: dict) -> None:
+    """
+    Sets up the NOTIFICATION_DEDUP cache, with the notification_cooldown of every section as the cooldown of its
+    event type
+    :return: None
+    """
+    global NOTIFICATION_DEDUP
+    NOTIFICATION_DEDUP = DedupCache(max_entries=int(notification_config.get('dedup_max_entries', 1024)))
+    for event_type, section_config in ((STOCK_EVENT, stock_config), (SCRAPE_EVENT, scrape_config),
+                                       (SEARCH_EVENT, search_config)):
+        NOTIFICATION_COOLDOWNS[event_type] = float(section_config.get('notification_cooldown', 0))
+
+
+async def set_up_metrics(metrics_config: dict, http_client: HttpClient) -> MetricsServer:
+    """
+    Creates the Metrics, shares them with the checks and the HttpClient and serves them on a local endpoint
+    :param metrics_config: the MetricsConfig section
+    :param http_client: the shared HttpClient
+    :return: the started MetricsServer, or None if the metrics are disabled
+    """
+    if not get_bool(metrics_config.get('enabled')):
+        return None
+    metrics = Metrics()
+    gamestop_checker.set_metrics(metrics)
+    http_client.metrics = metrics
+    if http_client.domain_guards is not None:
+        metrics.add_gauge('gamestop_paused_domains', 'Domains whose circuit is open or being probed',
+                          http_client.domain_guards.open_circuits)
+    if gamestop_checker.PAGE_CACHE is not None:
+        metrics.add_gauge('gamestop_page_cache_hit_rate', 'Fraction of the checks whose page did not change',
+                          gamestop_checker.PAGE_CACHE.hit_rate)
+    if gamestop_checker.PARSE_EXECUTOR is not None:
+        parse_executor = gamestop_checker.PARSE_EXECUTOR
+        metrics.add_gauge('gamestop_parse_jobs_pending', 'Pages being parsed or waiting for a parse worker',
+                          lambda: parse_executor.pending)
+    metrics_server = MetricsServer(metrics, metrics_config.get('host', '127.0.0.1'),
+                                   int(metrics_config.get('port', 9464)))
+    await metrics_server.start()
+    return metrics_server
+
+
+def set_up_profiling(profiling_config: dict) -> SamplingProfiler:
+    """
+    Enables the Profiler of the stages of the checks and, if sampling_seconds is set, starts sampling the event loop
+    thread for that many seconds, writing the collapsed stacks to the output_dir
+    :param profiling_config: the ProfilingConfig section
+    :return: the SamplingProfiler, or None if it was not started
+    """
+    global PROFILER
+    if not get_bool(profiling_config.get('enabled')):
+        return None
+    PROFILER = Profiler()
+    gamestop_checker.set_profiler(PROFILER)
+    sampling_seconds = float(profiling_config.get('sampling_seconds', 0))
+    if sampling_seconds <= 0:
+        return None
+    sampling_profiler = SamplingProfiler(float(profiling_config.get('sampling_interval', 0.005)))
+    sampling_profiler.start(sampling_seconds, os.path.join(profiling_config.get('output_dir', 'profiles'),
+                                                           'stacks-{}.folded'.format(int(time.time()))))
+    return sampling_profiler
 
+
+def stop_profiling(profiling_config: dict, sampling_profiler: SamplingProfiler) -> None:
+    """
+    Stops the sampling, if still running, and writes the timings of the stages to the output_dir
+    :param profiling_config: the ProfilingConfig section
+    :param sampling_profiler: the SamplingProfiler returned by set_up_profiling. Can be None
+    :return: None
+    """
+    global PROFILER
+    if sampling_profiler is not None:
+        sampling_profiler.stop()
+    if PROFILER is not None:
+        PROFILER.dump(os.path.join(profiling_config.get('output_dir', 'profiles'),
+                                   'spans-{}.txt'.format(int(time.time()))))
+        gamestop_checker.set_profiler(None)
+        PROFILER = None
+
+
+def set_up_result_history(history_config: dict) -> ResultHistory:
+    """
+    Opens the ResultHistory of the given section and shares it with the checks
+    :param history_config: the HistoryConfig section
+    :return: the ResultHistory, or None if it is disabled
+    """
+    if not get_bool(history_config.get('enabled')):
+        return None
+    result_history = ResultHistory(history_config.get('path', 'result_history.db'),
+                                   batch_size=int(history_config.get('batch_size', 200)),
+                                   flush_interval=float(history_config.get('flush_interval', 5)),
+                                   snapshot_dir=history_config.get('snapshot_dir') or None,
+                                   keep_seconds=float(history_config.get('keep_seconds', 2592000)))
+    gamestop_checker.set_result_history(result_history)
+    return result_history
+
+
+def set_up_scrape_state(scrape_config: dict) -> ScrapeState:
+    """
+    Opens the ScrapeState of the state_path of the given section
+    :param scrape_config: the ScrapeConfig section
+    :return: the ScrapeState, or None if there is no state_path
+    """
+    state_path = scrape_config.get('state_path')
+    if not state_path:
+        return None
+    return ScrapeState(state_path, revisit_home_after=float(scrape_config.get('revisit_home_after', 604800)),
+                       revisit_after=float(scrape_config.get('revisit_after', 86400)),
+                       frontier_first=get_bool(scrape_config.get('frontier_first')))
+
+
+def set_up_scrape_leases(scrape_config: dict) -> ScrapeLeases:
+    return ScrapeLeases(scrape_config.get('cluster_path', 'scrape_cluster.db'),
+                        lease_seconds=float(scrape_config.get('lease_seconds', 120)))
+
+
+def set_up_scrape_coordinator(scrape_config: dict, scrape_leases: ScrapeLeases,
+                              telegram_sender_scrape: TelegramSender = None, scrape_state: ScrapeState = None):
+    """
+    Creates the coordinator of the sharded scrape of the given section
+    :return: the coroutine of the coordinator, or None if there is no valid base_url
+    """
+    base_scrape_url = scrape_config.get('base_url')
+    if not base_scrape_url or not is_valid_url(base_scrape_url):
+        return None
+    return coordinate_scrape(telegram_sender_scrape, scrape_leases, int(scrape_config.get('start_id')),
+                             int(scrape_config.get('end_id')), base_scrape_url,
+                             play_sound=get_bool(scrape_config.get('sound_when_found')),
+                             open_browser=get_bool(scrape_config.get('open_browser_when_found')),
+                             continue_after_found=get_bool(scrape_config.get('continue_after_found')),
+                             chunk_size=int(scrape_config.get('chunk_size', 100)),
+                             local_workers=int(scrape_config.get('local_workers', 0)), scrape_state=scrape_state,
+                             poll_interval=float(scrape_config.get('poll_interval', 5)))
+
+
+def set_up_http_client(http_config: dict) -> HttpClient:
+    http_client = HttpClient.from_config(http_config)
+    gamestop_checker.set_http_client(http_client)
+    return http_client
+
+
+def set_up_adaptive_interval(adaptive_config: dict, section_config: dict, index: int = 0) -> AdaptiveInterval:
+    """
+    Creates the AdaptiveInterval of a url of the given section. min_sleep and max_sleep can be a single value or a
+    list of values, one for each url of the section
+    :param adaptive_config: the AdaptiveConfig section
+    :param section_config: the section of the url, e.g. StockConfig
+    :param index: the index of the url in the section
+    :return: the AdaptiveInterval, or None if adaptive intervals are disabled
+    """
+    if not get_bool(adaptive_config.get('enabled')):
+        return None
+    sleep = float(section_config.get('sleep'))
+    min_sleeps = section_config.get('min_sleep', str(sleep)).split(', ')
+    max_sleeps = section_config.get('max_sleep', str(sleep)).split(', ')
+    return AdaptiveInterval(base=sleep, floor=float(min_sleeps[min(index, len(min_sleeps) - 1)]),
+                            ceiling=float(max_sleeps[min(index, len(max_sleeps) - 1)]),
+                            backoff_factor=float(adaptive_config.get('backoff_factor', 1.5)),
+                            hot_hours=parse_hot_hours(adaptive_config.get('hot_hours')))
+
+
+def set_up_tasks(stock_config: dict, scrape_config: dict, search_config: dict, adaptive_config: dict,
+                 telegram_sender_check_stock: TelegramSender = None, telegram_sender_scrape: TelegramSender = None,
+                 telegram_sender_search: TelegramSender = None, scrape_state: ScrapeState = None,
+                 product_config: dict = None) -> list:
+    """
+    Creates a separate checking loop for every configured stock url, search and scrape, used when the scheduler is
+    disabled
+    :return: the list of the coroutines of the loops
+    """
     urls = stock_config.get('urls').split(', ')
     base_scrape_url = scrape_config.get('base_url')
     search_url = search_config.get('search_url')
     tasks = []
-    for url in urls:
+    for index, url in enumerate(urls):
         if is_valid_url(url):
             tasks.append(
                 check_for_stock_gamestop(telegram_sender_check_stock, url,
                                          open_browser=get_bool(stock_config.get('open_browser_when_found')),
                                          play_sound=get_bool(stock_config.get('sound_when_found')),
                                          sleep=int(stock_config.get('sleep')),
-                                         sleep_after_found=int(stock_config.get('sleep_after_found'))))
+                                         sleep_after_found=int(stock_config.get('sleep_after_found')),
+                                         adaptive_interval=set_up_adaptive_interval(adaptive_config, stock_config,
+                                                                                    index)))
+
+    products = product_config.get('products') if product_config is not None else None
+    for product_path in products.split(', ') if products else []:
+        tasks.append(
+            check_for_product_gamestop(telegram_sender_check_stock, product_path, parse_countries(product_config),
+                                       open_browser=get_bool(product_config.get('open_browser_when_found')),
+                                       play_sound=get_bool(product_config.get('sound_when_found')),
+                                       sleep=int(product_config.get('sleep')),
+                                       sleep_after_found=int(product_config.get('sleep_after_found'))))
 
-    if base_scrape_url and is_valid_url(base_scrape_url):
+    # The sharded scrape is run by the coordinator instead
+    if base_scrape_url and is_valid_url(base_scrape_url) and scrape_config.get('role', STANDALONE) == STANDALONE:
         tasks.append(
             scrape_gamestop_products(telegram_sender_scrape, int(scrape_config.get('start_id')),
                                      int(scrape_config.get('end_id')),
@@ -225,7 +1073,9 @@ async def main():
                                      scrape_config.get('keywords').split(', '),
                                      get_bool(scrape_config.get('check_all_keywords')), int(scrape_config.get('sleep')),
                                      get_bool(scrape_config.get('continue_after_found')),
-                                     int(scrape_config.get('sleep_after_found'))))
+                                     int(scrape_config.get('sleep_after_found')),
+                                     int(scrape_config.get('workers', 1)),
+                                     float(scrape_config.get('requests_per_second', 0)), scrape_state))
 
     if search_url and is_valid_url(search_url):
         tasks.append(
@@ -237,8 +1087,171 @@ async def main():
                                       keywords=search_config.get('keywords').split(', '),
                                       check_all_keywords=get_bool(search_config.get('check_all_keywords')),
                                       sleep=int(search_config.get('sleep')),
-                                      check_availability=get_bool(search_config.get('check_availability'))))
-    await asyncio.gather(*tasks)
+                                      check_availability=get_bool(search_config.get('check_availability')),
+                                      max_concurrent_checks=int(search_config.get('max_concurrent_checks', 4)),
+                                      adaptive_interval=set_up_adaptive_interval(adaptive_config, search_config)))
+    return tasks
+
+
+def set_up_scheduler(scheduler_config: dict, stock_config: dict, scrape_config: dict, search_config: dict,
+                     adaptive_config: dict, telegram_sender_check_stock: TelegramSender = None,
+                     telegram_sender_scrape: TelegramSender = None, telegram_sender_search: TelegramSender = None,
+                     scrape_state: ScrapeState = None, product_config: dict = None,
+                     http_config: dict = None) -> Scheduler:
+    """
+    Creates the Scheduler that owns a job for every configured stock url, search and scrape worker. The jobs of the
+    same domain are spaced by the domain_requests_per_second of the HttpConfig section, unless the domain guards already
+    pace the requests themselves
+    :return: the Scheduler
+    """
+    if http_config is None:
+        http_config = {}
+    domain_requests_per_second = 0 if get_bool(http_config.get('domain_guard')) else float(
+        http_config.get('domain_requests_per_second', 2))
+    scheduler = Scheduler(max_concurrent_jobs=int(scheduler_config.get('max_concurrent_jobs', 20)),
+                          jitter=float(scheduler_config.get('jitter', 0.1)),
+                          domain_requests_per_second=domain_requests_per_second)
+
+    for index, url in enumerate(stock_config.get('urls').split(', ')):
+        if is_valid_url(url):
+            sleep = int(stock_config.get('sleep'))
+            step = functools.partial(check_stock_once, telegram_sender_check_stock, url,
+                                     open_browser=get_bool(stock_config.get('open_browser_when_found')),
+                                     play_sound=get_bool(stock_config.get('sound_when_found')),
+                                     sleep=sleep, sleep_after_found=int(stock_config.get('sleep_after_found')),
+                                     adaptive_interval=set_up_adaptive_interval(adaptive_config, stock_config, index))
+            scheduler.add_job(Job('stock ' + url, step, url=url, interval=sleep))
+
+    products = product_config.get('products') if product_config is not None else None
+    for product_path in products.split(', ') if products else []:
+        sleep = int(product_config.get('sleep'))
+        step = functools.partial(check_product_once, telegram_sender_check_stock, product_path,
+                                 parse_countries(product_config),
+                                 open_browser=get_bool(product_config.get('open_browser_when_found')),
+                                 play_sound=get_bool(product_config.get('sound_when_found')),
+                                 sleep=sleep, sleep_after_found=int(product_config.get('sleep_after_found')))
+        # The requests to the single domains are paced by the domain guards of the HttpClient
+        scheduler.add_job(Job('product ' + product_path, step, interval=sleep))
+
+    base_scrape_url = scrape_config.get('base_url')
+    if base_scrape_url and is_valid_url(base_scrape_url) and scrape_config.get('role', STANDALONE) == STANDALONE:
+        workers = max(1, int(scrape_config.get('workers', 1)))
+        requests_per_second = float(scrape_config.get('requests_per_second', 0))
+        # The workers share the product_ids, and together they make requests_per_second requests
+        sleep = workers / requests_per_second if requests_per_second > 0 else int(scrape_config.get('sleep'))
+        product_ids = get_product_ids_to_scrape(base_scrape_url, int(scrape_config.get('start_id')),
+                                                int(scrape_config.get('end_id')), scrape_state)
+        found = asyncio.Event()
+        for worker in range(workers):
+            step = functools.partial(scrape_next_product, telegram_sender_scrape, product_ids, found,
+                                     base_scrape_url, check_stock=get_bool(scrape_config.get('check_stock')),
+                                     play_sound=get_bool(scrape_config.get('sound_when_found')),
+                                     open_browser=get_bool(scrape_config.get('open_browser_when_found')),
+                                     keywords=scrape_config.get('keywords').split(', '),
+                                     check_all_keywords=get_bool(scrape_config.get('check_all_keywords')),
+                                     sleep=sleep,
+                                     continue_after_found=get_bool(scrape_config.get('continue_after_found')),
+                                     sleep_after_found=int(scrape_config.get('sleep_after_found')),
+                                     scrape_state=scrape_state)
+            scheduler.add_job(Job('scrape worker ' + str(worker), step, url=base_scrape_url, interval=sleep))
+
+    search_url = search_config.get('search_url')
+    if search_url and is_valid_url(search_url):
+        sleep = int(search_config.get('sleep'))
+        step = functools.partial(check_search_once, telegram_sender_search,
+                                 play_sound=get_bool(search_config.get('sound_when_found')),
+                                 open_browser=get_bool(search_config.get('open_browser_when_found')),
+                                 search_url=search_url,
+                                 results=search_config.get('expected_results'),
+                                 keywords=search_config.get('keywords').split(', '),
+                                 check_all_keywords=get_bool(search_config.get('check_all_keywords')),
+                                 check_availability=get_bool(search_config.get('check_availability')),
+                                 sleep=sleep,
+                                 max_concurrent_checks=int(search_config.get('max_concurrent_checks', 4)),
+                                 adaptive_interval=set_up_adaptive_interval(adaptive_config, search_config))
+        scheduler.add_job(Job('search ' + search_url, step, url=search_url, interval=sleep))
+    return scheduler
+
+
+def set_up_logging():
+    logging.basicConfig(level=logging.INFO)
+
+
+async def main():
+    stock_config = get_config_section_dic('StockConfig')
+    scrape_config = get_config_section_dic('ScrapeConfig')
+    search_config = get_config_section_dic('SearchConfig')
+    http_config = get_config_section_dic('HttpConfig', optional=True)
+    checker_config = get_config_section_dic('CheckerConfig', optional=True)
+    scheduler_config = get_config_section_dic('SchedulerConfig', optional=True)
+    adaptive_config = get_config_section_dic('AdaptiveConfig', optional=True)
+    notification_config = get_config_section_dic('NotificationConfig', optional=True)
+    metrics_config = get_config_section_dic('MetricsConfig', optional=True)
+    profiling_config = get_config_section_dic('ProfilingConfig', optional=True)
+    product_config = get_config_section_dic('ProductConfig', optional=True)
+    history_config = get_config_section_dic('HistoryConfig', optional=True)
+    if scrape_config.get('role', STANDALONE) == WORKER:
+        await scrape_worker_main(scrape_config.get('worker_name'))
+        return
+    set_up_logging()
+    http_client = set_up_http_client(http_config)
+    await set_up_gamestop(checker_config)
+    metrics_server = await set_up_metrics(metrics_config, http_client)
+    sampling_profiler = set_up_profiling(profiling_config)
+    result_history = set_up_result_history(history_config)
+    scrape_state = set_up_scrape_state(scrape_config)
+    telegram_sender_check_stock = None
+    telegram_sender_scrape = None
+    telegram_sender_search = None
+    if get_bool(stock_config.get('telegram')) or get_bool(scrape_config.get('telegram')) or get_bool(
+            search_config.get('telegram')):
+        telegram_sender = await set_up_telegram_sender()
+        if get_bool(stock_config.get('telegram')):
+            telegram_sender_check_stock = telegram_sender
+        if get_bool(scrape_config.get('telegram')):
+            telegram_sender_scrape = telegram_sender
+        if get_bool(search_config.get('telegram')):
+            telegram_sender_search = telegram_sender
+    set_up_notification_dedup(notification_config, stock_config, scrape_config, search_config)
+    notification_bus = set_up_notification_bus(notification_config,
+                                               metrics_server.metrics if metrics_server is not None else None)
+    scrape_leases = set_up_scrape_leases(scrape_config) if scrape_config.get('role') == COORDINATOR else None
+    coordinators = []
+    if scrape_leases is not None:
+        coordinator = set_up_scrape_coordinator(scrape_config, scrape_leases, telegram_sender_scrape, scrape_state)
+        if coordinator is not None:
+            coordinators.append(coordinator)
+
+    try:
+        if get_bool(scheduler_config.get('enabled')):
+            scheduler = set_up_scheduler(scheduler_config, stock_config, scrape_config, search_config, adaptive_config,
+                                         telegram_sender_check_stock, telegram_sender_scrape, telegram_sender_search,
+                                         scrape_state, product_config, http_config)
+            await asyncio.gather(scheduler.run(), *coordinators)
+        else:
+            await asyncio.gather(*set_up_tasks(stock_config, scrape_config, search_config, adaptive_config,
+                                               telegram_sender_check_stock, telegram_sender_scrape,
+                                               telegram_sender_search, scrape_state, product_config), *coordinators)
+    finally:
+        if notification_bus is not None:
+            await notification_bus.stop()
+        if telegram_sender_check_stock or telegram_sender_scrape or telegram_sender_search:
+            await telegram_sender.close()
+        tear_down_gamestop()
+        if metrics_server is not None:
+            await metrics_server.stop()
+            gamestop_checker.set_metrics(None)
+        stop_profiling(profiling_config, sampling_profiler)
+        if result_history is not None:
+            gamestop_checker.set_result_history(None)
+            result_history.close()
+        if scrape_state is not None:
+            scrape_state.close()
+        if scrape_leases is not None:
+            scrape_leases.close()
+        gamestop_checker.set_http_client(None)
+        await gamestop_checker.close_fallback_http_client()
+        await http_client.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger('notification_bus')
+
+STOCK_EVENT = 'stock'
+SCRAPE_EVENT = 'scrape'
+SEARCH_EVENT = 'search'
+
+
+class Notification:
+    """
+    Something a check found, with the ways it should be notified
+    """
+
+    def __init__(self, message: str, url: str, event_type: str, telegram_sender=None, play_sound: bool = False,
+                 open_browser: bool = False, on_failure=None):
+        """
+        :param message: the message to send via Telegram
+        :param url: the url of the page that was checked, opened in the browser
+        :param event_type: the kind of check that found it, e.g. STOCK_EVENT
+        :param telegram_sender: the TelegramSender the message should be sent with. Can be None
+        :param play_sound: True if a sound should be played
+        :param open_browser: True if the url should be opened in the browser
+        :param on_failure: a function without arguments called when it could not be queued or a consumer gave up
+        delivering it. Can be None
+        """
+        self.message = message
+        self.url = url
+        self.event_type = event_type
+        self.telegram_sender = telegram_sender
+        self.play_sound = play_sound
+        self.open_browser = open_browser
+        self.on_failure = on_failure
+        self.created = time.monotonic()
+
+
+class NotificationConsumer:
+    """
+    Delivers the notifications it accepts in one way, e.g. via Telegram, retrying with an exponential backoff when
+    the delivery fails
+    """
+
+    def __init__(self, name: str, deliver, accepts, queue_size: int = 100, retries: int = 3,
+                 retry_backoff: float = 2):
+        """
+        :param name: the name of the consumer, used simply for logging
+        :param deliver: a coroutine function that delivers the given Notification and raises if it fails
+        :param accepts: a function that tells if the given Notification should be delivered by this consumer
+        :param queue_size: how many notifications can wait to be delivered. When full, the new ones are dropped
+        :param retries: how many times a failed delivery is retried
+        :param retry_backoff: the seconds before the first retry, doubled at every following one
+        """
+        self.name = name
+        self.deliver = deliver
+        self.accepts = accepts
+        self.retries = max(0, retries)
+        self.retry_backoff = retry_backoff
+        self.queue = asyncio.Queue(maxsize=max(1, queue_size))
+
+    async def run(self, metrics=None) -> None:
+        """
+        Delivers the queued notifications until cancelled
+        :param metrics: the Metrics that record the time from the detection to the delivery and the errors. Can be None
+        :return: None
+        """
+        while True:
+            notification = await self.queue.get()
+            try:
+                await self.__deliver_with_retries(notification, metrics)
+            finally:
+                self.queue.task_done()
+
+    async def __deliver_with_retries(self, notification: Notification, metrics) -> None:
+        backoff = self.retry_backoff
+        for attempt in range(self.retries + 1):
+            try:
+                await self.deliver(notification)
+                if metrics is not None:
+                    metrics.notification_seconds.observe(time.monotonic() - notification.created,
+                                                         notification.event_type, self.name)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as exception:
+                if metrics is not None:
+                    metrics.record_error(exception)
+                if attempt == self.retries:
+                    logger.exception('{} could not deliver {}, giving up'.format(self.name, notification.url))
+                    if notification.on_failure is not None:
+                        notification.on_failure()
+                    return
+                logger.warning('{} could not deliver {}, retrying in {} seconds'.format(self.name, notification.url,
+                                                                                       backoff))
+                await asyncio.sleep(backoff)
+                backoff *= 2
+
+
+class NotificationBus:
+    """
+    Decouples the checks from the notifications: a check publishes a Notification without waiting, and every consumer
+    delivers it from its own bounded queue, so that a slow Telegram round-trip delays neither the next check nor the
+    sound and the browser
+    """
+
+    def __init__(self, metrics=None):
+        """
+        :param metrics: the Metrics that record the delivery of the notifications. Can be None
+        """
+        self.metrics = metrics
+        self.consumers = []
+        self.__tasks = []
+
+    def add_consumer(self, consumer: NotificationConsumer) -> None:
+        """
+        Adds a consumer. It must be called before start
+        :param consumer: the NotificationConsumer
+        :return: None
+        """
+        self.consumers.append(consumer)
+
+    def publish(self, notification: Notification) -> bool:
+        """
+        Queues the given notification for all the consumers that accept it, without waiting for the delivery
+        :param notification: the Notification
+        :return: False if the queue of a consumer was full, in which case on_failure of the notification is called
+        """
+        queued = True
+        for consumer in self.consumers:
+            if consumer.accepts(notification):
+                try:
+                    consumer.queue.put_nowait(notification)
+                except asyncio.QueueFull:
+                    logger.warning('The queue of {} is full, dropping the notification of {}'.format(
+                        consumer.name, notification.url))
+                    queued = False
+        if not queued and notification.on_failure is not None:
+            notification.on_failure()
+        return queued
+
+    def queue_depth(self) -> int:
+        """
+        :return: how many notifications are waiting to be delivered, summed over all the consumers
+        """
+        return sum(consumer.queue.qsize() for consumer in self.consumers)
+
+    def start(self) -> None:
+        """
+        Starts a task for every consumer
+        :return: None
+        """
+        self.__tasks = [asyncio.ensure_future(consumer.run(self.metrics)) for consumer in self.consumers]
+
+    async def stop(self, timeout: float = 10) -> None:
+        """
+        Waits up to timeout seconds for the queued notifications to be delivered, then stops the consumers
+        :param timeout: the maximum number of seconds to wait
+        :return: None
+        """
+        if self.__tasks:
+            try:
+                await asyncio.wait_for(asyncio.gather(*[consumer.queue.join() for consumer in self.consumers]),
+                                       timeout)
+            except asyncio.TimeoutError:
+                logger.warning('Some notifications were not delivered before stopping')
+        for task in self.__tasks:
+            task.cancel()
+        await asyncio.gather(*self.__tasks, return_exceptions=True)
+        self.__tasks = []
@@ -1,11 +1,30 @@
+import asyncio
 import logging
-from datetime import datetime, timezone
 from telethon import TelegramClient, sync, events
+from telethon.errors import FloodWaitError
 from utils import utils
+from utils.dedup_cache import DedupCache
+from utils.rate_limiter import RateLimiter
 
 logger = logging.getLogger('telegram_sender')
 logger.setLevel(logging.INFO)
 
+# The maximum length of a telegram message, used to split the digests
+MAX_MESSAGE_LENGTH = 4096
+
+
+class MessageNotSentError(Exception):
+    """
+    Raised when a message could not be sent to some of the channels. Sending it again reaches only those channels
+    """
+
+    def __init__(self, channel_ids: list):
+        """
+        :param channel_ids: the ids of the channels the message was not sent to
+        """
+        super().__init__('The message was not sent to the channels {}'.format(channel_ids))
+        self.channel_ids = channel_ids
+
 
 class TelegramSender:
 
@@ -19,10 +38,26 @@ class TelegramSender:
         # Currently unused. It can be automatically inserted instead of the phone number when requested, so that the
         # messages are sent via the bot
         self.__token = config_dict.get('bot_token')
-        self.last_sent_message = None
+        # The (message, channel id) pairs sent in the last dedup_ttl seconds, which are not sent again
+        self.__sent_messages = DedupCache(float(config_dict.get('dedup_ttl', 60)),
+                                          int(config_dict.get('dedup_max_entries', 1024)))
         self.channel_ids = [int(i) for i in config_dict.get('channels').split(', ')]
 
+        # The (message, on_failure) pairs waiting to be sent together in a digest, every flush_interval seconds. 0 sends
+        # them right away
         self.message_queue = []
+        # The (digest, channel ids, on_failure list) of the digests that could not be sent to those channels yet
+        self.__unsent_digests = []
+        self.flush_interval = float(config_dict.get('flush_interval', 0))
+        # How many times the digests that could not be sent are sent again, each time after twice the wait
+        self.flush_retries = int(config_dict.get('flush_retries', 3))
+        self.__flush_task = None
+
+        # Telegram answers with a FloodWait when too many messages are sent: the sends to all the channels together are
+        # kept below messages_per_second, and a FloodWait postpones the message instead of failing it
+        self.__rate_limiter = RateLimiter(float(config_dict.get('messages_per_second', 20)),
+                                          burst=int(config_dict.get('messages_burst', 5)))
+        self.max_flood_waits = int(config_dict.get('max_flood_waits', 3))
 
         # The phone number (in case it's ever needed)
         self.__phone = config_dict.get('phone')
@@ -61,13 +96,99 @@ class TelegramSender:
         else:
             logger.info('The client is already connected!')
 
+    async def queue_message(self, message: str, on_failure=None) -> None:
+        """
+        Queues a message to be sent with the others in a digest at the next flush, so that a burst of messages, e.g.
+        many products found by a scrape, becomes a few messages. A digest that cannot be sent is sent again at a later
+        flush to the channels that missed it, up to flush_retries times. Without a flush_interval, it is sent right away
+        :param message: the message to send
+        :param on_failure: a function without arguments called if the digest of the message is dropped because it could
+        not be sent. Can be None
+        :return: None
+        :raises Exception: if the message could not be sent right away
+        """
+        if self.flush_interval <= 0:
+            await self.send_message(message)
+            return
+        self.message_queue.append((message, on_failure))
+        if self.__flush_task is None or self.__flush_task.done():
+            self.__flush_task = asyncio.ensure_future(self.__flush_later())
+
+    async def flush(self) -> bool:
+        """
+        Sends the digests that could not be sent before, to the channels that missed them, and then all the queued
+        messages, joined in as few messages as possible. If a digest cannot be sent, it and the following ones are kept
+        to be sent again, ahead of the messages queued in the meantime
+        :return: True if all the digests were sent
+        """
+        messages, self.message_queue = self.message_queue, []
+        digests, self.__unsent_digests = self.__unsent_digests, []
+        start = 0
+        for group in split_in_digests([message for message, _ in messages]):
+            on_failures = [on_failure for _, on_failure in messages[start:start + len(group)] if on_failure is not None]
+            digests.append(('\n'.join(group), self.channel_ids, on_failures))
+            start += len(group)
+        for index, (digest, channel_ids, on_failures) in enumerate(digests):
+            try:
+                await self.send_message(digest, *channel_ids)
+            except Exception as exception:
+                logger.exception('Could not send {} of {} digests, sending them again later'.format(
+                    len(digests) - index, len(digests)))
+                if isinstance(exception, MessageNotSentError):
+                    channel_ids = exception.channel_ids
+                self.__unsent_digests = [(digest, channel_ids, on_failures)] + digests[index + 1:]
+                return False
+        return True
+
+    async def close(self) -> None:
+        """
+        Sends the queued messages and stops waiting for the next flush
+        :return: None
+        """
+        if self.__flush_task is not None:
+            self.__flush_task.cancel()
+            self.__flush_task = None
+        if not await self.flush():
+            self.__drop_unsent_digests()
+
+    async def __flush_later(self) -> None:
+        """
+        Flushes the queue after flush_interval seconds, trying again with twice the wait while some digests could not
+        be sent, and dropping them after flush_retries retries
+        :return: None
+        """
+        for retry in range(self.flush_retries + 1):
+            await asyncio.sleep(self.flush_interval * 2 ** retry)
+            if await self.flush():
+                return
+        self.__drop_unsent_digests()
+        if self.message_queue:
+            # The messages queued after the last retry wait for a flush of their own
+            self.__flush_task = asyncio.ensure_future(self.__flush_later())
+
+    def __drop_unsent_digests(self) -> None:
+        """
+        Drops the digests that could not be sent, calling the on_failure of each of their messages
+        :return: None
+        """
+        digests, self.__unsent_digests = self.__unsent_digests, []
+        if digests:
+            logger.error('Could not send {} digests, dropping them'.format(len(digests)))
+        for _, _, on_failures in digests:
+            for on_failure in on_failures:
+                on_failure()
+
     async def send_message(self, message: str, *channel_ids: int) -> None:
         """
-        Sends a message to the given channels or, if not provided, to the channels in the self.channel_ids field
+        Sends a message to the given channels or, if not provided, to the channels in the self.channel_ids field. The
+        channels are sent to concurrently, and a channel that already received the message in the last dedup_ttl
+        seconds is skipped, so that sending a message again after a failure reaches only the channels that missed it
 
         :param message: the message to send
         :param channel_ids: the channel ids the message should be sent to
         :return: None
+        :raises MessageNotSentError: if the message could not be sent to some channels, caused by the first error
+        :raises ConnectionError: if the client could not reconnect
         """
         if not channel_ids:
             channel_ids = self.channel_ids
@@ -75,31 +196,69 @@ class TelegramSender:
             if not self.client.is_connected():
                 await self.force_reconnect()
             if message:
-                if not self.__check_for_duplicated_message(message):
-                    for channel_id in channel_ids:
-                        await self.client.send_message(channel_id, message=message)
-                    self.last_sent_message = MessageDateRelation(message=message, date=datetime.now(timezone.utc))
+                channel_ids = [channel_id for channel_id in channel_ids
+                               if not self.__sent_messages.seen((message, channel_id))]
+                if channel_ids:
+                    results = await asyncio.gather(*[self.__send_to_channel(channel_id, message)
+                                                     for channel_id in channel_ids], return_exceptions=True)
+                    errors = [(channel_id, result) for channel_id, result in zip(channel_ids, results)
+                              if isinstance(result, BaseException)]
+                    for channel_id, _ in errors:
+                        # It was not sent, so it must not be suppressed when it is sent again
+                        self.__sent_messages.forget((message, channel_id))
+                    if errors:
+                        raise MessageNotSentError([channel_id for channel_id, _ in errors]) from errors[0][1]
                 else:
-                    logger.warning('Last message equal check found the same message!')
+                    logger.warning('The same message was already sent recently!')
             else:
                 logger.warning('Cannot send an empty message!')
         except ConnectionError:
             logger.exception('Connection error!')
+            raise
 
-    def __check_for_duplicated_message(self, message: str) -> bool:
+    async def __send_to_channel(self, channel_id: int, message: str) -> None:
         """
-        Checks whether the given messages is equals to the previous message that was sent in the past 60 seconds
-        :param message:
+        Sends a message to a single channel, waiting and trying again when Telegram answers with a FloodWait
+        :param channel_id: the channel id
+        :param message: the message to send
         :return: None
         """
-        if self.last_sent_message and self.last_sent_message.message == message:
-            if (datetime.now(timezone.utc) - self.last_sent_message.date).total_seconds() < 60:
-                return True
-        return False
+        for flood_waits in range(self.max_flood_waits + 1):
+            await self.__rate_limiter.acquire()
+            try:
+                await self.client.send_message(channel_id, message=message)
+                return
+            except FloodWaitError as e:
+                if flood_waits == self.max_flood_waits:
+                    raise
+                logger.warning('FloodWait for channel {}, sending again in {} seconds'.format(channel_id, e.seconds))
+                await asyncio.sleep(e.seconds)
+
 
+def build_digests(messages: list) -> list:
+    """
+    Joins the given messages, one for each line, in as few messages as possible within MAX_MESSAGE_LENGTH
+    :param messages: the messages
+    :return: the list of the digests
+    """
+    return ['\n'.join(group) for group in split_in_digests(messages)]
 
-class MessageDateRelation:
 
-    def __init__(self, message: str = None, date: datetime = None):
-        self.message = message
-        self.date = date
+def split_in_digests(messages: list) -> list:
+    """
+    Splits the given messages, in order, in as few groups as possible whose lines joined are within MAX_MESSAGE_LENGTH
+    :param messages: the messages
+    :return: the list of the groups, each one a list of messages
+    """
+    groups = []
+    current = []
+    length = 0
+    for message in messages:
+        if current and length + 1 + len(message) > MAX_MESSAGE_LENGTH:
+            groups.append(current)
+            current = []
+        length = length + 1 + len(message) if current else len(message)
+        current.append(message)
+    if current:
+        groups.append(current)
+    return groups
@@ -0,0 +1,233 @@
+"""
+Offline benchmark of the parsing and keyword matching hot paths of gamestop_checker, run against the pre-saved html
+pages of tests/checkers_tests/html_pages. The search check is run end to end through a local stand-in HTTP server, so
+that the time spent fetching can be told apart from the time spent parsing and matching.
+
+Run it from this directory with: python parsing_benchmark.py
+It exits with status 1 if any benchmark is slower, or uses more memory, than the thresholds in
+benchmark_thresholds.cfg
+"""
+import argparse
+import asyncio
+import gc
+import sys
+import time
+import tracemalloc
+from urllib.parse import urlsplit
+
+from aiohttp import web
+from bs4 import BeautifulSoup
+
+from checkers import gamestop_checker
+from checkers.parsed_page import ParsedPage
+from checkers.stock_parsers import SELECTOLAX_BACKEND, StreamingStockScanner, find_stock_markers, \
+    is_backend_available
+from utils.http_client import HttpClient
+from utils.utils import get_config_section_dic
+
+HTML_PAGES_PATH = '../checkers_tests/html_pages/'
+PRODUCT_PAGES = ('available_product_it_1.html', 'unavailable_product_it_1.html')
+SEARCH_PAGE = 'search_url.html'
+SEARCH_URL = 'https://www.gamestop.it/SearchResult/QuickSearch?q=elden+ring'
+PRODUCT_URL = 'https://www.gamestop.it/PS4/Games/136782'
+KEYWORDS = ['elden ring', 'collector', 'string_not_in_html_page']
+THRESHOLDS_PATH = './benchmark_thresholds.cfg'
+
+
+class BenchmarkResult:
+
+    def __init__(self, name: str, pages: int, seconds: float, stages: dict = None, peak_memory_kb: float = None):
+        """
+        :param name: the name of the benchmark
+        :param pages: how many pages were processed
+        :param seconds: the total time spent
+        :param stages: the total time spent in every stage, by stage name
+        :param peak_memory_kb: the peak memory allocated by Python while processing a single page, as traced by
+        tracemalloc. The memory allocated by the C parsers is not included
+        """
+        self.name = name
+        self.pages = pages
+        self.seconds = seconds
+        self.stages = stages if stages is not None else {}
+        self.peak_memory_kb = peak_memory_kb
+
+    def pages_per_second(self) -> float:
+        return self.pages / self.seconds if self.seconds else float('inf')
+
+    def __str__(self) -> str:
+        stages = ', '.join('{} {:.2f} ms'.format(stage, seconds * 1000 / self.pages)
+                           for stage, seconds in self.stages.items())
+        memory = '{:.0f} KB'.format(self.peak_memory_kb) if self.peak_memory_kb is not None else '-'
+        return '{:<20} {:>10.1f} pages/s {:>10.2f} ms/page {:>10} peak   {}'.format(
+            self.name, self.pages_per_second(), self.seconds * 1000 / self.pages, memory, stages)
+
+
+def read_page(file_name: str) -> str:
+    with open(HTML_PAGES_PATH + file_name, encoding='utf-8') as f:
+        return f.read()
+
+
+def measure_peak_memory(function, html_text: str) -> float:
+    """
+    Measures the peak memory allocated by a single call of the given function
+    :param function: the function taking the html page
+    :param html_text: the html page
+    :return: the peak memory in KB
+    """
+    gc.collect()
+    tracemalloc.start()
+    try:
+        function(html_text)
+        return tracemalloc.get_traced_memory()[1] / 1024
+    finally:
+        tracemalloc.stop()
+
+
+def run_sync_benchmark(name: str, function, pages: list, iterations: int) -> BenchmarkResult:
+    """
+    Runs the given function on every page for the given number of iterations
+    :param name: the name of the benchmark
+    :param function: the function taking the html page
+    :param pages: the html pages
+    :param iterations: how many times every page is processed
+    :return: the BenchmarkResult
+    """
+    function(pages[0])
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for html_text in pages:
+            function(html_text)
+    seconds = time.perf_counter() - start
+    peak_memory_kb = max(measure_peak_memory(function, html_text) for html_text in pages)
+    return BenchmarkResult(name, iterations * len(pages), seconds, peak_memory_kb=peak_memory_kb)
+
+
+def run_keywords_benchmark(pages: list, iterations: int) -> BenchmarkResult:
+    """
+    Times the parsing of the page and the matching of the keywords as separate stages
+    """
+    check_keywords_from_text = getattr(gamestop_checker, '__check_keywords_from_text')
+    stages = {'parse': 0.0, 'match': 0.0}
+    for _ in range(iterations):
+        for html_text in pages:
+            start = time.perf_counter()
+            page = ParsedPage(html_text, PRODUCT_URL)
+            page.body_texts
+            parsed = time.perf_counter()
+            check_keywords_from_text(page=page, url=PRODUCT_URL, keywords=KEYWORDS)
+            stages['parse'] += parsed - start
+            stages['match'] += time.perf_counter() - parsed
+    return BenchmarkResult('keywords', iterations * len(pages), sum(stages.values()), stages,
+                           max(measure_peak_memory(lambda text: ParsedPage(text).body_texts, html_text)
+                               for html_text in pages))
+
+
+async def run_check_search_benchmark(search_page: str, iterations: int) -> BenchmarkResult:
+    """
+    Runs check_search end to end, fetching the search page from a local stand-in server instead of gamestop
+    """
+    app = web.Application()
+    app.router.add_get('/{tail:.*}', lambda request: web.Response(text=search_page, content_type='text/html'))
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    local_url = 'http://127.0.0.1:{}'.format(runner.addresses[0][1])
+    http_client = HttpClient()
+    stages = {'fetch': 0.0}
+
+    async def get_from_local_server(url: str) -> str:
+        start = time.perf_counter()
+        split_url = urlsplit(url)
+        text = await http_client.get_text(local_url + split_url.path + '?' + split_url.query)
+        stages['fetch'] += time.perf_counter() - start
+        return text
+
+    get = getattr(gamestop_checker, '__get')
+    setattr(gamestop_checker, '__get', get_from_local_server)
+    try:
+        await gamestop_checker.check_search(SEARCH_URL, 12, False, KEYWORDS)
+        stages['fetch'] = 0.0
+        start = time.perf_counter()
+        for _ in range(iterations):
+            await gamestop_checker.check_search(SEARCH_URL, 12, False, KEYWORDS)
+        seconds = time.perf_counter() - start
+    finally:
+        setattr(gamestop_checker, '__get', get)
+        await http_client.close()
+        await runner.cleanup()
+    stages['parse and match'] = seconds - stages['fetch']
+    return BenchmarkResult('check_search', iterations, seconds, stages)
+
+
+def stream_stock_markers(html_text: str, chunk_size: int = 16384):
+    scanner = StreamingStockScanner()
+    for i in range(0, len(html_text), chunk_size):
+        stock_markers = scanner.feed(html_text[i:i + chunk_size])
+        if stock_markers is not None:
+            return stock_markers
+    return scanner.close()
+
+
+def run_benchmarks(iterations: int) -> list:
+    product_pages = [read_page(file_name) for file_name in PRODUCT_PAGES]
+    search_page = read_page(SEARCH_PAGE)
+    is_not_home_page = getattr(gamestop_checker, '__is_not_home_page')
+    gamestop_checker.GS_HOME_TITLES[:] = ['Home | GameStop Italia']
+
+    results = [
+        run_sync_benchmark('soup_stock', lambda text: gamestop_checker.check_stock_from_soup(
+            BeautifulSoup(text, 'html.parser'), PRODUCT_URL), product_pages, max(1, iterations // 10)),
+        run_sync_benchmark('lxml_stock', lambda text: gamestop_checker.check_stock_from_page(
+            ParsedPage(text), PRODUCT_URL), product_pages, iterations),
+        run_sync_benchmark('streaming_stock', stream_stock_markers, product_pages, iterations),
+        run_keywords_benchmark(product_pages + [search_page], iterations),
+        run_sync_benchmark('home_page', lambda text: is_not_home_page(ParsedPage(text), PRODUCT_URL), product_pages,
+                           iterations),
+    ]
+    if is_backend_available(SELECTOLAX_BACKEND):
+        results.insert(2, run_sync_benchmark('selectolax_stock', lambda text: find_stock_markers(
+            text, SELECTOLAX_BACKEND), product_pages, iterations))
+    results.append(asyncio.run(run_check_search_benchmark(search_page, iterations)))
+    return results
+
+
+def check_thresholds(results: list, thresholds_path: str = THRESHOLDS_PATH) -> list:
+    """
+    Compares the results with the minimum pages per second and the maximum peak memory of the thresholds file
+    :param results: the BenchmarkResults
+    :param thresholds_path: the path to the thresholds file
+    :return: the list of the regressions found, as messages
+    """
+    min_pages_per_second = get_config_section_dic('MinPagesPerSecond', thresholds_path)
+    max_peak_memory_kb = get_config_section_dic('MaxPeakMemoryKB', thresholds_path)
+    regressions = []
+    for result in results:
+        if result.name in min_pages_per_second and result.pages_per_second() < float(
+                min_pages_per_second[result.name]):
+            regressions.append('{} is slower than {} pages/s'.format(result.name, min_pages_per_second[result.name]))
+        if result.name in max_peak_memory_kb and result.peak_memory_kb is not None and result.peak_memory_kb > float(
+                max_peak_memory_kb[result.name]):
+            regressions.append('{} uses more than {} KB'.format(result.name, max_peak_memory_kb[result.name]))
+    return regressions
+
+
+def main() -> int:
+    arg_parser = argparse.ArgumentParser(description='Benchmark of the parsing and keyword matching hot paths')
+    arg_parser.add_argument('--iterations', type=int, default=50, help='how many times every page is processed')
+    arg_parser.add_argument('--no-thresholds', action='store_true', help='do not check the regression thresholds')
+    args = arg_parser.parse_args()
+
+    results = run_benchmarks(args.iterations)
+    for result in results:
+        print(result)
+    if args.no_thresholds:
+        return 0
+    regressions = check_thresholds(results)
+    for regression in regressions:
+        print('REGRESSION: ' + regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,3 +1,7 @@
+import asyncio
+import os
+import sqlite3
+import tempfile
 import unittest
 import uuid
 
@@ -5,6 +9,13 @@ import mockito
 
 from checkers import gamestop_checker
 from unittest import IsolatedAsyncioTestCase
+from multidict import CIMultiDict
+
+from utils.domain_guard import DomainUnavailableError
+from utils.http_client import HttpResponse
+from utils.parse_executor import THREAD_EXECUTOR, ParseExecutor
+from utils.result_history import SCRAPE_CHECK, SEARCH_CHECK, STOCK_CHECK, ResultHistory
+from utils.scrape_state import MATCHED, NO_MATCH, NOT_FOUND, REDIRECTED_HOME
 
 
 async def mock_get(html_page: str):
@@ -66,6 +77,210 @@ class MyTestCase(IsolatedAsyncioTestCase):
             result = await gamestop_checker.check_search(base_url, 11, False, [string_not_in_html_page], False)
             self.assertTrue(result)
 
+    # Checks that, when the results are different from the expected ones, the availability of the results is checked
+    # concurrently and that the search is successful only if one of them is in stock
+    async def test_check_search_availability(self):
+        base_url = 'https://www.gamestop.it/SearchResult/QuickSearch?q=elden+ring'
+        available_url = 'https://www.gamestop.it/PS4/Games/134750/elden-ring-collectors-edition'
+        with open('./html_pages/search_url.html', encoding='utf-8') as f:
+            html_page = f.read()
+        checked_urls = []
+
+        async def mock_check_stock(url):
+            checked_urls.append(url)
+            return url == available_url
+
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(base_url)).thenReturn(
+            mock_get(html_page)).thenReturn(mock_get(html_page))
+        mockito.when(gamestop_checker).check_stock(...).thenAnswer(mock_check_stock)
+        try:
+            result = await gamestop_checker.check_search(base_url, 11, True, [], False, max_concurrent_checks=2)
+            self.assertTrue(result)
+            self.assertIn(available_url, checked_urls)
+
+            available_url = None
+            checked_urls.clear()
+            result = await gamestop_checker.check_search(base_url, 11, True, [], False)
+            self.assertFalse(result)
+            self.assertEqual(12, len(checked_urls))
+        finally:
+            mockito.unstub()
+
+    # Checks that the checks still running when a result in stock is found are cancelled before the search returns
+    async def test_check_search_cancels_remaining_checks(self):
+        base_url = 'https://www.gamestop.it/SearchResult/QuickSearch?q=elden+ring'
+        available_url = 'https://www.gamestop.it/PS4/Games/134750/elden-ring-collectors-edition'
+        with open('./html_pages/search_url.html', encoding='utf-8') as f:
+            html_page = f.read()
+        cancelled_urls = []
+
+        async def mock_check_stock(url):
+            if url == available_url:
+                return True
+            try:
+                await asyncio.sleep(60)
+            except asyncio.CancelledError:
+                cancelled_urls.append(url)
+                raise
+            return False
+
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(base_url)).thenReturn(mock_get(html_page))
+        mockito.when(gamestop_checker).check_stock(...).thenAnswer(mock_check_stock)
+        try:
+            self.assertTrue(await gamestop_checker.check_search(base_url, 11, True, [], False,
+                                                                max_concurrent_checks=12))
+            self.assertEqual(11, len(cancelled_urls))
+        finally:
+            mockito.unstub()
+
+    async def test_scrape_product(self):
+        url = 'https://www.gamestop.it/PS4/Games/136782'
+        home_url = 'https://www.gamestop.it/PS4/Games/1'
+        with open('./html_pages/available_product_it_1.html', encoding='utf-8') as f:
+            html_page = f.read()
+        home_page = '<html><head><title>Home</title></head><body>elden ring</body></html>'
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__get_response')(
+            mockito.eq(url), skip_redirect_body=mockito.any()).thenReturn(
+            mock_get(HttpResponse(url, 200, CIMultiDict(), html_page))).thenReturn(
+            mock_get(HttpResponse(url, 200, CIMultiDict(), html_page)))
+        # The home page served at the product url, without a redirect, is recognized from its title
+        mockito.when(gamestop_checker).__getattr__('__get_response')(
+            mockito.eq(home_url), skip_redirect_body=mockito.any()).thenReturn(
+            mock_get(HttpResponse(home_url, 200, CIMultiDict(), home_page)))
+        gamestop_checker.GS_HOME_TITLES.append('Home')
+        try:
+            status, page = await gamestop_checker.scrape_product(url, ['a'])
+            self.assertEqual(MATCHED, status)
+            self.assertIsNotNone(page)
+            status, page = await gamestop_checker.scrape_product(url, [str(uuid.uuid4())])
+            self.assertEqual(NO_MATCH, status)
+            self.assertIsNone(page)
+            status, page = await gamestop_checker.scrape_product(home_url, ['elden'])
+            self.assertEqual(REDIRECTED_HOME, status)
+            self.assertIsNone(page)
+        finally:
+            gamestop_checker.GS_HOME_TITLES.remove('Home')
+
+    # The redirect to the home page is recognized from the final url, without the body
+    async def test_scrape_product_redirected_home(self):
+        url = 'https://www.gamestop.it/PS5/Games/1'
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__get_response')(
+            mockito.eq(url), skip_redirect_body=mockito.any()).thenReturn(
+            mock_get(HttpResponse('https://www.gamestop.it/', 200, CIMultiDict(), '')))
+        self.assertEqual((REDIRECTED_HOME, None), await gamestop_checker.scrape_product(url, ['elden']))
+
+    # The same verdicts are given when the pages are parsed in a ParseExecutor
+    async def test_offloaded_parsing(self):
+        product_url = 'https://www.gamestop.it/PS4/Games/136782'
+        search_url = 'https://www.gamestop.it/SearchResult/QuickSearch?q=elden+ring'
+        with open('./html_pages/available_product_it_1.html', encoding='utf-8') as f:
+            product_page = f.read()
+        with open('./html_pages/search_url.html', encoding='utf-8') as f:
+            search_page = f.read()
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(product_url)).thenReturn(
+            mock_get(product_page))
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(search_url)).thenReturn(
+            mock_get(search_page)).thenReturn(mock_get(search_page))
+        mockito.when(gamestop_checker).__getattr__('__get_response')(
+            mockito.eq(product_url), skip_redirect_body=mockito.any()).thenReturn(
+            mock_get(HttpResponse(product_url, 200, CIMultiDict(), product_page))).thenReturn(
+            mock_get(HttpResponse(product_url, 200, CIMultiDict(), product_page)))
+        parse_executor = ParseExecutor(2, kind=THREAD_EXECUTOR)
+        gamestop_checker.set_parse_executor(parse_executor)
+        try:
+            self.assertTrue(await gamestop_checker.check_stock(product_url))
+            self.assertTrue(await gamestop_checker.check_search(search_url, 12, False, ['elden'], False))
+            self.assertFalse(await gamestop_checker.check_search(search_url, 12, False, [str(uuid.uuid4())], False))
+            status, page = await gamestop_checker.scrape_product(product_url, ['a'])
+            self.assertEqual(MATCHED, status)
+            self.assertIsNotNone(page)
+            status, page = await gamestop_checker.scrape_product(product_url, [str(uuid.uuid4())])
+            self.assertEqual(NO_MATCH, status)
+            self.assertIsNone(page)
+        finally:
+            gamestop_checker.set_parse_executor(None)
+            parse_executor.close()
+
+    # A paused domain is not a missing product, and check_if_page_contains_keywords does not hide the fetch errors
+    async def test_fetch_errors(self):
+        paused_url = 'https://www.gamestop.it/PS5/Games/2'
+        broken_url = 'https://www.gamestop.it/PS5/Games/3'
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__get_response')(
+            mockito.eq(paused_url), skip_redirect_body=mockito.any()).thenRaise(
+            DomainUnavailableError('www.gamestop.it', 60))
+        mockito.when(gamestop_checker).__getattr__('__get_response')(
+            mockito.eq(broken_url), skip_redirect_body=mockito.any()).thenRaise(ConnectionError())
+        with self.assertRaises(DomainUnavailableError):
+            await gamestop_checker.scrape_product(paused_url, ['elden'])
+        self.assertEqual((NOT_FOUND, None), await gamestop_checker.scrape_product(broken_url, ['elden']))
+        with self.assertRaises(ConnectionError):
+            await gamestop_checker.check_if_page_contains_keywords(broken_url, ['elden'])
+
+    # A product is checked on every domain at once, and a paused domain does not hide the others
+    async def test_check_stock_everywhere(self):
+        with open('./html_pages/available_product_it_1.html', encoding='utf-8') as f:
+            available_page = f.read()
+        with open('./html_pages/unavailable_product_it_1.html', encoding='utf-8') as f:
+            unavailable_page = f.read()
+        urls = gamestop_checker.product_urls('/PS4/Games/136782/', ['it', 'de', 'ch'])
+        self.assertEqual({'de': 'https://www.gamestop.de/PS4/Games/136782',
+                          'it': 'https://www.gamestop.it/PS4/Games/136782',
+                          'ch': 'https://www.gamestop.ch/PS4/Games/136782'}, urls)
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(urls['it'])).thenReturn(
+            mock_get(available_page))
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(urls['de'])).thenReturn(
+            mock_get(unavailable_page))
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(urls['ch'])).thenRaise(
+            DomainUnavailableError('www.gamestop.ch', 60))
+        self.assertEqual({'de': False, 'it': True, 'ch': None},
+                         await gamestop_checker.check_stock_everywhere('PS4/Games/136782', ['it', 'de', 'ch']))
+
+    # Every check records its result in the result history, a failed fetch included
+    async def test_result_history(self):
+        stock_url = 'https://www.gamestop.it/PS4/Games/136782'
+        search_url = 'https://www.gamestop.it/SearchResult/QuickSearch?q=elden+ring'
+        scrape_url = 'https://www.gamestop.it/PS5/Games/1'
+        broken_url = 'https://www.gamestop.de/PS4/Games/136782'
+        with open('./html_pages/available_product_it_1.html', encoding='utf-8') as f:
+            product_page = f.read()
+        with open('./html_pages/search_url.html', encoding='utf-8') as f:
+            search_page = f.read()
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(stock_url)).thenReturn(mock_get(product_page))
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(search_url)).thenReturn(mock_get(search_page))
+        mockito.when(gamestop_checker).__getattr__('__get')(mockito.eq(broken_url)).thenRaise(ConnectionError())
+        mockito.when(gamestop_checker).__getattr__('__get_response')(
+            mockito.eq(scrape_url), skip_redirect_body=mockito.any()).thenReturn(
+            mock_get(HttpResponse('https://www.gamestop.it/', 200, CIMultiDict(), '')))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'result_history.db')
+            result_history = ResultHistory(path)
+            gamestop_checker.set_result_history(result_history)
+            try:
+                self.assertTrue(await gamestop_checker.check_stock(stock_url))
+                self.assertFalse(await gamestop_checker.check_stock(broken_url))
+                self.assertTrue(await gamestop_checker.check_search(search_url, 12, False, ['elden']))
+                await gamestop_checker.scrape_product(scrape_url, ['elden'])
+            finally:
+                gamestop_checker.set_result_history(None)
+                result_history.close()
+            connection = sqlite3.connect(path)
+            try:
+                rows = connection.execute('SELECT kind, url, available, result_count, status FROM results '
+                                          'ORDER BY checked_at').fetchall()
+                latencies = [latency for latency, in connection.execute('SELECT latency FROM results')]
+            finally:
+                connection.close()
+        self.assertEqual([(STOCK_CHECK, stock_url, 1, None, None), (STOCK_CHECK, broken_url, None, None, None),
+                          (SEARCH_CHECK, search_url, 1, 12, None),
+                          (SCRAPE_CHECK, scrape_url, None, None, REDIRECTED_HOME)], rows)
+        self.assertTrue(all(latency >= 0 for latency in latencies))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,90 @@
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+import mockito
+from multidict import CIMultiDict
+
+from checkers import gamestop_checker
+from utils.http_client import HttpResponse
+from utils.page_cache import PageCache
+from utils.scrape_state import REDIRECTED_HOME
+
+
+async def mock_get_response(response: HttpResponse):
+    return response
+
+
+# This test will not actually make any http requests but will use pre-saved html pages
+class GamestopCheckerCacheTest(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.page_cache = PageCache()
+        gamestop_checker.set_page_cache(self.page_cache)
+
+    def tearDown(self):
+        gamestop_checker.set_page_cache(None)
+        mockito.unstub()
+
+    # The second check is answered with 304 Not Modified and the third one with the same page: the verdict of the
+    # first check is reused
+    async def test_check_stock_reuses_verdict(self):
+        url = 'https://www.gamestop.it/PS4/Games/136782'
+        with open('./html_pages/available_product_it_1.html', encoding='utf-8') as f:
+            html_page = f.read()
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__get_response')(mockito.eq(url), mockito.any()).thenReturn(
+            mock_get_response(HttpResponse(url, 200, CIMultiDict({'ETag': '"1"'}), html_page))).thenReturn(
+            mock_get_response(HttpResponse(url, 304, CIMultiDict(), ''))).thenReturn(
+            mock_get_response(HttpResponse(url, 200, CIMultiDict(), html_page)))
+
+        self.assertTrue(await gamestop_checker.check_stock(url))
+        self.assertEqual(1, self.page_cache.misses)
+        self.assertTrue(await gamestop_checker.check_stock(url))
+        self.assertTrue(await gamestop_checker.check_stock(url))
+        self.assertEqual(2, self.page_cache.hits)
+        self.assertEqual(1, self.page_cache.misses)
+
+    async def test_check_search_detects_change(self):
+        url = 'https://www.gamestop.it/SearchResult/QuickSearch?q=elden+ring'
+        with open('./html_pages/search_url.html', encoding='utf-8') as f:
+            html_page = f.read()
+        changed_html_page = html_page.replace('searchSumCount">12<', 'searchSumCount">13<')
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__get_response')(mockito.eq(url), mockito.any()).thenReturn(
+            mock_get_response(HttpResponse(url, 200, CIMultiDict(), html_page))).thenReturn(
+            mock_get_response(HttpResponse(url, 200, CIMultiDict(), html_page))).thenReturn(
+            mock_get_response(HttpResponse(url, 200, CIMultiDict(), changed_html_page)))
+
+        string_not_in_html_page = 'string_not_in_html_page_for_test'
+        self.assertFalse(await gamestop_checker.check_search(url, 12, False, [string_not_in_html_page], False))
+        self.assertFalse(await gamestop_checker.check_search(url, 12, False, [string_not_in_html_page], False))
+        self.assertEqual(1, self.page_cache.hits)
+        self.assertFalse(gamestop_checker.page_changed(url))
+        self.assertTrue(await gamestop_checker.check_search(url, 12, False, [string_not_in_html_page], False))
+        self.assertEqual(2, self.page_cache.misses)
+        self.assertTrue(gamestop_checker.page_changed(url))
+
+    # With the probe, an id redirecting to the home page is classified without downloading the page
+    async def test_probe_product(self):
+        dead_url = 'https://www.gamestop.it/PS5/Games/1'
+        live_url = 'https://www.gamestop.it/PS5/Games/2'
+        mockito.spy(gamestop_checker)
+        mockito.when(gamestop_checker).__getattr__('__head')(mockito.eq(dead_url)).thenReturn(
+            mock_get_response(HttpResponse(dead_url, 302, CIMultiDict({'Location': '/'}), '')))
+        mockito.when(gamestop_checker).__getattr__('__head')(mockito.eq(live_url)).thenReturn(
+            mock_get_response(HttpResponse(live_url, 200, CIMultiDict(), '')))
+        gamestop_checker.set_head_probe(True)
+        try:
+            self.assertEqual(REDIRECTED_HOME, (await gamestop_checker.scrape_product(dead_url, ['elden']))[0])
+            self.assertIsNone(await gamestop_checker.probe_product(live_url))
+        finally:
+            gamestop_checker.set_head_probe(False)
+
+    def test_is_home_page_url(self):
+        self.assertTrue(gamestop_checker.is_home_page_url('https://www.gamestop.it/'))
+        self.assertTrue(gamestop_checker.is_home_page_url('https://www.gamestop.de/Home/Index'))
+        self.assertFalse(gamestop_checker.is_home_page_url('https://www.gamestop.it/PS5/Games/2'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+import mockito
+
+from checkers import gamestop_checker
+
+
+async def mock_get(text: str):
+    return text
+
+
+class GamestopCheckerHomeTitlesTest(IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.cache_dir.name, 'home_titles_cache.json')
+        self.previous_titles = list(gamestop_checker.GS_HOME_TITLES)
+
+    def tearDown(self):
+        gamestop_checker.stop_home_titles_refresh()
+        gamestop_checker.GS_HOME_TITLES[:] = self.previous_titles
+        mockito.unstub()
+        self.cache_dir.cleanup()
+
+    def __write_cache(self, timestamp: float):
+        with open(self.cache_path, 'w', encoding='utf-8') as f:
+            json.dump({'timestamp': timestamp,
+                       'titles': {url: 'Cached ' + url for url in gamestop_checker.ALLOWED_SITES_URLS}}, f)
+
+    def __stub_home_pages(self):
+        mockito.spy(gamestop_checker)
+        for url in gamestop_checker.ALLOWED_SITES_URLS:
+            mockito.when(gamestop_checker).__getattr__('__get')(url).thenReturn(
+                mock_get('<html><head><title>Fresh {}</title></head><body></body></html>'.format(url)))
+
+    # A fresh cache is used as it is, without any request
+    async def test_fresh_cache_skips_network(self):
+        self.__write_cache(time.time())
+        await gamestop_checker.fill_home_titles_async(self.cache_path, ttl=3600)
+        self.assertEqual(['Cached ' + url for url in gamestop_checker.ALLOWED_SITES_URLS],
+                         gamestop_checker.GS_HOME_TITLES)
+
+    # A stale cache is used at startup and refreshed right away in the background
+    async def test_stale_cache_is_refreshed(self):
+        self.__write_cache(time.time() - 7200)
+        self.__stub_home_pages()
+        await gamestop_checker.fill_home_titles_async(self.cache_path, ttl=3600)
+        self.assertEqual(['Cached ' + url for url in gamestop_checker.ALLOWED_SITES_URLS],
+                         gamestop_checker.GS_HOME_TITLES)
+        await asyncio.sleep(0.1)
+        self.assertEqual(['Fresh ' + url for url in gamestop_checker.ALLOWED_SITES_URLS],
+                         gamestop_checker.GS_HOME_TITLES)
+        with open(self.cache_path, encoding='utf-8') as f:
+            cache = json.load(f)
+        self.assertEqual('Fresh ' + gamestop_checker.ALLOWED_SITES_URLS[0],
+                         cache['titles'][gamestop_checker.ALLOWED_SITES_URLS[0]])
+
+    # Without a cache the titles are fetched concurrently before returning
+    async def test_missing_cache_fetches_titles(self):
+        self.__stub_home_pages()
+        await gamestop_checker.fill_home_titles_async(self.cache_path, ttl=3600)
+        self.assertEqual(['Fresh ' + url for url in gamestop_checker.ALLOWED_SITES_URLS],
+                         gamestop_checker.GS_HOME_TITLES)
+        self.assertTrue(os.path.exists(self.cache_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
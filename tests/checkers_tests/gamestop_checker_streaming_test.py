@@ -0,0 +1,55 @@
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from aiohttp import web
+
+from checkers import gamestop_checker
+from utils.http_client import HttpClient
+
+
+# This test will not make any request to the internet, but it will serve the pre-saved html pages from a local server
+class GamestopCheckerStreamingTest(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        app = web.Application()
+        app.router.add_static('/', './html_pages')
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.base_url = 'http://127.0.0.1:{}/'.format(self.runner.addresses[0][1])
+        self.http_client = HttpClient()
+        gamestop_checker.set_http_client(self.http_client)
+
+    async def asyncTearDown(self):
+        gamestop_checker.set_http_client(None)
+        await self.http_client.close()
+        await self.runner.cleanup()
+
+    async def test_streaming_stock_markers(self):
+        get_stock_markers_streaming = getattr(gamestop_checker, '__get_stock_markers_streaming')
+        for file_name, expected in (('available_product_it_1.html', True), ('unavailable_product_it_1.html', False),
+                                    ('search_url.html', False)):
+            stock_markers = await get_stock_markers_streaming(self.base_url + file_name)
+            self.assertEqual(expected, stock_markers.is_available())
+
+    # Without a shared HttpClient the requests reuse a single fallback one, closed once at the end
+    async def test_fallback_http_client(self):
+        gamestop_checker.set_http_client(None)
+        get_stock_markers_streaming = getattr(gamestop_checker, '__get_stock_markers_streaming')
+        try:
+            self.assertTrue((await get_stock_markers_streaming(self.base_url + 'available_product_it_1.html'))
+                            .is_available())
+            fallback_http_client = gamestop_checker.FALLBACK_HTTP_CLIENT
+            self.assertIsNotNone(fallback_http_client)
+            self.assertFalse((await get_stock_markers_streaming(self.base_url + 'unavailable_product_it_1.html'))
+                             .is_available())
+            self.assertIs(fallback_http_client, gamestop_checker.FALLBACK_HTTP_CLIENT)
+        finally:
+            await gamestop_checker.close_fallback_http_client()
+        self.assertIsNone(gamestop_checker.FALLBACK_HTTP_CLIENT)
+        self.assertEqual(0, len(fallback_http_client.__getattribute__('_HttpClient__sessions')))
+
+
+if __name__ == '__main__':
+    unittest.main()
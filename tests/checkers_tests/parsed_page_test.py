@@ -0,0 +1,39 @@
+import unittest
+
+from bs4 import BeautifulSoup
+
+from checkers import gamestop_checker
+from checkers.parsed_page import ParsedPage
+
+
+# This test uses the pre-saved html pages to check that a ParsedPage finds the same elements as BeautifulSoup
+class ParsedPageTest(unittest.TestCase):
+
+    def test_check_stock_from_page(self):
+        for file_name, expected in (('available_product_it_1.html', True), ('unavailable_product_it_1.html', False)):
+            with open('./html_pages/' + file_name, encoding='utf-8') as f:
+                html_page = f.read()
+            url = 'https://www.gamestop.it/PS4/Games/' + file_name
+            self.assertEqual(expected, gamestop_checker.check_stock_from_page(ParsedPage(html_page), url))
+            self.assertEqual(expected, gamestop_checker.check_stock_from_soup(BeautifulSoup(html_page, 'html.parser'),
+                                                                              url))
+
+    def test_search_page(self):
+        with open('./html_pages/search_url.html', encoding='utf-8') as f:
+            page = ParsedPage(f.read())
+        self.assertEqual('12', page.search_sum_count)
+        self.assertEqual(12, len(page.search_result_links))
+        self.assertEqual('/PS4/Games/136782/elden-ring', page.search_result_links[0])
+        self.assertEqual('Acquista Videogiochi, Console, Accessori e Merchandise | GameStop Italia', page.title)
+        self.assertTrue(any('Elden Ring' in text for text in page.body_texts))
+
+    def test_empty_page(self):
+        page = ParsedPage('')
+        self.assertIsNone(page.title)
+        self.assertEqual([], page.body_texts)
+        self.assertFalse(page.stock_markers.check_box_two)
+        self.assertIsNone(page.search_sum_count)
+
+
+if __name__ == '__main__':
+    unittest.main()
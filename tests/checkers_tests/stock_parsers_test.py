@@ -0,0 +1,57 @@
+import pickle
+import unittest
+
+from bs4 import BeautifulSoup
+
+from checkers import gamestop_checker
+from checkers.parsed_page import ParsedPage
+from checkers.stock_parsers import LXML_BACKEND, PARSER_BACKENDS, StockSelectors, find_stock_markers, \
+    get_stock_selectors, is_backend_available, set_stock_selectors
+
+PAGES = (('available_product_it_1.html', True), ('unavailable_product_it_1.html', False), ('search_url.html', False))
+
+
+# This test checks that every parser backend gives the same verdict as the BeautifulSoup html.parser on the pre-saved
+# html pages
+class StockParsersTest(unittest.TestCase):
+
+    def test_backends_match_beautiful_soup(self):
+        for file_name, expected in PAGES:
+            with open('./html_pages/' + file_name, encoding='utf-8') as f:
+                html_page = f.read()
+            soup_verdict = gamestop_checker.check_stock_from_soup(BeautifulSoup(html_page, 'html.parser'), file_name)
+            self.assertEqual(expected, soup_verdict)
+            for backend in PARSER_BACKENDS:
+                if not is_backend_available(backend):
+                    continue
+                with self.subTest(backend=backend, page=file_name):
+                    self.assertEqual(soup_verdict, find_stock_markers(html_page, backend).is_available())
+
+    def test_radio_add_without_check_box_two(self):
+        html_page = '<html><body><input class="radioAdd Clickbutton" data-available="False"/></body></html>'
+        for backend in PARSER_BACKENDS:
+            if is_backend_available(backend):
+                self.assertTrue(find_stock_markers(html_page, backend).is_available())
+
+    def test_unknown_backend(self):
+        self.assertRaises(ValueError, gamestop_checker.set_parser_backend, 'unknown')
+        self.assertRaises(ValueError, find_stock_markers, '<html></html>', 'unknown')
+
+    # A domain whose markup differs has its own selectors, and the other domains keep the default ones
+    def test_domain_stock_selectors(self):
+        html_page = '<html><body><button class="addToCart" data-available="true"></button></body></html>'
+        stock_selectors = StockSelectors('//button[contains(@class, "addToCart")]', '//button[@id="none"]')
+        set_stock_selectors('de', stock_selectors)
+        try:
+            self.assertIs(stock_selectors, get_stock_selectors('https://www.gamestop.de/PS5/Games/1'))
+            self.assertTrue(ParsedPage(html_page, 'https://www.gamestop.de/PS5/Games/1').stock_markers.is_available())
+            self.assertFalse(ParsedPage(html_page, 'https://www.gamestop.it/PS5/Games/1').stock_markers.is_available())
+            # The selectors can be sent to a worker process
+            self.assertTrue(find_stock_markers(html_page, LXML_BACKEND,
+                                               pickle.loads(pickle.dumps(stock_selectors))).is_available())
+        finally:
+            set_stock_selectors('de', None)
+
+
+if __name__ == '__main__':
+    unittest.main()
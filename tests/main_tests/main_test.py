@@ -0,0 +1,113 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+import mockito
+
+import main
+from checkers import gamestop_checker
+from notification_senders.notification_bus import STOCK_EVENT
+from utils.dedup_cache import DedupCache
+from utils.scrape_leases import ScrapeLeases
+from utils.scrape_state import MATCHED, NO_MATCH
+
+BASE_URL = 'https://www.gamestop.it/PS5/Games/'
+
+
+# This test will not make any http request: the checks are replaced by stubs
+class MainTest(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    async def asyncTearDown(self):
+        mockito.unstub()
+        self.directory.cleanup()
+
+    # Stubs the scrape of the products, finding the given product ids and failing once for the broken ones, and
+    # returns the list of the scraped urls
+    def stub_scrape_product(self, found_ids: list, broken_ids: list = ()) -> list:
+        scraped_urls = []
+
+        async def scrape_product(url: str, keywords: list, check_all_keywords: bool = False) -> tuple:
+            scraped_urls.append(url)
+            await asyncio.sleep(0.01)
+            if int(url[len(BASE_URL):]) in broken_ids and scraped_urls.count(url) == 1:
+                raise ConnectionError()
+            return (MATCHED, object()) if int(url[len(BASE_URL):]) in found_ids else (NO_MATCH, None)
+
+        mockito.when(gamestop_checker).scrape_product(...).thenAnswer(scrape_product)
+        return scraped_urls
+
+    async def scrape_concurrently(self, ending_product_id: int, continue_after_found: bool) -> None:
+        await main.scrape_gamestop_products_concurrently(None, 1, ending_product_id, BASE_URL, check_stock=False,
+                                                         play_sound=False, open_browser=False, keywords=['ps5'],
+                                                         continue_after_found=continue_after_found,
+                                                         sleep_after_found=0, workers=4, requests_per_second=0)
+
+    # Every product id is scraped exactly once by the workers
+    async def test_scrape_concurrently(self):
+        scraped_urls = self.stub_scrape_product([5])
+        await self.scrape_concurrently(20, continue_after_found=True)
+        self.assertEqual([BASE_URL + str(product_id) for product_id in range(1, 21)],
+                         sorted(scraped_urls, key=lambda url: int(url[len(BASE_URL):])))
+
+    # The workers stop after the first product found, only finishing the products they were already scraping
+    async def test_scrape_concurrently_stops_after_found(self):
+        scraped_urls = self.stub_scrape_product([1])
+        await self.scrape_concurrently(20, continue_after_found=False)
+        self.assertEqual([BASE_URL + str(product_id) for product_id in range(1, 5)], scraped_urls)
+
+    # The lease is renewed while a product waits, and the renewal stops once the chunk is cancelled
+    async def test_keep_lease(self):
+        scrape_leases = ScrapeLeases(os.path.join(self.directory.name, 'scrape_cluster.db'), lease_seconds=0.3)
+        try:
+            await scrape_leases.run(scrape_leases.create_chunks, BASE_URL, [1, 2])
+            self.assertEqual((1, 2, [1, 2]), await scrape_leases.run(scrape_leases.lease, BASE_URL, 'a'))
+            lease_keeper = asyncio.ensure_future(main.keep_lease(scrape_leases, BASE_URL, 1, 'a'))
+            await asyncio.sleep(0.6)
+            self.assertIsNone(await scrape_leases.run(scrape_leases.lease, BASE_URL, 'b'))
+            await scrape_leases.run(scrape_leases.cancel, BASE_URL)
+            await asyncio.wait_for(lease_keeper, 1)
+        finally:
+            scrape_leases.close()
+
+    # A chunk with a product that could not be scraped is not done: the product is leased again, alone
+    async def test_scrape_leased_chunks_again(self):
+        scraped_urls = self.stub_scrape_product([], broken_ids=[2])
+        scrape_leases = ScrapeLeases(os.path.join(self.directory.name, 'scrape_cluster.db'), lease_seconds=0.3)
+        try:
+            await scrape_leases.run(scrape_leases.create_chunks, BASE_URL, [1, 2, 3])
+            await asyncio.wait_for(main.scrape_leased_chunks(scrape_leases, BASE_URL, 'a', check_stock=False,
+                                                             keywords=['ps5'], poll_interval=0.05), 5)
+            results = await scrape_leases.run(scrape_leases.take_results, BASE_URL)
+        finally:
+            scrape_leases.close()
+        self.assertEqual([BASE_URL + str(product_id) for product_id in (1, 2, 3, 2)], scraped_urls)
+        self.assertEqual([1, 3, 2], [product_id for product_id, _, _, _ in results])
+
+    # A notification that could not be sent does not start the cooldown of its url
+    async def test_notify_again_after_failure(self):
+        class TelegramSenderStub:
+            def __init__(self):
+                self.messages = []
+
+            async def send_message(self, message: str) -> None:
+                self.messages.append(message)
+                if len(self.messages) == 1:
+                    raise ConnectionError()
+
+        telegram_sender = TelegramSenderStub()
+        main.NOTIFICATION_DEDUP = DedupCache()
+        try:
+            for _ in range(3):
+                await main.notify(telegram_sender, 'In stock', 'url', STOCK_EVENT)
+        finally:
+            main.NOTIFICATION_DEDUP = None
+        self.assertEqual(['In stock', 'In stock'], telegram_sender.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from notification_senders.notification_bus import Notification, NotificationBus, NotificationConsumer, STOCK_EVENT
+
+
+class NotificationBusTest(IsolatedAsyncioTestCase):
+
+    # Publishing does not wait for a slow consumer, and the other consumers are not delayed by it
+    async def test_publish_does_not_wait(self):
+        delivered = []
+        release = asyncio.Event()
+
+        async def slow_deliver(notification: Notification):
+            await release.wait()
+            delivered.append(('slow', notification.url))
+
+        async def fast_deliver(notification: Notification):
+            delivered.append(('fast', notification.url))
+
+        bus = NotificationBus()
+        bus.add_consumer(NotificationConsumer('slow', slow_deliver, lambda notification: True))
+        bus.add_consumer(NotificationConsumer('fast', fast_deliver, lambda notification: notification.play_sound))
+        bus.start()
+        bus.publish(Notification('message', 'url', STOCK_EVENT, play_sound=True))
+        await asyncio.sleep(0.01)
+        self.assertEqual([('fast', 'url')], delivered)
+        self.assertEqual(0, bus.queue_depth())
+        release.set()
+        await bus.stop()
+        self.assertEqual([('fast', 'url'), ('slow', 'url')], delivered)
+
+    async def test_retries_failed_deliveries(self):
+        attempts = []
+
+        async def failing_deliver(notification: Notification):
+            attempts.append(notification.url)
+            if len(attempts) < 3:
+                raise ConnectionError()
+
+        bus = NotificationBus()
+        bus.add_consumer(NotificationConsumer('failing', failing_deliver, lambda notification: True, retries=3,
+                                              retry_backoff=0.01))
+        bus.start()
+        bus.publish(Notification('message', 'url', STOCK_EVENT))
+        await bus.stop()
+        self.assertEqual(3, len(attempts))
+
+    async def test_failure_callback(self):
+        async def failing_deliver(notification: Notification):
+            raise ConnectionError()
+
+        failed = []
+        bus = NotificationBus()
+        bus.add_consumer(NotificationConsumer('failing', failing_deliver, lambda notification: True, retries=1,
+                                              retry_backoff=0.01))
+        bus.start()
+        bus.publish(Notification('message', 'url', STOCK_EVENT, on_failure=lambda: failed.append('url')))
+        await bus.stop()
+        self.assertEqual(['url'], failed)
+
+    async def test_full_queue_drops_notifications(self):
+        bus = NotificationBus()
+        consumer = NotificationConsumer('never started', None, lambda notification: True, queue_size=2)
+        bus.add_consumer(consumer)
+        dropped = []
+        for index in range(5):
+            bus.publish(Notification('message', str(index), STOCK_EVENT,
+                                     on_failure=lambda index=index: dropped.append(index)))
+        self.assertEqual(2, bus.queue_depth())
+        self.assertEqual([2, 3, 4], dropped)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,9 @@ import unittest
 from unittest import IsolatedAsyncioTestCase
 from mockito import when, mock, verify, any, eq
 from telethon import TelegramClient
-from notification_senders.telegram_sender import TelegramSender
+from telethon.errors import FloodWaitError
+from notification_senders.telegram_sender import MAX_MESSAGE_LENGTH, MessageNotSentError, TelegramSender, \
+    build_digests
 
 
 class TelegramSenderTest(IsolatedAsyncioTestCase):
@@ -37,7 +39,6 @@ class TelegramSenderTest(IsolatedAsyncioTestCase):
                                                       message=eq('message'))
         verify(telegram_client, times=1).send_message(self.telegram_sender.channel_ids[1],
                                                       message=eq('message'))
-        self.assertEqual(self.telegram_sender.last_sent_message.message, 'message')
 
         # Verify that it doesn't allow sending another message if equals to the previous one
         await self.telegram_sender.send_message('message')
@@ -53,6 +54,121 @@ class TelegramSenderTest(IsolatedAsyncioTestCase):
         verify(telegram_client, times=1).send_message(eq(-42),
                                                       message=eq('message2'))
 
+    async def test_send_message_after_flood_wait(self):
+        async def coroutine_return(value):
+            return value
+
+        async def flood_wait():
+            raise FloodWaitError(request=None, capture=0)
+
+        telegram_client = mock(TelegramClient)
+        when(telegram_client).is_connected().thenReturn(True)
+        when(telegram_client).send_message(eq(-43), message=eq('flood')).thenReturn(flood_wait()).thenReturn(
+            coroutine_return('flood'))
+        self.telegram_sender.client = telegram_client
+        await self.telegram_sender.send_message('flood', -43)
+        verify(telegram_client, times=2).send_message(eq(-43), message=eq('flood'))
+
+    async def test_send_message_again_to_failed_channels(self):
+        async def coroutine_return(value):
+            return value
+
+        async def fail():
+            raise ConnectionError()
+
+        telegram_client = mock(TelegramClient)
+        when(telegram_client).is_connected().thenReturn(True)
+        when(telegram_client).send_message(eq(-44), message=eq('partial')).thenReturn(fail()).thenReturn(
+            coroutine_return(None))
+        when(telegram_client).send_message(eq(-45), message=eq('partial')).thenReturn(coroutine_return(None))
+        self.telegram_sender.client = telegram_client
+        with self.assertRaises(MessageNotSentError) as context:
+            await self.telegram_sender.send_message('partial', -44, -45)
+        self.assertEqual([-44], context.exception.channel_ids)
+        # Only the channel that missed the message gets it again
+        await self.telegram_sender.send_message('partial', -44, -45)
+        verify(telegram_client, times=2).send_message(eq(-44), message=eq('partial'))
+        verify(telegram_client, times=1).send_message(eq(-45), message=eq('partial'))
+
+    async def test_queue_message_sends_digest(self):
+        async def coroutine_return(value):
+            return value
+
+        telegram_client = mock(TelegramClient)
+        when(telegram_client).is_connected().thenReturn(True)
+        when(telegram_client).send_message(any(int), message=eq('first\nsecond')).thenReturn(
+            coroutine_return(None)).thenReturn(coroutine_return(None))
+        self.telegram_sender.client = telegram_client
+        self.telegram_sender.flush_interval = 0.01
+        try:
+            await self.telegram_sender.queue_message('first')
+            await self.telegram_sender.queue_message('second')
+            self.assertEqual(['first', 'second'], [message for message, _ in self.telegram_sender.message_queue])
+            await asyncio.sleep(0.05)
+            self.assertEqual([], self.telegram_sender.message_queue)
+            verify(telegram_client, times=1).send_message(self.telegram_sender.channel_ids[0],
+                                                          message=eq('first\nsecond'))
+        finally:
+            self.telegram_sender.flush_interval = 0
+
+    async def test_flush_sends_failed_digests_again(self):
+        async def coroutine_return(value):
+            return value
+
+        async def fail():
+            raise ConnectionError()
+
+        telegram_client = mock(TelegramClient)
+        when(telegram_client).is_connected().thenReturn(True)
+        channel_ids = self.telegram_sender.channel_ids
+        when(telegram_client).send_message(eq(channel_ids[0]), message=eq('lost\nfound')).thenReturn(
+            coroutine_return(None))
+        when(telegram_client).send_message(eq(channel_ids[1]), message=eq('lost\nfound')).thenReturn(
+            fail()).thenReturn(coroutine_return(None))
+        when(telegram_client).send_message(any(int), message=eq('later')).thenReturn(
+            coroutine_return(None)).thenReturn(coroutine_return(None))
+        self.telegram_sender.client = telegram_client
+        self.telegram_sender.message_queue = [('lost', None), ('found', None)]
+        self.assertFalse(await self.telegram_sender.flush())
+        self.assertEqual([], self.telegram_sender.message_queue)
+        # The digest that was not sent goes, unchanged, before the messages queued after it, and only to the channel
+        # that missed it, even if the dedup of the other channel expired in the meantime
+        self.telegram_sender._TelegramSender__sent_messages.forget(('lost\nfound', channel_ids[0]))
+        self.telegram_sender.message_queue.append(('later', None))
+        self.assertTrue(await self.telegram_sender.flush())
+        verify(telegram_client, times=1).send_message(eq(channel_ids[0]), message=eq('lost\nfound'))
+        verify(telegram_client, times=2).send_message(eq(channel_ids[1]), message=eq('lost\nfound'))
+        verify(telegram_client, times=1).send_message(eq(channel_ids[0]), message=eq('later'))
+
+    async def test_dropped_digest_calls_on_failure(self):
+        async def fail():
+            raise ConnectionError()
+
+        telegram_client = mock(TelegramClient)
+        when(telegram_client).is_connected().thenReturn(True)
+        when(telegram_client).send_message(any(int), message=eq('dropped')).thenReturn(fail()).thenReturn(
+            fail()).thenReturn(fail()).thenReturn(fail())
+        self.telegram_sender.client = telegram_client
+        self.telegram_sender.flush_interval = 0.01
+        self.telegram_sender.flush_retries = 1
+        failures = []
+        try:
+            await self.telegram_sender.queue_message('dropped', lambda: failures.append('dropped'))
+            await asyncio.sleep(0.1)
+        finally:
+            self.telegram_sender.flush_interval = 0
+            self.telegram_sender.flush_retries = 3
+        # The digest was sent twice, then dropped
+        verify(telegram_client, times=2).send_message(self.telegram_sender.channel_ids[0], message=eq('dropped'))
+        self.assertEqual(['dropped'], failures)
+        self.assertEqual([], self.telegram_sender.message_queue)
+
+    def test_build_digests(self):
+        self.assertEqual(['a\nb'], build_digests(['a', 'b']))
+        long_message = 'x' * (MAX_MESSAGE_LENGTH - 1)
+        self.assertEqual([long_message, 'a'], build_digests([long_message, 'a']))
+        self.assertEqual([], build_digests([]))
+
 
 if __name__ == '__main__':
     unittest.main()
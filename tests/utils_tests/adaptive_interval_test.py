@@ -0,0 +1,36 @@
+import unittest
+from datetime import datetime
+
+from utils.adaptive_interval import AdaptiveInterval, parse_hot_hours
+
+NIGHT = datetime(2022, 4, 17, 3)
+MORNING = datetime(2022, 4, 17, 10)
+
+
+class AdaptiveIntervalTest(unittest.TestCase):
+
+    def test_backoff_and_reset(self):
+        adaptive_interval = AdaptiveInterval(base=60, floor=20, ceiling=200, backoff_factor=2)
+        self.assertEqual(120, adaptive_interval.next_interval(False, NIGHT))
+        self.assertEqual(200, adaptive_interval.next_interval(False, NIGHT))
+        self.assertEqual(200, adaptive_interval.next_interval(False, NIGHT))
+        # A change brings it back to the floor, then it backs off again
+        self.assertEqual(20, adaptive_interval.next_interval(True, NIGHT))
+        self.assertEqual(40, adaptive_interval.next_interval(False, NIGHT))
+
+    def test_hot_hours(self):
+        adaptive_interval = AdaptiveInterval(base=60, floor=20, ceiling=200, backoff_factor=2,
+                                             hot_hours=parse_hot_hours('9-12, 22-2'))
+        self.assertEqual(60, adaptive_interval.next_interval(False, MORNING))
+        self.assertEqual(60, adaptive_interval.next_interval(False, datetime(2022, 4, 17, 23)))
+        self.assertEqual(200, adaptive_interval.next_interval(False, NIGHT))
+        self.assertEqual(20, adaptive_interval.next_interval(True, MORNING))
+
+    def test_parse_hot_hours(self):
+        self.assertEqual([], parse_hot_hours(''))
+        self.assertEqual([], parse_hot_hours(None))
+        self.assertEqual([(9, 12), (18, 20)], parse_hot_hours('9-12, 18-20'))
+
+
+if __name__ == '__main__':
+    unittest.main()
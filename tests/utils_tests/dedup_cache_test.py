@@ -0,0 +1,46 @@
+import unittest
+
+from utils.dedup_cache import DedupCache
+
+
+class DedupCacheTest(unittest.TestCase):
+
+    def test_duplicates_within_ttl(self):
+        dedup_cache = DedupCache(ttl=60)
+        self.assertFalse(dedup_cache.seen('a', now=0))
+        self.assertFalse(dedup_cache.seen('b', now=1))
+        # Unlike a single last message, 'a' is still remembered after 'b'
+        self.assertTrue(dedup_cache.seen('a', now=2))
+        self.assertFalse(dedup_cache.seen('a', now=61))
+        self.assertTrue(dedup_cache.seen('a', now=62))
+
+    def test_per_key_ttl(self):
+        dedup_cache = DedupCache(ttl=60)
+        self.assertFalse(dedup_cache.seen(('url', 'stock'), ttl=600, now=0))
+        self.assertTrue(dedup_cache.seen(('url', 'stock'), now=599))
+        self.assertFalse(dedup_cache.seen(('url', 'search'), ttl=0, now=0))
+        self.assertFalse(dedup_cache.seen(('url', 'search'), ttl=0, now=0))
+
+    def test_bounded(self):
+        dedup_cache = DedupCache(ttl=60, max_entries=2)
+        for index, key in enumerate(['a', 'b', 'c']):
+            dedup_cache.seen(key, now=index)
+        self.assertEqual(2, len(dedup_cache))
+        self.assertFalse(dedup_cache.seen('a', now=3))
+        self.assertTrue(dedup_cache.seen('c', now=3))
+
+    def test_expired_keys_are_evicted(self):
+        dedup_cache = DedupCache(ttl=10)
+        dedup_cache.seen('a', now=0)
+        dedup_cache.seen('b', now=20)
+        self.assertEqual(1, len(dedup_cache))
+
+    def test_forget(self):
+        dedup_cache = DedupCache(ttl=60)
+        dedup_cache.seen('a', now=0)
+        dedup_cache.forget('a')
+        self.assertFalse(dedup_cache.seen('a', now=1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,94 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from utils.domain_guard import CLOSED, HALF_OPEN, OPEN, DomainGuard, DomainUnavailableError, ThrottledResponseError, \
+    parse_retry_after
+
+URL = 'https://www.gamestop.it/PS5/Games/1'
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class DomainGuardTest(IsolatedAsyncioTestCase):
+
+    async def fail(self, domain_guard: DomainGuard, retry_after: float = None) -> None:
+        with self.assertRaises(ThrottledResponseError):
+            async with domain_guard.request():
+                raise ThrottledResponseError(URL, 503, retry_after)
+
+    async def succeed(self, domain_guard: DomainGuard) -> None:
+        async with domain_guard.request():
+            pass
+
+    async def test_exponential_backoff(self):
+        clock = FakeClock()
+        domain_guard = DomainGuard('www.gamestop.it', requests_per_second=0, backoff=1, max_backoff=300,
+                                   failure_threshold=10, clock=clock)
+        await self.fail(domain_guard)
+        self.assertEqual(clock.now + 1, domain_guard.blocked_until)
+        clock.now += 1
+        await self.fail(domain_guard)
+        self.assertEqual(clock.now + 2, domain_guard.blocked_until)
+        clock.now += 2
+        # The Retry-After is honored when longer than the backoff
+        await self.fail(domain_guard, retry_after=30)
+        self.assertEqual(clock.now + 30, domain_guard.blocked_until)
+        clock.now += 30
+        await self.succeed(domain_guard)
+        self.assertEqual(0, domain_guard.failures)
+        self.assertEqual(CLOSED, domain_guard.state)
+
+    async def test_circuit_breaker(self):
+        clock = FakeClock()
+        domain_guard = DomainGuard('www.gamestop.it', requests_per_second=0, backoff=0, failure_threshold=2,
+                                   open_seconds=60, max_open_seconds=100, clock=clock)
+        await self.fail(domain_guard)
+        self.assertEqual(CLOSED, domain_guard.state)
+        await self.fail(domain_guard)
+        self.assertEqual(OPEN, domain_guard.state)
+        with self.assertRaises(DomainUnavailableError) as context:
+            await domain_guard.acquire()
+        self.assertEqual(60, context.exception.retry_after)
+
+        # After open_seconds a single probe goes through, and its failure opens the circuit for twice as long
+        clock.now += 60
+        await self.fail(domain_guard)
+        self.assertEqual(OPEN, domain_guard.state)
+        self.assertEqual(clock.now + 100, domain_guard.open_until)
+
+        clock.now += 100
+        probe_started = asyncio.Event()
+        finish_probe = asyncio.Event()
+
+        async def probe() -> None:
+            async with domain_guard.request():
+                probe_started.set()
+                await finish_probe.wait()
+
+        probe_task = asyncio.ensure_future(probe())
+        await probe_started.wait()
+        self.assertEqual(HALF_OPEN, domain_guard.state)
+        with self.assertRaises(DomainUnavailableError):
+            await domain_guard.acquire()
+        finish_probe.set()
+        await probe_task
+        self.assertEqual(CLOSED, domain_guard.state)
+        await self.succeed(domain_guard)
+
+    def test_parse_retry_after(self):
+        self.assertEqual(120, parse_retry_after('120'))
+        self.assertEqual(30, parse_retry_after('Wed, 21 Oct 2015 07:28:30 GMT', now=1445412480))
+        self.assertIsNone(parse_retry_after(None))
+        self.assertIsNone(parse_retry_after('soon'))
+
+
+if __name__ == '__main__':
+    unittest.main()
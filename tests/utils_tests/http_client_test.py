@@ -0,0 +1,179 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from aiohttp import web
+
+from utils.domain_guard import OPEN, DomainGuards, DomainUnavailableError, ThrottledResponseError
+from utils.http_client import HttpClient, add_downloads_to_caller, count_downloads
+from utils.metrics import Metrics
+
+
+# This test will not make any request to the internet, but to a local server
+class HttpClientTest(IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.peers = []
+
+        async def handler(request):
+            self.peers.append(request.transport.get_extra_info('peername'))
+            return web.Response(text='<html><title>page</title></html>', content_type='text/html')
+
+        async def big_handler(request):
+            response = web.StreamResponse()
+            response.content_type = 'text/html'
+            await response.prepare(request)
+            for i in range(100):
+                self.chunks_sent = i + 1
+                await response.write(('<p>' + str(i) + '</p>').ljust(1024).encode('utf-8'))
+                await asyncio.sleep(0.01)
+            await response.write_eof()
+            return response
+
+        self.chunks_sent = 0
+        app = web.Application()
+
+        async def redirect_handler(request):
+            raise web.HTTPFound('/')
+
+        async def throttled_handler(request):
+            self.throttled_requests += 1
+            return web.Response(status=429, headers={'Retry-After': '120'}, text='Too many requests')
+
+        self.throttled_requests = 0
+        app.router.add_get('/throttled', throttled_handler)
+        app.router.add_get('/big', big_handler)
+        app.router.add_get('/redirect', redirect_handler)
+        app.router.add_get('/{tail:.*}', handler)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.base_url = 'http://127.0.0.1:{}'.format(self.runner.addresses[0][1])
+
+    async def asyncTearDown(self):
+        await self.runner.cleanup()
+
+    async def test_get_text_reuses_connection(self):
+        http_client = HttpClient()
+        self.assertEqual('<html><title>page</title></html>', await http_client.get_text(self.base_url + '/1'))
+        self.assertEqual('<html><title>page</title></html>', await http_client.get_text(self.base_url + '/2'))
+
+        # Both requests went through the same pooled session and the same keep-alive connection
+        self.assertEqual(1, len(http_client.__getattribute__('_HttpClient__sessions')))
+        self.assertEqual(1, len(set(self.peers)))
+
+        await http_client.close()
+        self.assertEqual(0, len(http_client.__getattribute__('_HttpClient__sessions')))
+
+    async def test_read_until_stops_early(self):
+        http_client = HttpClient()
+        read = []
+
+        def consume(text):
+            read.append(text)
+            return 'found' if '<p>3</p>' in ''.join(read) else None
+
+        self.assertEqual('found', await http_client.read_until(self.base_url + '/big', consume, chunk_size=1024))
+        await asyncio.sleep(0.1)
+        self.assertLess(self.chunks_sent, 100)
+
+        # If consume never returns a value, the whole body is read
+        read.clear()
+        self.assertIsNone(await http_client.read_until(self.base_url + '/big', lambda text: read.append(text)))
+        self.assertIn('<p>99</p>', ''.join(read))
+        await http_client.close()
+
+    async def test_records_metrics(self):
+        http_client = HttpClient()
+        http_client.metrics = Metrics()
+        await http_client.get_text(self.base_url + '/1')
+        await http_client.get_response(self.base_url + '/2')
+        domain = self.base_url.split('://')[1]
+        self.assertEqual(2, http_client.metrics.request_seconds.values[(domain,)][2])
+        self.assertEqual(2 * len('<html><title>page</title></html>'),
+                         http_client.metrics.downloaded_bytes.values[(domain,)])
+        await http_client.close()
+
+    # The bytes are counted for the task that started counting, without the metrics
+    async def test_counts_downloads(self):
+        http_client = HttpClient()
+        page_size = len('<html><title>page</title></html>')
+
+        async def check(url: str) -> int:
+            counter = count_downloads()
+            await http_client.get_text(url)
+            return counter.bytes
+
+        counter = count_downloads()
+        self.assertEqual([page_size, page_size], await asyncio.gather(check(self.base_url + '/1'),
+                                                                      check(self.base_url + '/2')))
+        await http_client.get_text(self.base_url + '/3')
+        self.assertEqual(page_size, counter.bytes)
+        await http_client.close()
+
+    # The bytes of the checks run by another check are counted for both
+    async def test_adds_downloads_to_caller(self):
+        http_client = HttpClient()
+        page_size = len('<html><title>page</title></html>')
+
+        async def check(url: str) -> int:
+            counter = count_downloads()
+            await http_client.get_text(url)
+            return counter.bytes
+
+        counter = count_downloads()
+        await http_client.get_text(self.base_url + '/1')
+        tasks = [asyncio.ensure_future(add_downloads_to_caller(check(self.base_url + path))) for path in ('/2', '/3')]
+        self.assertEqual([page_size, page_size], await asyncio.gather(*tasks))
+        self.assertEqual(3 * page_size, counter.bytes)
+        await http_client.close()
+
+    async def test_head_does_not_follow_redirects(self):
+        http_client = HttpClient()
+        response = await http_client.head(self.base_url + '/redirect')
+        self.assertEqual(302, response.status)
+        self.assertEqual('/', response.headers.get('Location'))
+        self.assertEqual('', response.text)
+        response = await http_client.head(self.base_url + '/redirect', allow_redirects=True)
+        self.assertEqual(200, response.status)
+        await http_client.close()
+
+    async def test_get_response_skips_redirect_body(self):
+        http_client = HttpClient()
+        response = await http_client.get_response(self.base_url + '/redirect',
+                                                  skip_redirect_body=lambda url: url.endswith('/'))
+        self.assertEqual(self.base_url + '/', response.url)
+        self.assertEqual('', response.text)
+        response = await http_client.get_response(self.base_url + '/redirect')
+        self.assertEqual('<html><title>page</title></html>', response.text)
+        await http_client.close()
+
+    # Without the domain guards every kind of request goes straight to the server
+    async def test_requests_without_domain_guards(self):
+        http_client = HttpClient(domain_guards=None)
+        self.assertEqual('<html><title>page</title></html>', await http_client.get_text(self.base_url + '/1'))
+        self.assertEqual(200, (await http_client.get_response(self.base_url + '/2')).status)
+        self.assertEqual(200, (await http_client.head(self.base_url + '/3')).status)
+        self.assertEqual('page', await http_client.read_until(self.base_url + '/4',
+                                                             lambda text: 'page' if 'page' in text else None))
+        self.assertEqual(4, len(self.peers))
+        await http_client.close()
+
+    # A 429 is an error, and its Retry-After longer than the maximum backoff pauses the domain without more requests
+    async def test_domain_guard_honors_retry_after(self):
+        http_client = HttpClient(domain_guards=DomainGuards(requests_per_second=0, max_backoff=60))
+        with self.assertRaises(ThrottledResponseError) as context:
+            await http_client.get_text(self.base_url + '/throttled')
+        self.assertEqual(429, context.exception.status)
+        self.assertEqual(120, context.exception.retry_after)
+        self.assertEqual(OPEN, http_client.domain_guards.get(self.base_url).state)
+        with self.assertRaises(DomainUnavailableError):
+            await http_client.get_response(self.base_url + '/1')
+        self.assertEqual(1, self.throttled_requests)
+        self.assertEqual(0, len(self.peers))
+        await http_client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,37 @@
+import unittest
+
+from utils.keyword_matcher import KeywordMatcher
+
+
+class KeywordMatcherTest(unittest.TestCase):
+
+    def test_find(self):
+        keyword_matcher = KeywordMatcher(['elden ring', 'collector', 'ps5'])
+        text = 'Elden Ring - Collector\'s Edition\nPS4'
+        self.assertEqual(['elden ring', 'collector'], keyword_matcher.find(text, find_all=True))
+        self.assertEqual(1, len(keyword_matcher.find(text)))
+        self.assertEqual([], keyword_matcher.find('Horizon Forbidden West', find_all=True))
+
+    def test_overlapping_keywords(self):
+        # Both keywords match at the same position, but only one of them can be found by the combined pattern
+        keyword_matcher = KeywordMatcher(['elden', 'elden ring'])
+        self.assertEqual(['elden', 'elden ring'], keyword_matcher.find('Elden Ring', find_all=True))
+
+    def test_matches(self):
+        keyword_matcher = KeywordMatcher(['elden', 'collector'])
+        self.assertTrue(keyword_matcher.matches('Elden Ring'))
+        self.assertFalse(keyword_matcher.matches('Elden Ring', check_all_keywords=True))
+        # Regardless of the order of the keywords, all of them must be found
+        self.assertFalse(KeywordMatcher(['collector', 'elden']).matches('Elden Ring', check_all_keywords=True))
+        self.assertTrue(keyword_matcher.matches('Elden Ring\nCollector\'s Edition', check_all_keywords=True))
+        self.assertFalse(KeywordMatcher([]).matches('Elden Ring'))
+
+    def test_regular_expressions(self):
+        self.assertTrue(KeywordMatcher(['elden.*edition']).matches('Elden Ring - Collector\'s Edition'))
+        # Keywords with groups are matched one by one
+        keyword_matcher = KeywordMatcher(['(elden) \\1', 'ring'])
+        self.assertEqual(['(elden) \\1', 'ring'], keyword_matcher.find('elden elden ring', find_all=True))
+
+
+if __name__ == '__main__':
+    unittest.main()
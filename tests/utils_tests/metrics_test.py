@@ -0,0 +1,49 @@
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+import aiohttp
+
+from utils.metrics import Histogram, Metrics, MetricsServer
+
+
+class MetricsTest(IsolatedAsyncioTestCase):
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = Histogram('latency', 'Latency', ('domain',), buckets=(0.1, 1))
+        histogram.observe(0.05, 'www.gamestop.it')
+        histogram.observe(0.5, 'www.gamestop.it')
+        histogram.observe(5, 'www.gamestop.it')
+        lines = histogram.render()
+        self.assertIn('latency_bucket{domain="www.gamestop.it",le="0.1"} 1', lines)
+        self.assertIn('latency_bucket{domain="www.gamestop.it",le="1"} 2', lines)
+        self.assertIn('latency_bucket{domain="www.gamestop.it",le="+Inf"} 3', lines)
+        self.assertIn('latency_count{domain="www.gamestop.it"} 3', lines)
+
+    def test_render(self):
+        metrics = Metrics()
+        metrics.downloaded_bytes.inc(1024, 'www.gamestop.de')
+        metrics.record_error(ConnectionError())
+        metrics.record_error(ConnectionError())
+        metrics.add_gauge('queue_depth', 'Queue depth', lambda: 7)
+        text = metrics.render()
+        self.assertIn('gamestop_downloaded_bytes_total{domain="www.gamestop.de"} 1024', text)
+        self.assertIn('gamestop_errors_total{type="ConnectionError"} 2', text)
+        self.assertIn('# TYPE gamestop_request_seconds histogram', text)
+        self.assertIn('queue_depth 7', text)
+
+    async def test_server(self):
+        metrics = Metrics()
+        metrics.parse_seconds.observe(0.01, 'stock')
+        metrics_server = MetricsServer(metrics, port=0)
+        await metrics_server.start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                async with session.get('http://127.0.0.1:{}/metrics'.format(metrics_server.port)) as r:
+                    self.assertEqual(200, r.status)
+                    self.assertIn('gamestop_parse_seconds_count{check="stock"} 1', await r.text())
+        finally:
+            await metrics_server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
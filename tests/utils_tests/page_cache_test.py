@@ -0,0 +1,43 @@
+import unittest
+
+from utils.page_cache import CachedPage, PageCache, hash_page
+
+
+class PageCacheTest(unittest.TestCase):
+
+    def test_lru_eviction(self):
+        page_cache = PageCache(max_entries=2)
+        page_cache.put('a', CachedPage(content_hash='a'))
+        page_cache.put('b', CachedPage(content_hash='b'))
+        # Using 'a' makes 'b' the least recently used page
+        self.assertIsNotNone(page_cache.get('a'))
+        page_cache.put('c', CachedPage(content_hash='c'))
+        self.assertEqual(2, len(page_cache))
+        self.assertIsNone(page_cache.get('b'))
+        self.assertIsNotNone(page_cache.get('a'))
+        self.assertIsNotNone(page_cache.get('c'))
+
+    def test_hit_rate(self):
+        page_cache = PageCache()
+        self.assertEqual(0.0, page_cache.hit_rate())
+        page_cache.record_hit()
+        page_cache.record_hit()
+        page_cache.record_hit()
+        page_cache.record_miss()
+        self.assertEqual(0.75, page_cache.hit_rate())
+
+    def test_hash_page_ignores_scripts_and_comments(self):
+        page = '<html><head><title>{}</title></head><body><p>Elden Ring</p>{}</body></html>'
+        self.assertEqual(hash_page(page.format('1', '<script>var now = 1;</script><!-- 1 -->')),
+                         hash_page(page.format('2', '<script>var now = 2;</script><!-- 2 -->')))
+        self.assertNotEqual(hash_page(page.format('1', '')), hash_page(page.format('1', '<p>Disponibile</p>')))
+
+    def test_conditional_headers(self):
+        self.assertEqual({}, CachedPage().get_conditional_headers())
+        self.assertEqual({'If-None-Match': '"1"', 'If-Modified-Since': 'Sun, 17 Apr 2022 10:00:00 GMT'},
+                         CachedPage(etag='"1"', last_modified='Sun, 17 Apr 2022 10:00:00 GMT')
+                         .get_conditional_headers())
+
+
+if __name__ == '__main__':
+    unittest.main()
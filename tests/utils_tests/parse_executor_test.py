@@ -0,0 +1,58 @@
+import asyncio
+import threading
+import time
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from utils.parse_executor import PROCESS_EXECUTOR, THREAD_EXECUTOR, ParseExecutor
+
+RUNNING = []
+LOCK = threading.Lock()
+
+
+def slow_job(value: int) -> int:
+    with LOCK:
+        RUNNING.append(value)
+        running = len(RUNNING)
+    time.sleep(0.05)
+    with LOCK:
+        RUNNING.remove(value)
+    return running
+
+
+class ParseExecutorTest(IsolatedAsyncioTestCase):
+
+    async def test_process_executor(self):
+        parse_executor = ParseExecutor(1, kind=PROCESS_EXECUTOR)
+        try:
+            self.assertEqual(6, await parse_executor.run(sum, (1, 2, 3)))
+        finally:
+            parse_executor.close()
+
+    async def test_max_pending(self):
+        # With more workers than allowed pending jobs, at most max_pending jobs run at the same time
+        parse_executor = ParseExecutor(4, max_pending=2, kind=THREAD_EXECUTOR)
+        try:
+            running = await asyncio.gather(*[parse_executor.run(slow_job, value) for value in range(6)])
+            self.assertEqual(2, max(running))
+            self.assertEqual(0, parse_executor.pending)
+        finally:
+            parse_executor.close()
+
+    async def test_close_cancels_waiting_jobs(self):
+        # The first job is running, the other two are still waiting in the pool
+        parse_executor = ParseExecutor(1, max_pending=3, kind=THREAD_EXECUTOR)
+        jobs = [asyncio.ensure_future(parse_executor.run(slow_job, value)) for value in range(3)]
+        await asyncio.sleep(0.01)
+        parse_executor.close()
+        results = await asyncio.gather(*jobs, return_exceptions=True)
+        self.assertEqual(1, results[0])
+        self.assertTrue(all(isinstance(result, asyncio.CancelledError) for result in results[1:]))
+        self.assertEqual(0, parse_executor.pending)
+
+    def test_unknown_kind(self):
+        self.assertRaises(ValueError, ParseExecutor, 1, kind='gpu')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+
+from utils.product_index import ProductIndex
+
+
+class ProductIndexTest(unittest.TestCase):
+
+    def test_ranges(self):
+        product_index = ProductIndex(live_ids=[5, 3, 4, 10], dead_ids=[1, 2, 6, 8, 9])
+        self.assertEqual([(3, 5), (10, 10)], product_index.live_ranges())
+        self.assertEqual([(1, 2), (6, 6), (8, 9)], product_index.dead_ranges())
+        self.assertEqual(10, product_index.frontier)
+
+    def test_prioritize(self):
+        product_index = ProductIndex(live_ids=[3, 10], dead_ids=[1, 2, 9])
+        # Beyond the frontier in increasing order, then the unknown ids, the live ones and the dead ones, newest first
+        self.assertEqual([11, 12, 8, 7, 10, 3, 9, 2, 1],
+                         product_index.prioritize([1, 2, 3, 7, 8, 9, 10, 11, 12]))
+
+    def test_no_live_ids(self):
+        product_index = ProductIndex(live_ids=[], dead_ids=[2])
+        self.assertIsNone(product_index.frontier)
+        self.assertEqual([3, 1, 2], product_index.prioritize([1, 2, 3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+from utils.profiler import Profiler, SamplingProfiler
+
+
+def busy_loop(seconds: float):
+    end = time.monotonic() + seconds
+    while time.monotonic() < end:
+        pass
+
+
+class ProfilerTest(unittest.TestCase):
+
+    def test_spans(self):
+        profiler = Profiler()
+        for _ in range(3):
+            with profiler.span('stock.parse'):
+                time.sleep(0.01)
+        with profiler.span('stock.fetch'):
+            pass
+        self.assertEqual(3, profiler.spans['stock.parse'].count)
+        self.assertGreaterEqual(profiler.spans['stock.parse'].total, 0.03)
+        report = profiler.report().splitlines()
+        # The slowest stage in total comes first
+        self.assertTrue(report[1].startswith('stock.parse'))
+        self.assertTrue(report[2].startswith('stock.fetch'))
+
+    def test_span_is_recorded_on_exception(self):
+        profiler = Profiler()
+        with self.assertRaises(ValueError):
+            with profiler.span('search.match'):
+                raise ValueError()
+        self.assertEqual(1, profiler.spans['search.match'].count)
+
+    def test_sampling_profiler_writes_collapsed_stacks(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output_path = os.path.join(directory, 'profiles', 'stacks.folded')
+            thread = threading.Thread(target=busy_loop, args=(0.3,))
+            thread.start()
+            sampling_profiler = SamplingProfiler(interval=0.001, thread_id=thread.ident)
+            sampling_profiler.start(0.2, output_path)
+            thread.join()
+            sampling_profiler.stop()
+            with open(output_path, encoding='utf-8') as f:
+                lines = f.read().splitlines()
+            self.assertTrue(lines)
+            stack, count = lines[0].rsplit(' ', 1)
+            self.assertIn('busy_loop (profiler_test.py:', stack.split(';')[-1])
+            self.assertGreater(int(count), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import asyncio
+import time
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from utils.rate_limiter import RateLimiter
+
+
+class RateLimiterTest(IsolatedAsyncioTestCase):
+
+    async def test_acquire_is_paced_across_coroutines(self):
+        rate_limiter = RateLimiter(requests_per_second=20)
+        start = time.monotonic()
+        await asyncio.gather(*[rate_limiter.acquire() for _ in range(5)])
+        # The first request is free, the other 4 are spaced by 1/20 of a second
+        self.assertGreaterEqual(time.monotonic() - start, 0.19)
+
+    async def test_unlimited(self):
+        rate_limiter = RateLimiter(requests_per_second=0)
+        start = time.monotonic()
+        await asyncio.gather(*[rate_limiter.acquire() for _ in range(100)])
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_shared_by_event_loops(self):
+        # The limiter, like the one of a long-lived sender, keeps working when it is used by another event loop
+        rate_limiter = RateLimiter(requests_per_second=100)
+
+        async def acquire_many():
+            await asyncio.gather(*[rate_limiter.acquire() for _ in range(3)])
+
+        asyncio.run(acquire_many())
+        asyncio.run(acquire_many())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,140 @@
+import os
+import sqlite3
+import tempfile
+import time
+import unittest
+
+from utils.result_history import SCRAPE_CHECK, SEARCH_CHECK, STOCK_CHECK, ResultHistory, get_numpy, \
+    load_snapshots, restock_hours
+from utils.scrape_state import NO_MATCH
+
+DE_URL = 'https://www.gamestop.de/PS5/Games/134750'
+IT_URL = 'https://www.gamestop.it/PS5/Games/134750'
+
+
+def read_rows(path: str) -> list:
+    connection = sqlite3.connect(path)
+    try:
+        return connection.execute('SELECT kind, domain, available, result_count, status, bytes FROM results '
+                                  'ORDER BY checked_at').fetchall()
+    finally:
+        connection.close()
+
+
+class ResultHistoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'result_history.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_record_and_flush(self):
+        result_history = ResultHistory(self.path, batch_size=100, flush_interval=60)
+        try:
+            result_history.record(STOCK_CHECK, DE_URL, available=True, latency=0.5, downloaded_bytes=1000, now=1)
+            result_history.record(SEARCH_CHECK, IT_URL, available=False, result_count=12, now=2)
+            result_history.record(SCRAPE_CHECK, IT_URL, status=NO_MATCH, now=3)
+            # Neither the batch is full nor the flush interval is over
+            self.assertEqual([], read_rows(self.path))
+            result_history.flush()
+            self.assertEqual([(STOCK_CHECK, 'www.gamestop.de', 1, None, None, 1000),
+                              (SEARCH_CHECK, 'www.gamestop.it', 0, 12, None, None),
+                              (SCRAPE_CHECK, 'www.gamestop.it', None, None, NO_MATCH, None)], read_rows(self.path))
+            self.assertRaises(ValueError, result_history.record, 'unknown', DE_URL)
+        finally:
+            result_history.close()
+
+    def test_batches_are_written_without_flushing(self):
+        result_history = ResultHistory(self.path, batch_size=2, flush_interval=60)
+        try:
+            result_history.record(STOCK_CHECK, DE_URL, available=False)
+            result_history.record(STOCK_CHECK, DE_URL, available=True)
+            deadline = time.monotonic() + 5
+            while len(read_rows(self.path)) < 2 and time.monotonic() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(2, len(read_rows(self.path)))
+        finally:
+            result_history.close()
+
+    def test_close_writes_the_pending_results(self):
+        result_history = ResultHistory(self.path, batch_size=100, flush_interval=60)
+        result_history.record(STOCK_CHECK, DE_URL, available=True)
+        result_history.close()
+        self.assertEqual(1, len(read_rows(self.path)))
+        # The history is reopened on the same file
+        result_history = ResultHistory(self.path)
+        result_history.record(STOCK_CHECK, DE_URL, available=False)
+        result_history.close()
+        self.assertEqual(2, len(read_rows(self.path)))
+
+
+@unittest.skipIf(get_numpy(required=False) is None, 'NumPy is not installed')
+class ResultSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'result_history.db')
+        self.snapshot_dir = os.path.join(self.directory.name, 'snapshots')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_snapshot(self):
+        result_history = ResultHistory(self.path)
+        try:
+            result_history.record(STOCK_CHECK, DE_URL, available=True, latency=0.5, downloaded_bytes=1000, now=1)
+            result_history.record(SEARCH_CHECK, IT_URL, result_count=12, now=2)
+            columns = result_history.snapshot()
+            self.assertEqual([STOCK_CHECK, SEARCH_CHECK], columns['kind'].tolist())
+            self.assertEqual([1, -1], columns['available'].tolist())
+            self.assertEqual([-1, 12], columns['result_count'].tolist())
+            self.assertEqual([1000, -1], columns['bytes'].tolist())
+            self.assertEqual(0.5, columns['latency'][0])
+            self.assertTrue(columns['latency'][1] != columns['latency'][1])
+            self.assertEqual([DE_URL], result_history.snapshot(domain='www.gamestop.de')['url'].tolist())
+            self.assertEqual([IT_URL], result_history.snapshot(since=2)['url'].tolist())
+            self.assertEqual(0, len(result_history.snapshot(kind=SCRAPE_CHECK)['kind']))
+        finally:
+            result_history.close()
+
+    def test_old_results_are_rolled_into_snapshots(self):
+        now = time.time()
+        result_history = ResultHistory(self.path, snapshot_dir=self.snapshot_dir, keep_seconds=3600)
+        try:
+            result_history.record(STOCK_CHECK, DE_URL, available=False, now=now - 7200)
+            result_history.record(STOCK_CHECK, DE_URL, available=True, now=now)
+            result_history.flush()
+            self.assertEqual([(STOCK_CHECK, 'www.gamestop.de', 1, None, None, None)], read_rows(self.path))
+            rolled = load_snapshots(self.snapshot_dir)
+            self.assertEqual([now - 7200], rolled['checked_at'].tolist())
+            self.assertEqual([0], rolled['available'].tolist())
+        finally:
+            result_history.close()
+        self.assertEqual(0, len(load_snapshots(os.path.join(self.directory.name, 'missing'))['url']))
+
+    def test_restock_hours(self):
+        result_history = ResultHistory(self.path)
+        try:
+            hour = 3600
+            # Out of stock and back at 7 on the first day, then again at 19 on the second one
+            for url, checked_at, available in ((DE_URL, 6 * hour, False), (DE_URL, 7 * hour, True),
+                                               (DE_URL, 8 * hour, True), (DE_URL, 30 * hour, False),
+                                               (DE_URL, 43 * hour, True), (IT_URL, 5 * hour, False),
+                                               (IT_URL, 9 * hour, True)):
+                result_history.record(STOCK_CHECK, url, available=available, now=checked_at)
+            # A failed check between two unavailable ones is not a restock
+            result_history.record(STOCK_CHECK, DE_URL, now=31 * hour)
+            columns = result_history.snapshot()
+        finally:
+            result_history.close()
+        hours = restock_hours(columns, 'www.gamestop.de')
+        self.assertEqual(24, len(hours))
+        self.assertEqual({7: 1, 19: 1}, {hour: count for hour, count in enumerate(hours.tolist()) if count})
+        self.assertEqual(3, restock_hours(columns).sum())
+        self.assertEqual(1, restock_hours(columns, 'www.gamestop.de', utc_offset=2)[9])
+
+
+if __name__ == '__main__':
+    unittest.main()
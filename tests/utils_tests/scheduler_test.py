@@ -0,0 +1,78 @@
+import asyncio
+import unittest
+from unittest import IsolatedAsyncioTestCase
+
+from utils.domain_guard import DomainUnavailableError
+from utils.scheduler import Job, Scheduler
+
+
+class SchedulerTest(IsolatedAsyncioTestCase):
+
+    async def test_jobs_run_until_done(self):
+        scheduler = Scheduler(jitter=0, domain_requests_per_second=0)
+        runs = {'a': 0, 'b': 0}
+
+        def make_step(name, times):
+            async def step():
+                runs[name] += 1
+                return 0.01 if runs[name] < times else None
+            return step
+
+        scheduler.add_job(Job('a', make_step('a', 3), url='https://www.gamestop.it/a'))
+        scheduler.add_job(Job('b', make_step('b', 5), url='https://www.gamestop.de/b'))
+        await asyncio.wait_for(scheduler.run(), 5)
+        self.assertEqual({'a': 3, 'b': 5}, runs)
+        self.assertEqual(0, scheduler.jobs_count())
+
+    async def test_domain_rate_limit_is_shared_by_jobs(self):
+        scheduler = Scheduler(jitter=0, domain_requests_per_second=20)
+        start_times = []
+        loop = asyncio.get_event_loop()
+
+        async def step():
+            start_times.append(loop.time())
+            return None
+
+        for i in range(5):
+            scheduler.add_job(Job(str(i), step, url='https://www.gamestop.it/' + str(i)))
+        await asyncio.wait_for(scheduler.run(), 5)
+        self.assertEqual(5, len(start_times))
+        # All the jobs were due at the same time, but they were spaced by 1/20 of a second
+        for previous, following in zip(start_times, start_times[1:]):
+            self.assertGreaterEqual(following - previous, 0.045)
+
+    async def test_failing_step_is_rescheduled(self):
+        scheduler = Scheduler(jitter=0)
+        runs = []
+
+        async def step():
+            runs.append(1)
+            if len(runs) == 1:
+                raise Exception('failure')
+            return None
+
+        scheduler.add_job(Job('failing', step, interval=0.01))
+        await asyncio.wait_for(scheduler.run(), 5)
+        self.assertEqual(2, len(runs))
+
+    # A paused domain postpones the job until the domain is probed again, without logging a traceback
+    async def test_paused_domain_postpones_the_job(self):
+        scheduler = Scheduler(jitter=0, domain_requests_per_second=0)
+        runs = []
+
+        async def step():
+            runs.append(asyncio.get_event_loop().time())
+            if len(runs) == 1:
+                raise DomainUnavailableError('www.gamestop.it', 0.2)
+            return None
+
+        scheduler.add_job(Job('paused', step, url='https://www.gamestop.it/a', interval=0.01))
+        with self.assertLogs('scheduler', 'INFO') as logs:
+            await asyncio.wait_for(scheduler.run(), 5)
+        self.assertEqual([], [record for record in logs.records if record.exc_info])
+        self.assertEqual(2, len(runs))
+        self.assertGreaterEqual(runs[1] - runs[0], 0.19)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import tempfile
+import unittest
+
+from utils.scrape_leases import ScrapeLeases
+from utils.scrape_state import MATCHED, NO_MATCH
+
+BASE_URL = 'https://www.gamestop.it/PS5/Games/'
+
+
+def lease_all_chunks(path: str, worker: str) -> None:
+    scrape_leases = ScrapeLeases(path)
+    try:
+        chunk = scrape_leases.lease(BASE_URL, worker)
+        while chunk is not None:
+            for product_id in chunk[2]:
+                scrape_leases.report(BASE_URL, product_id, NO_MATCH, worker)
+            scrape_leases.complete(BASE_URL, chunk[0], worker)
+            chunk = scrape_leases.lease(BASE_URL, worker)
+    finally:
+        scrape_leases.close()
+
+
+class ScrapeLeasesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'scrape_cluster.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_create_chunks(self):
+        scrape_leases = ScrapeLeases(self.path)
+        # The ids that are not due leave holes, and a chunk never spans more than chunk_size ids
+        self.assertEqual(3, scrape_leases.create_chunks(BASE_URL, [1, 2, 3, 4, 5, 9, 20], chunk_size=5))
+        self.assertEqual((1, 5, [1, 2, 3, 4, 5]), scrape_leases.lease(BASE_URL, 'a', now=0))
+        self.assertEqual((9, 9, [9]), scrape_leases.lease(BASE_URL, 'b', now=0))
+        self.assertEqual((20, 20, [20]), scrape_leases.lease(BASE_URL, 'c', now=0))
+        self.assertIsNone(scrape_leases.lease(BASE_URL, 'd', now=0))
+        self.assertEqual((0, 3), scrape_leases.progress(BASE_URL))
+        scrape_leases.close()
+
+    # The ids that are not due are left out of their chunk, so that they are not scraped
+    def test_chunks_keep_their_ids(self):
+        scrape_leases = ScrapeLeases(self.path)
+        self.assertEqual(2, scrape_leases.create_chunks(BASE_URL, [1, 3, 4, 8, 12], chunk_size=10))
+        self.assertEqual((1, 8, [1, 3, 4, 8]), scrape_leases.lease(BASE_URL, 'a', now=0))
+        self.assertEqual((12, 12, [12]), scrape_leases.lease(BASE_URL, 'a', now=0))
+        scrape_leases.close()
+
+    # The chunk of a worker that stopped renewing its lease is leased to another one
+    def test_expired_lease(self):
+        scrape_leases = ScrapeLeases(self.path, lease_seconds=10)
+        scrape_leases.create_chunks(BASE_URL, range(1, 11), chunk_size=10)
+        self.assertEqual((1, 10, list(range(1, 11))), scrape_leases.lease(BASE_URL, 'dead', now=0))
+        self.assertIsNone(scrape_leases.lease(BASE_URL, 'alive', now=5))
+        self.assertEqual((1, 10, list(range(1, 11))), scrape_leases.lease(BASE_URL, 'alive', now=10))
+        self.assertFalse(scrape_leases.renew(BASE_URL, 1, 'dead', now=11))
+        self.assertFalse(scrape_leases.complete(BASE_URL, 1, 'dead'))
+        self.assertTrue(scrape_leases.renew(BASE_URL, 1, 'alive', now=11))
+        self.assertFalse(scrape_leases.is_finished(BASE_URL))
+        self.assertTrue(scrape_leases.complete(BASE_URL, 1, 'alive'))
+        self.assertTrue(scrape_leases.is_finished(BASE_URL))
+        scrape_leases.close()
+
+    # The ids a worker could not scrape are leased again, alone, once its lease expires
+    def test_requeue(self):
+        scrape_leases = ScrapeLeases(self.path, lease_seconds=10)
+        scrape_leases.create_chunks(BASE_URL, range(1, 6), chunk_size=10)
+        self.assertEqual((1, 5, [1, 2, 3, 4, 5]), scrape_leases.lease(BASE_URL, 'a', now=0))
+        self.assertFalse(scrape_leases.requeue(BASE_URL, 1, 'b', [2]))
+        self.assertTrue(scrape_leases.requeue(BASE_URL, 1, 'a', [2, 4]))
+        self.assertIsNone(scrape_leases.lease(BASE_URL, 'b', now=5))
+        self.assertEqual((1, 5, [2, 4]), scrape_leases.lease(BASE_URL, 'b', now=10))
+        self.assertFalse(scrape_leases.is_finished(BASE_URL))
+        scrape_leases.close()
+
+    def test_take_results(self):
+        worker_leases = ScrapeLeases(self.path)
+        coordinator_leases = ScrapeLeases(self.path)
+        worker_leases.report(BASE_URL, 1, NO_MATCH, 'a', now=1)
+        worker_leases.report(BASE_URL, 2, MATCHED, 'a', now=2)
+        self.assertEqual([(1, NO_MATCH, 'a', 1), (2, MATCHED, 'a', 2)], coordinator_leases.take_results(BASE_URL))
+        self.assertEqual([], coordinator_leases.take_results(BASE_URL))
+        worker_leases.close()
+        coordinator_leases.close()
+
+    # Several worker processes on the same file scrape every id exactly once
+    def test_local_workers(self):
+        scrape_leases = ScrapeLeases(self.path)
+        scrape_leases.create_chunks(BASE_URL, range(1, 201), chunk_size=7)
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=lease_all_chunks, args=(self.path, 'worker ' + str(index)))
+                     for index in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+            self.assertEqual(0, process.exitcode)
+        results = scrape_leases.take_results(BASE_URL)
+        self.assertEqual(list(range(1, 201)), sorted(product_id for product_id, _, _, _ in results))
+        self.assertTrue(scrape_leases.is_finished(BASE_URL))
+        scrape_leases.reset(BASE_URL)
+        self.assertEqual((0, 0), scrape_leases.progress(BASE_URL))
+        scrape_leases.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import os
+import tempfile
+import unittest
+
+from utils.scrape_state import IN_STOCK, MATCHED, NO_MATCH, NOT_FOUND, REDIRECTED_HOME, ScrapeState
+
+BASE_URL = 'https://www.gamestop.it/PS5/Games/'
+
+
+class ScrapeStateTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'scrape_state.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # A new ScrapeState on the same file resumes from the committed results
+    def test_resume(self):
+        scrape_state = ScrapeState(self.path, batch_size=2)
+        scrape_state.record(BASE_URL, 1, REDIRECTED_HOME)
+        scrape_state.record(BASE_URL, 2, MATCHED)
+        scrape_state.record(BASE_URL, 3, NO_MATCH)
+        scrape_state.close()
+
+        scrape_state = ScrapeState(self.path)
+        self.assertEqual(REDIRECTED_HOME, scrape_state.get(BASE_URL, 1)[0])
+        self.assertEqual(NO_MATCH, scrape_state.get(BASE_URL, 3)[0])
+        self.assertIsNone(scrape_state.get('https://www.gamestop.de/PS5/Games/', 1))
+        self.assertEqual([4, 5], list(scrape_state.due_product_ids(BASE_URL, 1, 5)))
+        scrape_state.close()
+
+    def test_revisit(self):
+        scrape_state = ScrapeState(':memory:', revisit_home_after=1000, revisit_after=100)
+        scrape_state.record(BASE_URL, 1, REDIRECTED_HOME, now=0)
+        scrape_state.record(BASE_URL, 2, IN_STOCK, now=0)
+        scrape_state.record(BASE_URL, 3, NOT_FOUND, now=0)
+        # The ids that could not be obtained are always scraped again
+        self.assertTrue(scrape_state.is_due(BASE_URL, 3, now=1))
+        self.assertFalse(scrape_state.is_due(BASE_URL, 2, now=99))
+        self.assertTrue(scrape_state.is_due(BASE_URL, 2, now=100))
+        # The ids that redirected to the home page are revisited more slowly
+        self.assertFalse(scrape_state.is_due(BASE_URL, 1, now=100))
+        self.assertTrue(scrape_state.is_due(BASE_URL, 1, now=1000))
+        scrape_state.close()
+
+    def test_unknown_status(self):
+        scrape_state = ScrapeState(':memory:')
+        with self.assertRaises(ValueError):
+            scrape_state.record(BASE_URL, 1, 'unknown')
+        scrape_state.close()
+
+    def test_frontier_first(self):
+        scrape_state = ScrapeState(':memory:', revisit_home_after=0, revisit_after=0, frontier_first=True)
+        scrape_state.record(BASE_URL, 3, NO_MATCH)
+        scrape_state.record(BASE_URL, 2, REDIRECTED_HOME)
+        # Beyond the frontier first, then the never scraped ids and last the known ones
+        self.assertEqual([4, 5, 1, 3, 2], list(scrape_state.due_product_ids(BASE_URL, 1, 5)))
+        scrape_state.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
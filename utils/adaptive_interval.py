@@ -0,0 +1,62 @@
+from datetime import datetime
+
+
+class AdaptiveInterval:
+    """
+    Polling interval of a single url that gets shorter as soon as the page changes and backs off exponentially while
+    the page stays the same, always between a floor and a ceiling. During the hot hours of the day, when drops are more
+    likely, it never backs off beyond the base interval
+    """
+
+    def __init__(self, base: float, floor: float, ceiling: float, backoff_factor: float = 1.5, hot_hours: list = None):
+        """
+        :param base: the interval to start from, usually the configured sleep
+        :param floor: the shortest interval, used right after a change
+        :param ceiling: the longest interval, reached after many checks without changes
+        :param backoff_factor: how much the interval is multiplied by after every check without changes
+        :param hot_hours: a list of (start_hour, end_hour) tuples, as returned by parse_hot_hours
+        """
+        self.floor = min(floor, ceiling)
+        self.ceiling = max(floor, ceiling)
+        self.base = min(max(base, self.floor), self.ceiling)
+        self.backoff_factor = max(1.0, backoff_factor)
+        self.hot_hours = hot_hours if hot_hours is not None else []
+        self.current = self.base
+
+    def next_interval(self, changed: bool, now: datetime = None) -> float:
+        """
+        Computes the interval before the next check, given the result of the last one
+        :param changed: True if the last check found that the page changed
+        :param now: the current time, used for the hot hours. datetime.now() if not provided
+        :return: the interval in seconds
+        """
+        if changed:
+            self.current = self.floor
+        else:
+            self.current = min(self.ceiling, self.current * self.backoff_factor)
+        if self.__is_hot_hour(now if now is not None else datetime.now()):
+            return min(self.current, self.base)
+        return self.current
+
+    def __is_hot_hour(self, now: datetime) -> bool:
+        for start_hour, end_hour in self.hot_hours:
+            if start_hour <= end_hour:
+                if start_hour <= now.hour < end_hour:
+                    return True
+            elif now.hour >= start_hour or now.hour < end_hour:
+                return True
+        return False
+
+
+def parse_hot_hours(hot_hours_str: str) -> list:
+    """
+    Parses hot hours from a string like '9-12, 18-20', where 22-2 is a range crossing midnight
+    :param hot_hours_str: the string to parse. Can be None or empty
+    :return: the list of (start_hour, end_hour) tuples
+    """
+    hot_hours = []
+    if hot_hours_str:
+        for hours_range in hot_hours_str.split(','):
+            start_hour, end_hour = hours_range.strip().split('-')
+            hot_hours.append((int(start_hour), int(end_hour)))
+    return hot_hours
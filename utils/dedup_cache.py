@@ -0,0 +1,58 @@
+import time
+from collections import OrderedDict
+
+
+class DedupCache:
+    """
+    Bounded set of recently seen keys, each one forgotten after its own time to live. It is used to suppress the
+    notifications that were already sent in the last seconds, even when other notifications were sent in between
+    """
+
+    def __init__(self, ttl: float = 60, max_entries: int = 1024):
+        """
+        :param ttl: the default number of seconds a key is remembered
+        :param max_entries: the maximum number of keys remembered. The oldest one is forgotten first
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.__expirations = OrderedDict()
+
+    def seen(self, key, ttl: float = None, now: float = None) -> bool:
+        """
+        Tells whether the given key was seen in its time to live and, if it was not, remembers it from now on
+        :param key: any hashable key, e.g. a message or a (url, event type) tuple
+        :param ttl: the number of seconds the key is remembered. self.ttl if not provided
+        :param now: the current time, as returned by time.monotonic. Used for testing
+        :return: True if the key is a duplicate
+        """
+        now = now if now is not None else time.monotonic()
+        expiration = self.__expirations.get(key)
+        if expiration is not None and expiration > now:
+            return True
+        self.__expirations[key] = now + (ttl if ttl is not None else self.ttl)
+        self.__expirations.move_to_end(key)
+        self.__evict(now)
+        return False
+
+    def forget(self, key) -> None:
+        """
+        Forgets the given key, e.g. because the notification it refers to could not be sent
+        :param key: the key
+        :return: None
+        """
+        self.__expirations.pop(key, None)
+
+    def __evict(self, now: float) -> None:
+        """
+        Forgets the oldest keys while they are expired or there are too many of them
+        :param now: the current time
+        :return: None
+        """
+        while self.__expirations:
+            key, expiration = next(iter(self.__expirations.items()))
+            if expiration > now and len(self.__expirations) <= self.max_entries:
+                return
+            del self.__expirations[key]
+
+    def __len__(self) -> int:
+        return len(self.__expirations)
@@ -0,0 +1,235 @@
+import asyncio
+import email.utils
+import logging
+import time
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.rate_limiter import RateLimiter
+
+logger = logging.getLogger('domain_guard')
+
+# The states of the circuit breaker of a domain
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class DomainUnavailableError(Exception):
+    """
+    Raised instead of making a request to a domain whose circuit is open
+    """
+
+    def __init__(self, domain: str, retry_after: float):
+        """
+        :param domain: the domain
+        :param retry_after: the seconds after which the domain will be probed again
+        """
+        super().__init__('{} is paused for {:.0f} more seconds'.format(domain, retry_after))
+        self.domain = domain
+        self.retry_after = retry_after
+
+
+class ThrottledResponseError(Exception):
+    """
+    Raised when a domain answers 429 Too Many Requests or a 5xx status, whose body is not the requested page
+    """
+
+    def __init__(self, url: str, status: int, retry_after: float = None):
+        """
+        :param url: the url of the request
+        :param status: the status code
+        :param retry_after: the seconds of the Retry-After header, None if missing
+        """
+        super().__init__('{} answered {}'.format(url, status))
+        self.url = url
+        self.status = status
+        self.retry_after = retry_after
+
+
+class DomainGuard:
+    """
+    Protects a single domain shared by all the checks: the requests are paced by a token bucket, every 429 or 5xx
+    answer or connection error pauses the domain for an exponentially growing backoff, or for the Retry-After of the
+    answer if longer, and after failure_threshold failures in a row, or a Retry-After longer than max_backoff, the
+    circuit opens. While open, the requests fail right away with DomainUnavailableError. Once open_seconds are over a
+    single request is let through as a probe: if it succeeds the circuit closes, otherwise it opens again for twice
+    as long
+    """
+
+    def __init__(self, domain: str, requests_per_second: float = 2, burst: int = 1, backoff: float = 1,
+                 max_backoff: float = 300, failure_threshold: int = 5, open_seconds: float = 60,
+                 max_open_seconds: float = 1800, clock=time.monotonic):
+        """
+        :param domain: the domain, used simply for logging
+        :param requests_per_second: the maximum average number of requests per second. 0 or less means unlimited
+        :param burst: how many requests can be made back to back after the domain has been idle
+        :param backoff: the seconds of the pause after the first failure, doubled at every following one
+        :param max_backoff: the maximum seconds of the pause after a failure
+        :param failure_threshold: how many failures in a row open the circuit
+        :param open_seconds: the seconds the circuit stays open before the first probe
+        :param max_open_seconds: the maximum seconds the circuit stays open after the failed probes
+        :param clock: the function that returns the current time. Used for testing
+        """
+        self.domain = domain
+        self.rate_limiter = RateLimiter(requests_per_second, burst)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.clock = clock
+        self.state = CLOSED
+        self.failures = 0
+        self.blocked_until = 0
+        self.open_until = 0
+        self.__current_open_seconds = open_seconds
+        self.__probing = False
+
+    async def acquire(self) -> None:
+        """
+        Waits until a request can be made to the domain
+        :return: None
+        :raises DomainUnavailableError: if the circuit is open, or if it's half open and the probe is running
+        """
+        now = self.clock()
+        if self.state == OPEN:
+            if now < self.open_until:
+                raise DomainUnavailableError(self.domain, self.open_until - now)
+            self.state = HALF_OPEN
+            logger.info('Probing {}'.format(self.domain))
+        if self.state == HALF_OPEN:
+            if self.__probing:
+                raise DomainUnavailableError(self.domain, self.backoff)
+            self.__probing = True
+        try:
+            if self.blocked_until > now:
+                await asyncio.sleep(self.blocked_until - now)
+            await self.rate_limiter.acquire()
+        except BaseException:
+            # A probe cancelled before starting lets the next request probe
+            self.__probing = False
+            raise
+
+    def record_success(self) -> None:
+        """
+        Records that a request succeeded, closing the circuit
+        :return: None
+        """
+        if self.state != CLOSED:
+            logger.info('{} is back, closing its circuit'.format(self.domain))
+        self.state = CLOSED
+        self.failures = 0
+        self.__current_open_seconds = self.open_seconds
+
+    def record_failure(self, retry_after: float = None) -> None:
+        """
+        Records that a request failed, pausing the domain and opening the circuit if needed
+        :param retry_after: the seconds the domain asked to wait for, if any
+        :return: None
+        """
+        now = self.clock()
+        self.failures += 1
+        delay = min(self.max_backoff, self.backoff * 2 ** (self.failures - 1))
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        self.blocked_until = now + delay
+        if self.state == HALF_OPEN:
+            self.__current_open_seconds = min(self.max_open_seconds, self.__current_open_seconds * 2)
+            self.__open(now, delay)
+        elif self.state == CLOSED and (self.failures >= self.failure_threshold or delay > self.max_backoff):
+            # A Retry-After longer than the maximum backoff pauses the domain without making the requests wait
+            self.__open(now, delay)
+
+    @asynccontextmanager
+    async def request(self):
+        """
+        Wraps a request to the domain, waiting for its turn first and recording whether it succeeded. A
+        ThrottledResponseError, a connection error or a timeout count as failures, any other exception is ignored
+        :raises DomainUnavailableError: if the circuit is open
+        """
+        await self.acquire()
+        try:
+            yield
+        except ThrottledResponseError as exception:
+            self.record_failure(exception.retry_after)
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            self.record_failure()
+            raise
+        else:
+            self.record_success()
+        finally:
+            self.__probing = False
+
+    def __open(self, now: float, delay: float) -> None:
+        self.state = OPEN
+        self.open_until = now + max(self.__current_open_seconds, delay)
+        logger.warning('{} failed {} times in a row, pausing it for {:.0f} seconds'.format(
+            self.domain, self.failures, self.open_until - now))
+
+
+class DomainGuards:
+    """
+    The DomainGuard of every domain, created the first time the domain is requested, so that all the checks of the
+    same gamestop country share the same limits
+    """
+
+    def __init__(self, **guard_options):
+        """
+        :param guard_options: the keyword arguments of every DomainGuard, except the domain
+        """
+        self.guard_options = guard_options
+        self.__guards = {}
+
+    @classmethod
+    def from_config(cls, config_dict: dict) -> 'DomainGuards':
+        """
+        Creates the DomainGuards from a configuration section, falling back to the defaults for the missing keys
+        :param config_dict: the dict of the configuration section
+        :return: the DomainGuards
+        """
+        return cls(requests_per_second=float(config_dict.get('domain_requests_per_second', 2)),
+                   burst=int(config_dict.get('domain_burst', 1)),
+                   backoff=float(config_dict.get('backoff', 1)),
+                   max_backoff=float(config_dict.get('max_backoff', 300)),
+                   failure_threshold=int(config_dict.get('failure_threshold', 5)),
+                   open_seconds=float(config_dict.get('open_seconds', 60)),
+                   max_open_seconds=float(config_dict.get('max_open_seconds', 1800)))
+
+    def get(self, url: str) -> DomainGuard:
+        """
+        :param url: a url of the domain
+        :return: the DomainGuard of the domain of the given url
+        """
+        domain = urlsplit(url).netloc
+        guard = self.__guards.get(domain)
+        if guard is None:
+            guard = self.__guards[domain] = DomainGuard(domain, **self.guard_options)
+        return guard
+
+    def open_circuits(self) -> int:
+        """
+        :return: how many domains have their circuit open or half open
+        """
+        return sum(1 for guard in self.__guards.values() if guard.state != CLOSED)
+
+
+def parse_retry_after(value: str, now: float = None) -> float:
+    """
+    :param value: the value of a Retry-After header, either seconds or an HTTP date
+    :param now: the current time, as returned by time.time. Used for testing
+    :return: the seconds to wait, or None if the value is missing or invalid
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, retry_at - (now if now is not None else time.time()))
@@ -0,0 +1,269 @@
+import asyncio
+import codecs
+import contextlib
+import contextvars
+import logging
+import time
+from urllib.parse import urlsplit
+
+import aiohttp
+
+from utils.domain_guard import DomainGuards, ThrottledResponseError, parse_retry_after
+from utils.utils import get_bool
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:99.0) Gecko/20100101 Firefox/99.0',
+}
+
+logger = logging.getLogger('http_client')
+# The DownloadCounter of the current task, which the requests add their downloaded bytes to. See count_downloads
+DOWNLOAD_COUNTER = contextvars.ContextVar('download_counter', default=None)
+
+
+class DownloadCounter:
+    """
+    The bytes downloaded by the requests of a single check
+    """
+
+    def __init__(self):
+        self.bytes = 0
+
+
+def count_downloads() -> DownloadCounter:
+    """
+    Starts counting the bytes downloaded through an HttpClient by the current task from now on, including the tasks it
+    creates, until the next call
+    :return: the DownloadCounter
+    """
+    counter = DownloadCounter()
+    DOWNLOAD_COUNTER.set(counter)
+    return counter
+
+
+async def add_downloads_to_caller(coroutine):
+    """
+    Awaits the given coroutine, which may start counting its own downloads with count_downloads, and adds the bytes it
+    counted to the DownloadCounter of the caller as well, e.g. the product pages checked by a search. It must run in
+    its own task, since count_downloads replaces the DownloadCounter of the task
+    :param coroutine: the coroutine
+    :return: the result of the coroutine
+    """
+    caller_counter = DOWNLOAD_COUNTER.get()
+    try:
+        return await coroutine
+    finally:
+        counter = DOWNLOAD_COUNTER.get()
+        if caller_counter is not None and counter is not None and counter is not caller_counter:
+            caller_counter.bytes += counter.bytes
+
+
+class HttpResponse:
+    """
+    The parts of an aiohttp response that are used once the connection has been released
+    """
+
+    def __init__(self, url: str, status: int, headers, text: str):
+        """
+        :param url: the final url, after the redirects
+        :param status: the status code
+        :param headers: the case-insensitive headers
+        :param text: the body, empty if the server did not send any
+        """
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.text = text
+
+
+class HttpClient:
+    """
+    Long-lived asynchronous HTTP client that keeps one pooled aiohttp ClientSession per domain, so that consecutive
+    requests to the same site reuse keep-alive connections instead of paying for a new TCP and TLS handshake every time
+    """
+
+    def __init__(self, limit_per_host: int = 10, keepalive_timeout: float = 30, dns_cache_ttl: int = 300,
+                 timeout: float = 30, headers: dict = None, domain_guards: DomainGuards = None):
+        """
+        :param limit_per_host: the maximum number of simultaneous connections opened to the same domain
+        :param keepalive_timeout: how many seconds an idle connection is kept open to be reused
+        :param dns_cache_ttl: how many seconds a resolved address is cached for
+        :param timeout: the total timeout in seconds of a single request
+        :param headers: the headers sent with every request. The default User-Agent is used if not provided
+        :param domain_guards: the DomainGuards that pace the requests to every domain and pause the failing ones. Can
+        be None
+        """
+        self.limit_per_host = limit_per_host
+        self.keepalive_timeout = keepalive_timeout
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self.headers = headers if headers is not None else dict(DEFAULT_HEADERS)
+        self.domain_guards = domain_guards
+        # The Metrics that record the duration and the size of every request. None to disable them
+        self.metrics = None
+        self.__sessions = {}
+
+    @classmethod
+    def from_config(cls, config_dict: dict) -> 'HttpClient':
+        """
+        Creates an HttpClient from a configuration section, falling back to the defaults for the missing keys
+        :param config_dict: the dict of the configuration section
+        :return: the HttpClient
+        """
+        return cls(limit_per_host=int(config_dict.get('limit_per_host', 10)),
+                   keepalive_timeout=float(config_dict.get('keepalive_timeout', 30)),
+                   dns_cache_ttl=int(config_dict.get('dns_cache_ttl', 300)),
+                   timeout=float(config_dict.get('timeout', 30)),
+                   domain_guards=DomainGuards.from_config(config_dict) if get_bool(config_dict.get('domain_guard'))
+                   else None)
+
+    async def get_text(self, url: str) -> str:
+        """
+        Gets the html page of the given url through the pooled session of its domain
+        :param url: the url to get
+        :return: the html page
+        """
+        async with self.__guard(url):
+            start = time.perf_counter()
+            async with self.__get_session(url).get(url) as r:
+                _raise_for_throttling(url, r)
+                text = await r.text()
+                self.__record(url, r, start)
+                return text
+
+    async def get_response(self, url: str, headers: dict = None, skip_redirect_body=None) -> HttpResponse:
+        """
+        Gets the given url through the pooled session of its domain, sending the given additional headers
+        :param url: the url to get
+        :param headers: the headers to add to the default ones, e.g. the conditional ones
+        :param skip_redirect_body: a function that takes the final url of a redirected request and returns True if
+        its body is not needed, in which case it is not downloaded. Can be None
+        :return: the HttpResponse, whose text is empty if the body was not downloaded
+        """
+        async with self.__guard(url):
+            start = time.perf_counter()
+            async with self.__get_session(url).get(url, headers=headers) as r:
+                _raise_for_throttling(url, r)
+                final_url = str(r.url)
+                if r.history and skip_redirect_body is not None and skip_redirect_body(final_url):
+                    self.__record(url, r, start)
+                    # The unread body makes the connection unusable for keep-alive, so it's closed right away
+                    r.close()
+                    return HttpResponse(url=final_url, status=r.status, headers=r.headers.copy(), text='')
+                text = await r.text() if r.status != 304 else ''
+                self.__record(url, r, start)
+                return HttpResponse(url=final_url, status=r.status, headers=r.headers.copy(), text=text)
+
+    async def head(self, url: str, allow_redirects: bool = False) -> HttpResponse:
+        """
+        Sends a HEAD request to the given url through the pooled session of its domain, which tells the status and the
+        redirect target without downloading the body
+        :param url: the url
+        :param allow_redirects: if False, the redirect response itself is returned, with its Location header
+        :return: the HttpResponse, with an empty text
+        """
+        async with self.__guard(url):
+            start = time.perf_counter()
+            async with self.__get_session(url).head(url, allow_redirects=allow_redirects) as r:
+                _raise_for_throttling(url, r)
+                self.__record(url, r, start)
+                return HttpResponse(url=str(r.url), status=r.status, headers=r.headers.copy(), text='')
+
+    async def read_until(self, url: str, consume, chunk_size: int = 16384):
+        """
+        Gets the given url reading the body in chunks, which are decoded and passed to consume one by one. As soon as
+        consume returns something different from None, the rest of the body is not downloaded and the connection is
+        released
+        :param url: the url to get
+        :param consume: a function that takes the next decoded chunk of text and returns None if it needs more
+        :param chunk_size: the maximum size in bytes of a chunk
+        :return: the first value different from None returned by consume, or None if the whole body was consumed
+        """
+        async with self.__guard(url):
+            start = time.perf_counter()
+            async with self.__get_session(url).get(url) as r:
+                _raise_for_throttling(url, r)
+                decoder = codecs.getincrementaldecoder(r.charset or 'utf-8')(errors='replace')
+                async for chunk in r.content.iter_chunked(chunk_size):
+                    result = consume(decoder.decode(chunk))
+                    if result is not None:
+                        self.__record(url, r, start)
+                        # The unread body makes the connection unusable for keep-alive, so it's closed right away
+                        r.close()
+                        return result
+                self.__record(url, r, start)
+                return consume(decoder.decode(b'', final=True))
+
+    async def close(self) -> None:
+        """
+        Closes all the pooled sessions and their connections
+        :return: None
+        """
+        sessions = list(self.__sessions.values())
+        self.__sessions.clear()
+        await asyncio.gather(*[session.close() for session in sessions])
+        if sessions:
+            # Gives the SSL transports the time to be closed, as suggested by aiohttp
+            await asyncio.sleep(0.25)
+        logger.info('Closed {} pooled sessions'.format(len(sessions)))
+
+    def __record(self, url: str, response: aiohttp.ClientResponse, start: float) -> None:
+        """
+        Records the duration of the request and the bytes read so far in the metrics, if enabled, and adds the bytes to
+        the DownloadCounter of the current task, if any
+        :param url: the url of the request
+        :param response: the response
+        :param start: the value of time.perf_counter when the request started
+        :return: None
+        """
+        counter = DOWNLOAD_COUNTER.get()
+        if counter is not None:
+            counter.bytes += response.content.total_bytes
+        if self.metrics is not None:
+            domain = urlsplit(url).netloc
+            self.metrics.request_seconds.observe(time.perf_counter() - start, domain)
+            self.metrics.downloaded_bytes.inc(response.content.total_bytes, domain)
+
+    def __guard(self, url: str):
+        """
+        :param url: the url of the request
+        :return: the context manager that wraps the request with the DomainGuard of its domain, doing nothing if the
+        domain guards are disabled
+        """
+        return self.domain_guards.get(url).request() if self.domain_guards is not None else _no_guard()
+
+    def __get_session(self, url: str) -> aiohttp.ClientSession:
+        """
+        Gets the pooled session for the domain of the given url, creating it the first time the domain is requested
+        :param url: the url
+        :return: the ClientSession of the domain
+        """
+        domain = urlsplit(url).netloc
+        session = self.__sessions.get(domain)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit_per_host=self.limit_per_host,
+                                             keepalive_timeout=self.keepalive_timeout,
+                                             use_dns_cache=True, ttl_dns_cache=self.dns_cache_ttl)
+            session = aiohttp.ClientSession(connector=connector, headers=self.headers,
+                                            timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self.__sessions[domain] = session
+        return session
+
+
+@contextlib.asynccontextmanager
+async def _no_guard():
+    """
+    The context manager used instead of a DomainGuard when they are disabled, which does nothing
+    """
+    yield
+
+
+def _raise_for_throttling(url: str, response: aiohttp.ClientResponse) -> None:
+    """
+    Raises a ThrottledResponseError if the given response is 429 Too Many Requests or a 5xx status, whose body is an
+    error page instead of the requested one
+    :param url: the url of the request
+    :param response: the response
+    :return: None
+    """
+    if response.status == 429 or response.status >= 500:
+        raise ThrottledResponseError(url, response.status, parse_retry_after(response.headers.get('Retry-After')))
@@ -0,0 +1,55 @@
+import re
+
+
+class KeywordMatcher:
+    """
+    Case-insensitive matcher of a list of keywords, which can be regular expressions, compiled once into a single
+    combined regular expression so that a text is scanned in a single pass for all of them
+    """
+
+    def __init__(self, keywords: list):
+        """
+        :param keywords: the keywords to look for
+        """
+        self.keywords = list(keywords)
+        self.__patterns = [re.compile(keyword, re.IGNORECASE) for keyword in self.keywords]
+        self.__combined_pattern = None
+        # Keywords with their own groups could refer to them by number, which would change once combined
+        if self.__patterns and all(pattern.groups == 0 for pattern in self.__patterns):
+            self.__combined_pattern = re.compile(
+                '|'.join('(?P<k{}>{})'.format(index, keyword) for index, keyword in enumerate(self.keywords)),
+                re.IGNORECASE)
+
+    def find(self, text: str, find_all: bool = False) -> list:
+        """
+        Finds which keywords are in the given text
+        :param text: the text
+        :param find_all: if False, the scan stops at the first keyword found. Otherwise, it looks for all of them
+        :return: the list of the keywords found, in the order they were given
+        """
+        found = set()
+        if self.__combined_pattern is not None:
+            for match in self.__combined_pattern.finditer(text):
+                found.add(int(match.lastgroup[1:]))
+                if not find_all or len(found) == len(self.keywords):
+                    break
+        if find_all or self.__combined_pattern is None:
+            # A keyword can be hidden by another one that matches at the same position, so the keywords that were not
+            # found in the single pass are looked for one by one
+            for index, pattern in enumerate(self.__patterns):
+                if index not in found and pattern.search(text):
+                    found.add(index)
+                    if not find_all:
+                        break
+        return [self.keywords[index] for index in sorted(found)]
+
+    def matches(self, text: str, check_all_keywords: bool = False) -> bool:
+        """
+        :param text: the text
+        :param check_all_keywords: if True, all the keywords must be in the text. Otherwise, one is enough
+        :return: True if the text contains the keywords
+        """
+        if not self.keywords:
+            return False
+        found = self.find(text, find_all=check_all_keywords)
+        return len(found) == len(self.keywords) if check_all_keywords else len(found) > 0
@@ -0,0 +1,209 @@
+import bisect
+import logging
+import math
+
+from aiohttp import web
+
+logger = logging.getLogger('metrics')
+
+# Upper bounds in seconds of the buckets of the latency histograms
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+# Upper bounds in seconds of the buckets of the change to notification histogram, which includes retries
+NOTIFICATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+
+class Counter:
+    """
+    A value that only goes up, one for every combination of label values
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = ()):
+        """
+        :param name: the name of the metric
+        :param documentation: the help text of the metric
+        :param label_names: the names of the labels, whose values are given in the same order to inc
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.values = {}
+
+    def inc(self, amount: float = 1, *label_values) -> None:
+        """
+        Increments the value of the given label values
+        :param amount: how much to add
+        :param label_values: the values of the labels, in the order of label_names
+        :return: None
+        """
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> list:
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} counter'.format(self.name)]
+        for label_values, value in self.values.items():
+            lines.append('{}{} {}'.format(self.name, _format_labels(self.label_names, label_values), value))
+        return lines
+
+
+class Histogram:
+    """
+    The distribution of the observed values, counted in buckets, one for every combination of label values
+    """
+
+    def __init__(self, name: str, documentation: str, label_names: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        """
+        :param name: the name of the metric
+        :param documentation: the help text of the metric
+        :param label_names: the names of the labels, whose values are given in the same order to observe
+        :param buckets: the sorted upper bounds of the buckets. The +Inf bucket is added automatically
+        """
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        # For every combination of label values: the count of every bucket, not cumulative, the sum and the count
+        self.values = {}
+
+    def observe(self, value: float, *label_values) -> None:
+        """
+        Records a value for the given label values
+        :param value: the value, e.g. a duration in seconds
+        :param label_values: the values of the labels, in the order of label_names
+        :return: None
+        """
+        counts = self.values.get(label_values)
+        if counts is None:
+            counts = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        counts[0][bisect.bisect_left(self.buckets, value)] += 1
+        counts[1] += value
+        counts[2] += 1
+
+    def render(self) -> list:
+        lines = ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} histogram'.format(self.name)]
+        for label_values, (bucket_counts, total, count) in self.values.items():
+            cumulative = 0
+            for upper_bound, bucket_count in zip(self.buckets + (math.inf,), bucket_counts):
+                cumulative += bucket_count
+                le = '+Inf' if upper_bound == math.inf else str(upper_bound)
+                lines.append('{}_bucket{} {}'.format(
+                    self.name, _format_labels(self.label_names + ('le',), label_values + (le,)), cumulative))
+            labels = _format_labels(self.label_names, label_values)
+            lines.append('{}_sum{} {}'.format(self.name, labels, total))
+            lines.append('{}_count{} {}'.format(self.name, labels, count))
+        return lines
+
+
+class Gauge:
+    """
+    A value that is read from a function only when the metrics are rendered, e.g. the size of a queue
+    """
+
+    def __init__(self, name: str, documentation: str, function):
+        """
+        :param name: the name of the metric
+        :param documentation: the help text of the metric
+        :param function: a function without arguments that returns the current value
+        """
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+
+    def render(self) -> list:
+        return ['# HELP {} {}'.format(self.name, self.documentation), '# TYPE {} gauge'.format(self.name),
+                '{} {}'.format(self.name, self.function())]
+
+
+class Metrics:
+    """
+    The metrics of the checks, exposed in the Prometheus text format. The code that records them holds a reference to
+    a Metrics object only when they are enabled, so that they cost a single None check when they are not
+    """
+
+    def __init__(self):
+        self.request_seconds = Histogram('gamestop_request_seconds', 'Duration of the requests to gamestop',
+                                         ('domain',))
+        self.downloaded_bytes = Counter('gamestop_downloaded_bytes_total', 'Bytes downloaded from gamestop',
+                                        ('domain',))
+        self.parse_seconds = Histogram('gamestop_parse_seconds', 'Duration of the parsing of the pages', ('check',))
+        self.errors = Counter('gamestop_errors_total', 'Errors by type', ('type',))
+        self.notification_seconds = Histogram(
+            'gamestop_notification_seconds', 'Time from the detection of a change to its notification being delivered',
+            ('event_type', 'consumer'), NOTIFICATION_BUCKETS)
+        self.__metrics = [self.request_seconds, self.downloaded_bytes, self.parse_seconds, self.errors,
+                          self.notification_seconds]
+
+    def add_gauge(self, name: str, documentation: str, function) -> None:
+        """
+        Adds a gauge whose value is read from the given function when the metrics are rendered
+        :param name: the name of the metric
+        :param documentation: the help text of the metric
+        :param function: a function without arguments that returns the current value
+        :return: None
+        """
+        self.__metrics.append(Gauge(name, documentation, function))
+
+    def record_error(self, exception: BaseException) -> None:
+        """
+        Counts the given exception by its type
+        :param exception: the exception
+        :return: None
+        """
+        self.errors.inc(1, type(exception).__name__)
+
+    def render(self) -> str:
+        """
+        :return: all the metrics in the Prometheus text format
+        """
+        lines = []
+        for metric in self.__metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsServer:
+    """
+    Local HTTP endpoint that serves the Metrics on /metrics
+    """
+
+    def __init__(self, metrics: Metrics, host: str = '127.0.0.1', port: int = 9464):
+        """
+        :param metrics: the Metrics to serve
+        :param host: the address to listen on
+        :param port: the port to listen on. 0 picks a free one
+        """
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self.__runner = None
+
+    async def start(self) -> None:
+        """
+        Starts listening. Once started, port is the actual port
+        :return: None
+        """
+        app = web.Application()
+        app.router.add_get('/metrics', self.__handle_metrics)
+        self.__runner = web.AppRunner(app)
+        await self.__runner.setup()
+        site = web.TCPSite(self.__runner, self.host, self.port)
+        await site.start()
+        self.port = self.__runner.addresses[0][1]
+        logger.info('Serving the metrics on http://{}:{}/metrics'.format(self.host, self.port))
+
+    async def stop(self) -> None:
+        """
+        Stops listening
+        :return: None
+        """
+        if self.__runner is not None:
+            await self.__runner.cleanup()
+            self.__runner = None
+
+    async def __handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render(), content_type='text/plain', charset='utf-8')
+
+
+def _format_labels(label_names: tuple, label_values: tuple) -> str:
+    if not label_names:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for name, value in zip(label_names, label_values)) + '}'
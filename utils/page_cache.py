@@ -0,0 +1,109 @@
+import hashlib
+import logging
+import re
+from collections import OrderedDict
+
+IRRELEVANT_SECTIONS_REGEX = re.compile(r'<script\b.*?</script\s*>|<style\b.*?</style\s*>|<!--.*?-->',
+                                       re.IGNORECASE | re.DOTALL)
+
+logger = logging.getLogger('page_cache')
+
+
+class CachedPage:
+    """
+    What is remembered of the last download of a page: its validators, the hash of its content and the verdicts of
+    the checks made on it
+    """
+
+    def __init__(self, etag: str = None, last_modified: str = None, content_hash: str = None):
+        """
+        :param etag: the ETag header of the response
+        :param last_modified: the Last-Modified header of the response
+        :param content_hash: the hash of the relevant section of the page, as returned by hash_page
+        """
+        self.etag = etag
+        self.last_modified = last_modified
+        self.content_hash = content_hash
+        self.verdicts = {}
+
+    def get_conditional_headers(self) -> dict:
+        """
+        Gets the headers that make the server answer 304 Not Modified if the page did not change
+        :return: the dict of headers
+        """
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class PageCache:
+    """
+    Bounded LRU cache of the pages that are polled, keyed by url. It is used to tell whether a page changed since its
+    last download, so that the previous verdict can be reused without parsing the page again
+    """
+
+    def __init__(self, max_entries: int = 256):
+        """
+        :param max_entries: the maximum number of pages remembered. The least recently used one is evicted first
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.__pages = OrderedDict()
+
+    def get(self, url: str) -> CachedPage:
+        """
+        Gets the CachedPage of the given url, marking it as the most recently used
+        :param url: the url
+        :return: the CachedPage, or None if the url is not cached
+        """
+        cached_page = self.__pages.get(url)
+        if cached_page is not None:
+            self.__pages.move_to_end(url)
+        return cached_page
+
+    def put(self, url: str, cached_page: CachedPage) -> None:
+        """
+        Caches the given CachedPage for the given url, evicting the least recently used pages if the cache is full
+        :param url: the url
+        :param cached_page: the CachedPage
+        :return: None
+        """
+        self.__pages[url] = cached_page
+        self.__pages.move_to_end(url)
+        while len(self.__pages) > self.max_entries:
+            evicted_url, _ = self.__pages.popitem(last=False)
+            logger.debug('Evicted {} from the page cache'.format(evicted_url))
+
+    def record_hit(self) -> None:
+        self.hits += 1
+
+    def record_miss(self) -> None:
+        self.misses += 1
+
+    def hit_rate(self) -> float:
+        """
+        :return: the fraction of the lookups that found an unchanged page, 0 if there were none
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __len__(self) -> int:
+        return len(self.__pages)
+
+
+def hash_page(html_text: str) -> str:
+    """
+    Hashes the section of a html page that matters for the checks: the body, without scripts, styles and comments,
+    which can change at every request even if the page did not
+    :param html_text: the html page
+    :return: the hash as a hex string
+    """
+    body_start = html_text.find('<body')
+    if body_start != -1:
+        html_text = html_text[body_start:]
+    relevant_section = IRRELEVANT_SECTIONS_REGEX.sub('', html_text)
+    return hashlib.blake2b(relevant_section.encode('utf-8', errors='replace'), digest_size=16).hexdigest()
@@ -0,0 +1,72 @@
+import asyncio
+import concurrent.futures
+import logging
+import multiprocessing
+
+PROCESS_EXECUTOR = 'process'
+THREAD_EXECUTOR = 'thread'
+EXECUTOR_KINDS = (PROCESS_EXECUTOR, THREAD_EXECUTOR)
+
+logger = logging.getLogger('parse_executor')
+
+
+class ParseExecutor:
+    """
+    Runs the parsing of the fetched pages in a pool of worker processes, or threads, instead of on the event loop, so
+    that the other checks keep fetching while a large page is parsed. The jobs must be module-level functions that
+    return small results, since the arguments and the results of the worker processes are pickled. At most
+    max_pending jobs are submitted at the same time: the others wait for their turn without using memory in the pool
+    """
+
+    def __init__(self, workers: int = 2, max_pending: int = None, kind: str = PROCESS_EXECUTOR):
+        """
+        :param workers: the number of worker processes or threads
+        :param max_pending: how many jobs can be submitted to the pool at the same time. Twice the workers if not
+        provided
+        :param kind: PROCESS_EXECUTOR or THREAD_EXECUTOR
+        """
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError('Unknown parse executor ' + str(kind) + '! The available ones are ' + str(EXECUTOR_KINDS))
+        self.workers = max(1, workers)
+        self.max_pending = max(1, max_pending if max_pending is not None else 2 * self.workers)
+        self.kind = kind
+        if kind == PROCESS_EXECUTOR:
+            # spawn does not copy the event loop and the open connections of the parent into the workers
+            self.__pool = concurrent.futures.ProcessPoolExecutor(self.workers,
+                                                                 mp_context=multiprocessing.get_context('spawn'))
+        else:
+            self.__pool = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='parse_executor')
+        self.__semaphore = None
+        # The futures of the jobs submitted to the pool and not finished yet, cancelled by close
+        self.__futures = set()
+        self.pending = 0
+
+    async def run(self, job, *args):
+        """
+        Runs the given job in the pool, waiting for a free slot first if max_pending jobs are already submitted
+        :param job: a module-level function
+        :param args: the arguments of the job
+        :return: the result of the job
+        """
+        if self.__semaphore is None:
+            self.__semaphore = asyncio.Semaphore(self.max_pending)
+        async with self.__semaphore:
+            self.pending += 1
+            future = self.__pool.submit(job, *args)
+            self.__futures.add(future)
+            try:
+                return await asyncio.wrap_future(future)
+            finally:
+                self.__futures.discard(future)
+                self.pending -= 1
+
+    def close(self) -> None:
+        """
+        Shuts the pool down, cancelling the jobs that did not start yet
+        :return: None
+        """
+        # cancel_futures of shutdown exists only from Python 3.9
+        for future in list(self.__futures):
+            future.cancel()
+        self.__pool.shutdown(wait=False)
+        logger.info('Parse executor closed')
@@ -0,0 +1,65 @@
+class ProductIndex:
+    """
+    Index of the product ids known to be live, i.e. with a product page, and known to be dead, i.e. redirecting to the
+    home page, built from the results of the previous scrapes. Since gamestop assigns the new ids in increasing order,
+    the ids above the highest live one, the frontier, are the most likely to become new listings
+    """
+
+    def __init__(self, live_ids, dead_ids):
+        """
+        :param live_ids: the ids known to have a product page
+        :param dead_ids: the ids known to redirect to the home page
+        """
+        self.live_ids = sorted(live_ids)
+        self.dead_ids = sorted(dead_ids)
+        self.__live = set(self.live_ids)
+        self.__dead = set(self.dead_ids)
+
+    @property
+    def frontier(self) -> int:
+        """
+        :return: the highest live product id, or None if none is known
+        """
+        return self.live_ids[-1] if self.live_ids else None
+
+    def live_ranges(self) -> list:
+        """
+        :return: the list of the (first, last) ranges of consecutive live ids
+        """
+        return _to_ranges(self.live_ids)
+
+    def dead_ranges(self) -> list:
+        """
+        :return: the list of the (first, last) ranges of consecutive dead ids
+        """
+        return _to_ranges(self.dead_ids)
+
+    def prioritize(self, product_ids) -> list:
+        """
+        Sorts the given ids so that the ones beyond the frontier come first, in increasing order, followed by the
+        never scraped ones, newest first, then by the live ones and finally by the dead ones
+        :param product_ids: the ids to sort, e.g. the ones that are due
+        :return: the sorted list
+        """
+        frontier = self.frontier
+
+        def priority(product_id: int) -> tuple:
+            if frontier is not None and product_id > frontier:
+                return 0, product_id
+            if product_id in self.__dead:
+                return 3, -product_id
+            if product_id in self.__live:
+                return 2, -product_id
+            return 1, -product_id
+
+        return sorted(product_ids, key=priority)
+
+
+def _to_ranges(sorted_ids: list) -> list:
+    ranges = []
+    for product_id in sorted_ids:
+        if ranges and ranges[-1][1] == product_id - 1:
+            ranges[-1][1] = product_id
+        else:
+            ranges.append([product_id, product_id])
+    return [tuple(product_range) for product_range in ranges]
@@ -0,0 +1,153 @@
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+logger = logging.getLogger('profiler')
+
+
+class SpanStats:
+    """
+    How many times a stage ran and how long it took, in seconds
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+
+
+class Profiler:
+    """
+    Collects the duration of every stage of the checks, like the download or the parsing of a page, to tell where the
+    time of a slow check goes
+    """
+
+    def __init__(self):
+        self.spans = {}
+
+    @contextmanager
+    def span(self, stage: str):
+        """
+        Measures the duration of the wrapped code as a run of the given stage. It can wrap awaits, in which case the
+        time spent by the other coroutines in the meantime is included
+        :param stage: the name of the stage, e.g. 'stock.fetch'
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.spans.get(stage)
+            if stats is None:
+                stats = self.spans[stage] = SpanStats()
+            stats.add(time.perf_counter() - start)
+
+    def report(self) -> str:
+        """
+        :return: a table of the stages, slowest in total first
+        """
+        lines = ['{:<24} {:>8} {:>12} {:>12} {:>12}'.format('stage', 'count', 'total (s)', 'mean (ms)', 'max (ms)')]
+        for stage, stats in sorted(self.spans.items(), key=lambda item: item[1].total, reverse=True):
+            lines.append('{:<24} {:>8} {:>12.3f} {:>12.2f} {:>12.2f}'.format(
+                stage, stats.count, stats.total, stats.total / stats.count * 1000, stats.max * 1000))
+        return '\n'.join(lines)
+
+    def dump(self, path: str) -> None:
+        """
+        Writes the report to the given file
+        :param path: the path of the file
+        :return: None
+        """
+        _make_parent_dirs(path)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(self.report() + '\n')
+        logger.info('Stage timings written to {}'.format(path))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of a thread at a fixed interval from a separate thread, and writes the samples as collapsed
+    stacks, one 'outer;...;inner count' line per distinct stack, which flamegraph.pl and speedscope read directly.
+    Since the running coroutine's frames are on the stack of the event loop thread, the samples show which check was
+    running
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: int = None):
+        """
+        :param interval: the seconds between two samples
+        :param thread_id: the id of the thread to sample. The thread that creates the profiler if not provided
+        """
+        self.interval = interval
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.samples = Counter()
+        self.__stopped = threading.Event()
+        self.__thread = None
+
+    def start(self, duration: float, output_path: str = None) -> None:
+        """
+        Starts sampling for the given number of seconds, in the background
+        :param duration: how many seconds to sample for
+        :param output_path: the file the collapsed stacks are written to when the sampling is over. Can be None
+        :return: None
+        """
+        self.__stopped.clear()
+        self.__thread = threading.Thread(target=self.__run, args=(duration, output_path), name='sampling_profiler',
+                                         daemon=True)
+        self.__thread.start()
+
+    def stop(self) -> None:
+        """
+        Stops sampling before the duration is over, waiting for the output to be written
+        :return: None
+        """
+        self.__stopped.set()
+        if self.__thread is not None:
+            self.__thread.join()
+            self.__thread = None
+
+    def collapsed_stacks(self) -> list:
+        """
+        :return: the lines of the collapsed stacks, most sampled first
+        """
+        return ['{} {}'.format(stack, count) for stack, count in self.samples.most_common()]
+
+    def __run(self, duration: float, output_path: str) -> None:
+        end = time.monotonic() + duration
+        while not self.__stopped.is_set() and time.monotonic() < end:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[_collapse(frame)] += 1
+            del frame
+            self.__stopped.wait(self.interval)
+        if output_path:
+            _make_parent_dirs(output_path)
+            with open(output_path, 'w', encoding='utf-8') as f:
+                f.write('\n'.join(self.collapsed_stacks()) + '\n')
+            logger.info('{} samples written to {}'.format(sum(self.samples.values()), output_path))
+
+
+def _collapse(frame) -> str:
+    """
+    :param frame: the innermost frame of a stack
+    :return: the stack as 'outer;...;inner', every frame being 'function (file:line)'
+    """
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append('{} ({}:{})'.format(code.co_name, os.path.basename(code.co_filename), code.co_firstlineno))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+def _make_parent_dirs(path: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
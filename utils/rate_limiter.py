@@ -0,0 +1,48 @@
+import asyncio
+import time
+
+
+class RateLimiter:
+    """
+    Asynchronous token bucket that caps how many requests per second are made, no matter how many coroutines share it
+    """
+
+    def __init__(self, requests_per_second: float, burst: int = 1):
+        """
+        :param requests_per_second: the maximum average number of requests per second. 0 or less means unlimited
+        :param burst: how many requests can be made back to back after the limiter has been idle
+        """
+        self.requests_per_second = requests_per_second
+        self.burst = max(1, burst)
+        self.__tokens = float(self.burst)
+        self.__last_refill = time.monotonic()
+        # Created by acquire for the running event loop, since a lock belongs to the loop that first used it
+        self.__lock = None
+        self.__loop = None
+
+    async def acquire(self) -> None:
+        """
+        Waits until a request can be made according to the rate, and consumes it
+        :return: None
+        """
+        if self.requests_per_second <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        if self.__loop is not loop:
+            self.__lock = asyncio.Lock()
+            self.__loop = loop
+        async with self.__lock:
+            self.__refill()
+            if self.__tokens < 1:
+                await asyncio.sleep((1 - self.__tokens) / self.requests_per_second)
+                self.__refill()
+            self.__tokens -= 1
+
+    def __refill(self) -> None:
+        """
+        Adds the tokens accumulated since the last refill, up to the burst size
+        :return: None
+        """
+        now = time.monotonic()
+        self.__tokens = min(self.burst, self.__tokens + (now - self.__last_refill) * self.requests_per_second)
+        self.__last_refill = now
@@ -0,0 +1,292 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from urllib.parse import urlsplit
+
+logger = logging.getLogger('result_history')
+
+# The kinds of check whose results are recorded
+STOCK_CHECK = 'stock'
+SEARCH_CHECK = 'search'
+SCRAPE_CHECK = 'scrape'
+CHECK_KINDS = (STOCK_CHECK, SEARCH_CHECK, SCRAPE_CHECK)
+
+# The columns of a snapshot, in the order of the table
+COLUMNS = ('kind', 'url', 'domain', 'checked_at', 'available', 'result_count', 'status', 'latency', 'bytes')
+# Asks the writer thread to write what it collected right away
+_FLUSH = object()
+# Asks the writer thread to write what it collected and stop
+_STOP = object()
+
+
+class ResultHistory:
+    """
+    SQLite store of the result of every stock, search and scrape check, so that it can be analysed later, e.g. to find
+    out at which hours a domain restocks and to tune the sleep of the checks. record only puts the result in a queue:
+    a writer thread inserts the results in batches, so the checks never wait for the disk. The results older than
+    keep_seconds are rolled into compressed NumPy snapshots in snapshot_dir, keeping the SQLite file small. NumPy is
+    needed only for the snapshots
+    """
+
+    def __init__(self, path: str, batch_size: int = 200, flush_interval: float = 5, snapshot_dir: str = None,
+                 keep_seconds: float = 2592000, roll_interval: float = 3600):
+        """
+        :param path: the path of the SQLite file
+        :param batch_size: how many results are inserted together
+        :param flush_interval: the maximum seconds a result waits in the queue before being inserted
+        :param snapshot_dir: the directory of the snapshots the old results are rolled into. None to never roll them
+        :param keep_seconds: the seconds after which a result is rolled into a snapshot
+        :param roll_interval: how often, in seconds, the old results are looked for
+        """
+        self.path = path
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.snapshot_dir = snapshot_dir
+        self.keep_seconds = keep_seconds
+        self.roll_interval = roll_interval
+        self.__queue = queue.SimpleQueue()
+        self.__flushed = threading.Condition()
+        self.__requested_flushes = 0
+        self.__done_flushes = 0
+        # The writer thread and the snapshots read the file through their own connections
+        connection = sqlite3.connect(path)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('CREATE TABLE IF NOT EXISTS results (kind TEXT NOT NULL, url TEXT NOT NULL, '
+                           'domain TEXT NOT NULL, checked_at REAL NOT NULL, available INTEGER, '
+                           'result_count INTEGER, status TEXT, latency REAL, bytes INTEGER)')
+        connection.execute('CREATE INDEX IF NOT EXISTS results_by_time ON results (domain, checked_at)')
+        connection.commit()
+        connection.close()
+        self.__writer = threading.Thread(target=self.__write_results, name='result_history', daemon=True)
+        self.__writer.start()
+
+    def record(self, kind: str, url: str, available: bool = None, result_count: int = None, status: str = None,
+               latency: float = None, downloaded_bytes: int = None, now: float = None) -> None:
+        """
+        Records the result of a check, inserting it with the next batch. It never blocks
+        :param kind: one of CHECK_KINDS
+        :param url: the url of the check
+        :param available: whether the product was in stock, None if unknown or not checked
+        :param result_count: the number of results of a search, None if unknown
+        :param status: the status of a scrape, one of utils.scrape_state.STATUSES, or None
+        :param latency: the seconds the check took
+        :param downloaded_bytes: the bytes the check downloaded, None if unknown
+        :param now: the current time, as returned by time.time. Used for testing
+        :return: None
+        """
+        if kind not in CHECK_KINDS:
+            raise ValueError('Unknown check kind ' + str(kind) + '! The available ones are ' + str(CHECK_KINDS))
+        self.__queue.put((kind, url, urlsplit(url).netloc, now if now is not None else time.time(),
+                          None if available is None else int(available), result_count, status, latency,
+                          downloaded_bytes))
+
+    def flush(self) -> None:
+        """
+        Waits until all the results recorded so far are inserted. Meant for the analysis, not for the checks
+        :return: None
+        """
+        with self.__flushed:
+            self.__requested_flushes += 1
+            ticket = self.__requested_flushes
+            self.__queue.put(_FLUSH)
+            self.__flushed.wait_for(lambda: self.__done_flushes >= ticket or not self.__writer.is_alive())
+
+    def snapshot(self, kind: str = None, domain: str = None, since: float = None) -> dict:
+        """
+        Reads the recorded results into columns, which are much smaller and faster to analyse than the rows. The
+        missing values are -1 in the integer columns and NaN in the latency
+        :param kind: only the results of this kind of check, if provided
+        :param domain: only the results of this domain, e.g. 'www.gamestop.de', if provided
+        :param since: only the results recorded at this time or later, as returned by time.time, if provided
+        :return: the dict from every name of COLUMNS to the NumPy array of its values
+        :raises ImportError: if NumPy is not installed
+        """
+        numpy = get_numpy()
+        self.flush()
+        conditions, parameters = [], []
+        for condition, parameter in (('kind = ?', kind), ('domain = ?', domain), ('checked_at >= ?', since)):
+            if parameter is not None:
+                conditions.append(condition)
+                parameters.append(parameter)
+        query = 'SELECT * FROM results' + (' WHERE ' + ' AND '.join(conditions) if conditions else '') + \
+                ' ORDER BY checked_at'
+        connection = sqlite3.connect(self.path)
+        try:
+            rows = connection.execute(query, parameters).fetchall()
+        finally:
+            connection.close()
+        return _to_columns(numpy, rows)
+
+    def close(self) -> None:
+        """
+        Inserts the pending results and stops the writer thread
+        :return: None
+        """
+        self.__queue.put(_STOP)
+        self.__writer.join()
+        logger.info('Result history closed')
+
+    def __write_results(self) -> None:
+        """
+        The loop of the writer thread, which owns its own connection to the SQLite file
+        :return: None
+        """
+        connection = sqlite3.connect(self.path)
+        last_roll = None
+        stopping = False
+        try:
+            while not stopping:
+                batch = []
+                flushes = 0
+                deadline = None
+                while len(batch) < self.batch_size:
+                    try:
+                        timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                        item = self.__queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    if item is _FLUSH:
+                        flushes += 1
+                        break
+                    batch.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.flush_interval
+                if batch:
+                    connection.executemany('INSERT INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', batch)
+                    connection.commit()
+                if self.snapshot_dir and (last_roll is None or time.monotonic() - last_roll >= self.roll_interval):
+                    last_roll = time.monotonic()
+                    self.__roll(connection)
+                if flushes:
+                    with self.__flushed:
+                        self.__done_flushes += flushes
+                        self.__flushed.notify_all()
+        except Exception:
+            logger.exception('The result history stopped writing')
+        finally:
+            connection.close()
+            with self.__flushed:
+                self.__flushed.notify_all()
+
+    def __roll(self, connection: sqlite3.Connection, now: float = None) -> None:
+        """
+        Moves the results older than keep_seconds from the SQLite file to a new snapshot in snapshot_dir
+        :param connection: the connection of the writer thread
+        :param now: the current time, as returned by time.time
+        :return: None
+        """
+        numpy = get_numpy(required=False)
+        if numpy is None:
+            logger.warning('NumPy is not installed, the old results are not rolled into snapshots')
+            self.snapshot_dir = None
+            return
+        cutoff = (now if now is not None else time.time()) - self.keep_seconds
+        rows = connection.execute('SELECT * FROM results WHERE checked_at < ? ORDER BY checked_at',
+                                  (cutoff,)).fetchall()
+        if not rows:
+            return
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        path = os.path.join(self.snapshot_dir, 'results_{:.0f}_{:.0f}.npz'.format(rows[0][3], rows[-1][3]))
+        save_snapshot(path, _to_columns(numpy, rows))
+        connection.execute('DELETE FROM results WHERE checked_at < ?', (cutoff,))
+        connection.commit()
+        logger.info('Rolled {} results into {}'.format(len(rows), path))
+
+
+def save_snapshot(path: str, columns: dict) -> None:
+    """
+    Saves the given columns to a compressed NumPy file
+    :param path: the path of the file, ending with .npz
+    :param columns: the dict from every name of COLUMNS to the NumPy array of its values, as returned by
+    ResultHistory.snapshot
+    :return: None
+    """
+    get_numpy().savez_compressed(path, **columns)
+
+
+def load_snapshots(snapshot_dir: str) -> dict:
+    """
+    Loads and concatenates all the snapshots of the given directory, in the order of time
+    :param snapshot_dir: the directory of the snapshots
+    :return: the dict from every name of COLUMNS to the NumPy array of its values
+    :raises ImportError: if NumPy is not installed
+    """
+    numpy = get_numpy()
+    paths = sorted(os.path.join(snapshot_dir, name) for name in os.listdir(snapshot_dir) if name.endswith('.npz')) \
+        if os.path.isdir(snapshot_dir) else []
+    snapshots = []
+    for path in paths:
+        with numpy.load(path) as snapshot:
+            snapshots.append({column: snapshot[column] for column in COLUMNS})
+    if not snapshots:
+        return _to_columns(numpy, [])
+    columns = {column: numpy.concatenate([snapshot[column] for snapshot in snapshots]) for column in COLUMNS}
+    order = numpy.argsort(columns['checked_at'], kind='stable')
+    return {column: values[order] for column, values in columns.items()}
+
+
+def restock_hours(columns: dict, domain: str = None, utc_offset: float = 0):
+    """
+    Counts at which hour of the day the products came back in stock, i.e. a stock check of a url found it available
+    while the previous one found it unavailable
+    :param columns: the columns of the results, as returned by ResultHistory.snapshot or load_snapshots
+    :param domain: only the products of this domain, e.g. 'www.gamestop.de', if provided
+    :param utc_offset: the hours to add to UTC to get the local time of the hours
+    :return: the NumPy array of 24 counts, one for every hour of the day
+    :raises ImportError: if NumPy is not installed
+    """
+    numpy = get_numpy()
+    selected = (columns['kind'] == STOCK_CHECK) & (columns['available'] >= 0)
+    if domain is not None:
+        selected &= columns['domain'] == domain
+    urls = columns['url'][selected]
+    available = columns['available'][selected]
+    checked_at = columns['checked_at'][selected]
+    order = numpy.lexsort((checked_at, urls))
+    urls, available, checked_at = urls[order], available[order], checked_at[order]
+    restocked = (urls[1:] == urls[:-1]) & (available[:-1] == 0) & (available[1:] == 1)
+    hours = ((checked_at[1:][restocked] + utc_offset * 3600) % 86400 // 3600).astype(int)
+    return numpy.bincount(hours, minlength=24)
+
+
+def get_numpy(required: bool = True):
+    """
+    Imports NumPy, which is optional, only when it's needed
+    :param required: if True, an ImportError is raised when NumPy is not installed, otherwise None is returned
+    :return: the numpy module, or None
+    """
+    try:
+        import numpy
+    except ImportError:
+        if required:
+            raise ImportError('NumPy is needed for the snapshots of the result history, install it with '
+                              'pip install numpy')
+        return None
+    return numpy
+
+
+def _to_columns(numpy, rows: list) -> dict:
+    """
+    :param numpy: the numpy module
+    :param rows: the rows of the results table
+    :return: the dict from every name of COLUMNS to the NumPy array of its values
+    """
+    kinds, urls, domains, checked_at, available, result_counts, statuses, latencies, downloaded_bytes = \
+        zip(*rows) if rows else ((),) * len(COLUMNS)
+    return {'kind': numpy.array(kinds, dtype=str),
+            'url': numpy.array(urls, dtype=str),
+            'domain': numpy.array(domains, dtype=str),
+            'checked_at': numpy.array(checked_at, dtype=numpy.float64),
+            'available': numpy.array([-1 if value is None else value for value in available], dtype=numpy.int8),
+            'result_count': numpy.array([-1 if value is None else value for value in result_counts],
+                                        dtype=numpy.int32),
+            'status': numpy.array(['' if value is None else value for value in statuses], dtype=str),
+            'latency': numpy.array([numpy.nan if value is None else value for value in latencies],
+                                   dtype=numpy.float32),
+            'bytes': numpy.array([-1 if value is None else value for value in downloaded_bytes], dtype=numpy.int64)}
@@ -0,0 +1,159 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import random
+from urllib.parse import urlsplit
+
+from utils.domain_guard import DomainUnavailableError
+
+logger = logging.getLogger('scheduler')
+
+
+class Job:
+    """
+    A recurring check owned by the Scheduler. Every run is a single step (e.g. one stock check) that tells when the
+    next step should run
+    """
+
+    def __init__(self, name: str, step, url: str = None, interval: float = 60):
+        """
+        :param name: the name of the job, used simply for logging
+        :param step: a coroutine function without arguments that runs one step and returns how many seconds should
+        pass before the next one, or None if the job is done
+        :param url: the url requested by the step, whose domain is used for the per-domain rate limit
+        :param interval: how many seconds should pass before the next step if the step fails
+        """
+        self.name = name
+        self.step = step
+        self.url = url
+        self.interval = interval
+        self.domain = urlsplit(url).netloc if url else None
+
+
+class Scheduler:
+    """
+    Single loop that runs every stock, search and scrape Job when it's due, instead of one sleeping loop per url. The
+    due times are kept in a heap, they are spread with some jitter and the requests to the same domain are spaced
+    according to a per-domain rate limit shared by all the jobs
+    """
+
+    def __init__(self, max_concurrent_jobs: int = 20, jitter: float = 0.1, domain_requests_per_second: float = 2):
+        """
+        :param max_concurrent_jobs: how many steps can run at the same time
+        :param jitter: the fraction of the delay returned by a step that is randomly added or removed, so that the
+        jobs with the same interval drift apart instead of bursting together
+        :param domain_requests_per_second: the maximum number of steps per second started for the same domain. 0 or
+        less means unlimited
+        """
+        self.max_concurrent_jobs = max(1, max_concurrent_jobs)
+        self.jitter = jitter
+        self.domain_requests_per_second = domain_requests_per_second
+        self.__heap = []
+        self.__sequence = itertools.count()
+        self.__domain_next_slots = {}
+        self.__running = set()
+        self.__wake_up = None
+        self.__stopped = False
+
+    def add_job(self, job: Job, delay: float = 0) -> None:
+        """
+        Schedules the first step of the given job
+        :param job: the Job
+        :param delay: how many seconds should pass before the first step
+        :return: None
+        """
+        self.__push(job, self.__now() + delay)
+
+    def jobs_count(self) -> int:
+        """
+        :return: how many jobs are scheduled or running
+        """
+        return len(self.__heap) + len(self.__running)
+
+    def stop(self) -> None:
+        """
+        Makes run return as soon as possible, cancelling the running steps
+        :return: None
+        """
+        self.__stopped = True
+        self.__notify()
+
+    async def run(self) -> None:
+        """
+        Runs the jobs until all of them are done or stop is called
+        :return: None
+        """
+        self.__stopped = False
+        self.__wake_up = asyncio.Event()
+        try:
+            while not self.__stopped and (self.__heap or self.__running):
+                timeout = None
+                if self.__heap and len(self.__running) < self.max_concurrent_jobs:
+                    due_time, _, job = self.__heap[0]
+                    now = self.__now()
+                    if due_time <= now:
+                        heapq.heappop(self.__heap)
+                        self.__start_or_postpone(job, now)
+                        continue
+                    timeout = due_time - now
+                self.__wake_up.clear()
+                try:
+                    await asyncio.wait_for(self.__wake_up.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in list(self.__running):
+                task.cancel()
+
+    def __start_or_postpone(self, job: Job, now: float) -> None:
+        """
+        Starts the step of the given due job, unless its domain has been requested too recently. In that case, the
+        job is postponed to the first free slot of the domain
+        :param job: the due Job
+        :param now: the current time
+        :return: None
+        """
+        if job.domain is not None and self.domain_requests_per_second > 0:
+            next_slot = self.__domain_next_slots.get(job.domain, now)
+            if next_slot > now:
+                self.__push(job, next_slot)
+                return
+            self.__domain_next_slots[job.domain] = now + 1 / self.domain_requests_per_second
+        task = asyncio.ensure_future(self.__run_step(job))
+        self.__running.add(task)
+        task.add_done_callback(self.__on_step_done)
+
+    async def __run_step(self, job: Job) -> None:
+        try:
+            delay = await job.step()
+        except asyncio.CancelledError:
+            raise
+        except DomainUnavailableError as exception:
+            # The domain was paused by its DomainGuard, which is expected: the job waits for it to be probed again
+            logger.info('{}, postponing job {}'.format(exception, job.name))
+            delay = max(job.interval, exception.retry_after)
+        except Exception as exception:
+            logger.exception('An error occurred in job {}, going on...'.format(job.name))
+            # An error that tells how long to wait, e.g. because the domain is paused, postpones the job accordingly
+            delay = max(job.interval, getattr(exception, 'retry_after', None) or 0)
+        if delay is None:
+            logger.info('Job {} is done'.format(job.name))
+        else:
+            self.__push(job, self.__now() + delay * random.uniform(1 - self.jitter, 1 + self.jitter))
+
+    def __on_step_done(self, task: asyncio.Task) -> None:
+        self.__running.discard(task)
+        self.__notify()
+
+    def __push(self, job: Job, due_time: float) -> None:
+        heapq.heappush(self.__heap, (due_time, next(self.__sequence), job))
+        self.__notify()
+
+    def __notify(self) -> None:
+        if self.__wake_up is not None:
+            self.__wake_up.set()
+
+    @staticmethod
+    def __now() -> float:
+        return asyncio.get_event_loop().time()
@@ -0,0 +1,227 @@
+import asyncio
+import concurrent.futures
+import functools
+import logging
+import sqlite3
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger('scrape_leases')
+
+# The roles of a process in a sharded scrape
+STANDALONE = 'standalone'
+COORDINATOR = 'coordinator'
+WORKER = 'worker'
+ROLES = (STANDALONE, COORDINATOR, WORKER)
+
+
+class ScrapeLeases:
+    """
+    SQLite file shared by the coordinator and the workers of a sharded scrape. The coordinator splits the product ids
+    that are due into chunks, and every worker leases the first free chunk, scrapes its ids and reports the result of
+    every one. A lease expires if it's not renewed within lease_seconds, e.g. because its worker died, and the chunk is
+    then leased to another worker. The coordinator merges the reported results and sends the notifications, so that the
+    workers need neither the Telegram session nor the ScrapeState. Every process opens its own ScrapeLeases on the
+    same file. The methods block while another process writes the file, so the coroutines call them through run
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 120, timeout: float = 30):
+        """
+        :param path: the path of the SQLite file
+        :param lease_seconds: the seconds after which a chunk whose lease was not renewed can be leased again
+        :param timeout: the seconds to wait when another process is writing the file
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        # Autocommit, with explicit transactions where a read and a write must be atomic. The connection is used by the
+        # thread of run as well, one call at a time
+        self.__connection = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        self.__executor = concurrent.futures.ThreadPoolExecutor(1, thread_name_prefix='scrape_leases')
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS chunks (base_url TEXT NOT NULL, '
+                                  'first_id INTEGER NOT NULL, last_id INTEGER NOT NULL, product_ids TEXT NOT NULL, '
+                                  'worker TEXT, '
+                                  'leased_until REAL NOT NULL DEFAULT 0, leases INTEGER NOT NULL DEFAULT 0, '
+                                  'done INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (base_url, first_id))')
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS results (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                  'base_url TEXT NOT NULL, product_id INTEGER NOT NULL, status TEXT NOT NULL, '
+                                  'worker TEXT NOT NULL, checked_at REAL NOT NULL, merged INTEGER NOT NULL DEFAULT 0)')
+
+    def create_chunks(self, base_url: str, product_ids, chunk_size: int = 100) -> int:
+        """
+        Splits the given product ids into chunks of close ids, skipping the chunks that already exist. Every chunk
+        keeps its own ids, so that the ids left out, e.g. because they were scraped recently, are not scraped
+        :param base_url: the base url of the scrape
+        :param product_ids: the sorted ids to scrape
+        :param chunk_size: the maximum span of the ids of a chunk, from its first id
+        :return: the number of the chunks created
+        """
+        chunk_size = max(1, chunk_size)
+        chunks = []
+        for product_id in product_ids:
+            if chunks and product_id < chunks[-1][0] + chunk_size:
+                chunks[-1].append(product_id)
+            else:
+                chunks.append([product_id])
+        with self.__transaction():
+            created = self.__connection.executemany(
+                'INSERT OR IGNORE INTO chunks (base_url, first_id, last_id, product_ids) VALUES (?, ?, ?, ?)',
+                [(base_url, chunk[0], chunk[-1], ','.join(str(product_id) for product_id in chunk))
+                 for chunk in chunks]).rowcount
+        logger.info('Created {} chunks of {}'.format(created, base_url))
+        return created
+
+    def lease(self, base_url: str, worker: str, now: float = None) -> tuple:
+        """
+        Leases to the given worker the first chunk that is not done and not leased, or whose lease expired
+        :param base_url: the base url of the scrape
+        :param worker: the name of the worker
+        :param now: the current time, as returned by time.time. Used for testing
+        :return: a tuple with the first id, the last id and the list of the ids of the chunk, or None if there is no
+        free chunk
+        """
+        now = now if now is not None else time.time()
+        with self.__transaction():
+            row = self.__connection.execute('SELECT first_id, last_id, product_ids, worker FROM chunks WHERE '
+                                            'base_url = ? AND done = 0 AND leased_until <= ? ORDER BY first_id '
+                                            'LIMIT 1', (base_url, now)).fetchone()
+            if row is None:
+                return None
+            first_id, last_id, product_ids, previous_worker = row
+            self.__connection.execute('UPDATE chunks SET worker = ?, leased_until = ?, leases = leases + 1 '
+                                      'WHERE base_url = ? AND first_id = ?',
+                                      (worker, now + self.lease_seconds, base_url, first_id))
+        if previous_worker is not None:
+            logger.warning('The lease of {} on the chunk {}-{} expired, leased again to {}'.format(
+                previous_worker, first_id, last_id, worker))
+        return first_id, last_id, [int(product_id) for product_id in product_ids.split(',')]
+
+    def renew(self, base_url: str, first_id: int, worker: str, now: float = None) -> bool:
+        """
+        Extends the lease of the given worker on the given chunk
+        :param base_url: the base url of the scrape
+        :param first_id: the first id of the chunk
+        :param worker: the name of the worker
+        :param now: the current time, as returned by time.time. Used for testing
+        :return: False if the chunk is not leased to the worker anymore, e.g. because its lease expired
+        """
+        now = now if now is not None else time.time()
+        return self.__connection.execute('UPDATE chunks SET leased_until = ? WHERE base_url = ? AND first_id = ? '
+                                         'AND worker = ? AND done = 0',
+                                         (now + self.lease_seconds, base_url, first_id, worker)).rowcount == 1
+
+    def complete(self, base_url: str, first_id: int, worker: str) -> bool:
+        """
+        Marks the given chunk as done
+        :param base_url: the base url of the scrape
+        :param first_id: the first id of the chunk
+        :param worker: the name of the worker that scraped it
+        :return: False if the chunk was not leased to the worker anymore, in which case it's left to the new one
+        """
+        return self.__connection.execute('UPDATE chunks SET done = 1 WHERE base_url = ? AND first_id = ? AND '
+                                         'worker = ? AND done = 0', (base_url, first_id, worker)).rowcount == 1
+
+    def requeue(self, base_url: str, first_id: int, worker: str, product_ids: list) -> bool:
+        """
+        Leaves in the given chunk only the given ids, which its worker could not scrape, so that they are leased again
+        once the lease expires instead of the chunk being done
+        :param base_url: the base url of the scrape
+        :param first_id: the first id of the chunk
+        :param worker: the name of the worker that leased it
+        :param product_ids: the ids that were not reported
+        :return: False if the chunk was not leased to the worker anymore, in which case it's left to the new one
+        """
+        return self.__connection.execute('UPDATE chunks SET product_ids = ? WHERE base_url = ? AND first_id = ? AND '
+                                         'worker = ? AND done = 0',
+                                         (','.join(str(product_id) for product_id in product_ids), base_url, first_id,
+                                          worker)).rowcount == 1
+
+    def cancel(self, base_url: str) -> None:
+        """
+        Marks all the chunks of the given base url as done, so that the workers stop after their current product
+        :param base_url: the base url of the scrape
+        :return: None
+        """
+        self.__connection.execute('UPDATE chunks SET done = 1 WHERE base_url = ?', (base_url,))
+
+    def reset(self, base_url: str) -> None:
+        """
+        Removes the chunks and the merged results of the given base url, so that a new sweep can be created
+        :param base_url: the base url of the scrape
+        :return: None
+        """
+        with self.__transaction():
+            self.__connection.execute('DELETE FROM chunks WHERE base_url = ?', (base_url,))
+            self.__connection.execute('DELETE FROM results WHERE base_url = ? AND merged = 1', (base_url,))
+
+    def report(self, base_url: str, product_id: int, status: str, worker: str, now: float = None) -> None:
+        """
+        Reports the result of a product id, to be merged by the coordinator
+        :param base_url: the base url of the scrape
+        :param product_id: the product id
+        :param status: one of utils.scrape_state.STATUSES
+        :param worker: the name of the worker
+        :param now: the current time, as returned by time.time. Used for testing
+        :return: None
+        """
+        self.__connection.execute('INSERT INTO results (base_url, product_id, status, worker, checked_at) '
+                                  'VALUES (?, ?, ?, ?, ?)',
+                                  (base_url, product_id, status, worker, now if now is not None else time.time()))
+
+    def take_results(self, base_url: str) -> list:
+        """
+        Gets the results reported since the last call, marking them as merged
+        :param base_url: the base url of the scrape
+        :return: the list of the (product_id, status, worker, checked_at) tuples, in the order they were reported
+        """
+        with self.__transaction():
+            rows = self.__connection.execute('SELECT id, product_id, status, worker, checked_at FROM results WHERE '
+                                             'base_url = ? AND merged = 0 ORDER BY id', (base_url,)).fetchall()
+            if rows:
+                self.__connection.execute('UPDATE results SET merged = 1 WHERE base_url = ? AND merged = 0 AND '
+                                          'id <= ?', (base_url, rows[-1][0]))
+        return [row[1:] for row in rows]
+
+    def is_finished(self, base_url: str) -> bool:
+        """
+        :param base_url: the base url of the scrape
+        :return: True if all the chunks of the given base url are done
+        """
+        return self.__connection.execute('SELECT COUNT(*) FROM chunks WHERE base_url = ? AND done = 0',
+                                         (base_url,)).fetchone()[0] == 0
+
+    def progress(self, base_url: str) -> tuple:
+        """
+        :param base_url: the base url of the scrape
+        :return: a tuple with the number of the chunks done and the total number of chunks
+        """
+        return self.__connection.execute('SELECT COALESCE(SUM(done), 0), COUNT(*) FROM chunks WHERE base_url = ?',
+                                         (base_url,)).fetchone()
+
+    async def run(self, method, *args):
+        """
+        Runs the given method of this ScrapeLeases in its own thread, so that the event loop, and the checks running
+        on it, do not wait while the file is locked by another process
+        :param method: the bound method, e.g. scrape_leases.lease
+        :param args: the arguments of the method
+        :return: the result of the method
+        """
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, functools.partial(method, *args))
+
+    def close(self) -> None:
+        self.__executor.shutdown(wait=True)
+        self.__connection.close()
+
+    @contextmanager
+    def __transaction(self):
+        """
+        Runs the wrapped statements in an immediate transaction, which takes the write lock of the file at its start,
+        so that two workers never lease the same chunk
+        """
+        self.__connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield
+        except BaseException:
+            self.__connection.execute('ROLLBACK')
+            raise
+        self.__connection.execute('COMMIT')
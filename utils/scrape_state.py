@@ -0,0 +1,141 @@
+import logging
+import sqlite3
+import time
+
+from utils.product_index import ProductIndex
+
+logger = logging.getLogger('scrape_state')
+
+# What the scrape found for a product id
+NOT_FOUND = 'not_found'
+REDIRECTED_HOME = 'redirected_home'
+NO_MATCH = 'no_match'
+MATCHED = 'matched'
+IN_STOCK = 'in_stock'
+STATUSES = (NOT_FOUND, REDIRECTED_HOME, NO_MATCH, MATCHED, IN_STOCK)
+LIVE_STATUSES = (NO_MATCH, MATCHED, IN_STOCK)
+
+
+class ScrapeState:
+    """
+    SQLite store of the result of every scraped product id, so that a restarted scrape resumes where it stopped and a
+    later sweep skips the ids it already knows, revisiting them only after some time. The ids that could not be
+    obtained are always scraped again. The results are committed in batches
+    """
+
+    def __init__(self, path: str, revisit_home_after: float = 604800, revisit_after: float = 86400,
+                 batch_size: int = 20, frontier_first: bool = False):
+        """
+        :param path: the path of the SQLite file. ':memory:' keeps the state only until it's closed
+        :param revisit_home_after: the seconds after which an id that redirected to the home page is scraped again
+        :param revisit_after: the seconds after which an id whose page exists is scraped again
+        :param batch_size: how many results are committed together
+        :param frontier_first: if True, the due ids are not scraped in order, but as sorted by ProductIndex.prioritize
+        """
+        self.path = path
+        self.revisit_after = {NOT_FOUND: 0, REDIRECTED_HOME: revisit_home_after, NO_MATCH: revisit_after,
+                              MATCHED: revisit_after, IN_STOCK: revisit_after}
+        self.batch_size = max(1, batch_size)
+        self.frontier_first = frontier_first
+        self.__results = {}
+        self.__pending = []
+        self.__connection = sqlite3.connect(path)
+        self.__connection.execute('CREATE TABLE IF NOT EXISTS results (base_url TEXT NOT NULL, '
+                                  'product_id INTEGER NOT NULL, status TEXT NOT NULL, checked_at REAL NOT NULL, '
+                                  'PRIMARY KEY (base_url, product_id))')
+        self.__connection.commit()
+
+    def get(self, base_url: str, product_id: int) -> tuple:
+        """
+        :param base_url: the base url of the scrape
+        :param product_id: the product id
+        :return: a tuple with the last status of the given id and the time it was found, or None if never scraped
+        """
+        return self.__get_results(base_url).get(product_id)
+
+    def is_due(self, base_url: str, product_id: int, now: float = None) -> bool:
+        """
+        Tells whether the given id should be scraped, because it was never scraped or its last result is old enough
+        :param base_url: the base url of the scrape
+        :param product_id: the product id
+        :param now: the current time, as returned by time.time. Used for testing
+        :return: True if it should be scraped
+        """
+        result = self.get(base_url, product_id)
+        if result is None:
+            return True
+        status, checked_at = result
+        return (now if now is not None else time.time()) - checked_at >= self.revisit_after[status]
+
+    def due_product_ids(self, base_url: str, starting_product_id: int, ending_product_id: int):
+        """
+        :param base_url: the base url of the scrape
+        :param starting_product_id: the first product id of the range
+        :param ending_product_id: the last product id of the range, included
+        :return: an iterator of the ids of the range that should be scraped, in order unless frontier_first is set
+        """
+        due_product_ids = (product_id for product_id in range(starting_product_id, ending_product_id + 1)
+                           if self.is_due(base_url, product_id))
+        if self.frontier_first:
+            return iter(self.product_index(base_url).prioritize(due_product_ids))
+        return due_product_ids
+
+    def product_index(self, base_url: str) -> ProductIndex:
+        """
+        :param base_url: the base url of the scrape
+        :return: the ProductIndex of the ids of the given base url found live or dead so far
+        """
+        results = self.__get_results(base_url)
+        return ProductIndex([product_id for product_id, (status, _) in results.items() if status in LIVE_STATUSES],
+                            [product_id for product_id, (status, _) in results.items() if status == REDIRECTED_HOME])
+
+    def record(self, base_url: str, product_id: int, status: str, now: float = None) -> None:
+        """
+        Records what the scrape found for the given id, committing it with the next batch
+        :param base_url: the base url of the scrape
+        :param product_id: the product id
+        :param status: one of STATUSES
+        :param now: the current time, as returned by time.time. Used for testing
+        :return: None
+        """
+        if status not in STATUSES:
+            raise ValueError('Unknown scrape status ' + str(status) + '! The available ones are ' + str(STATUSES))
+        checked_at = now if now is not None else time.time()
+        self.__get_results(base_url)[product_id] = (status, checked_at)
+        self.__pending.append((base_url, product_id, status, checked_at))
+        if len(self.__pending) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Commits the results that are not committed yet
+        :return: None
+        """
+        if not self.__pending:
+            return
+        self.__connection.executemany('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', self.__pending)
+        self.__connection.commit()
+        self.__pending = []
+
+    def close(self) -> None:
+        """
+        Commits the pending results and closes the store
+        :return: None
+        """
+        self.flush()
+        self.__connection.close()
+
+    def __get_results(self, base_url: str) -> dict:
+        """
+        Gets the results of the given base url, loading them from the store the first time
+        :param base_url: the base url of the scrape
+        :return: the dict from product id to (status, checked_at)
+        """
+        results = self.__results.get(base_url)
+        if results is None:
+            rows = self.__connection.execute('SELECT product_id, status, checked_at FROM results WHERE base_url = ?',
+                                             (base_url,))
+            results = self.__results[base_url] = {product_id: (status, checked_at)
+                                                  for product_id, status, checked_at in rows}
+            logger.info('Loaded {} scraped ids of {}'.format(len(results), base_url))
+        return results
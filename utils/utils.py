@@ -13,15 +13,19 @@ url_regex = ("((http|https)://)(www.)?" +
 compiled_regex = re.compile(url_regex)
 
 
-def get_config_section_dic(section: str, config_path: str = './config.cfg') -> dict:
+def get_config_section_dic(section: str, config_path: str = './config.cfg', optional: bool = False) -> dict:
     """
     Gets the configuration from the config.cfg file for the given section and return a dict
     :param section: the section of the configuration to read
     :param config_path: the path to the config file
+    :param optional: if True, a missing section is read as an empty one, so that a config.cfg written before the
+    section existed keeps working with the defaults
     :return: the dict for all key/value pairs for the given section
     """
     config_parser = configparser.RawConfigParser()
     config_parser.read(config_path)
+    if optional and not config_parser.has_section(section):
+        return {}
     return dict(config_parser.items(section))
 
 